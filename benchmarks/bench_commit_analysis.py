@@ -0,0 +1,55 @@
+# benchmarks/bench_commit_analysis.py
+"""
+Бенчмарк векторизованной аналитики коммитов на синтетической таблице.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_commit_analysis --commits 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from core.analyze.commit_analysis import analyze_commit_table, commits_per_author_per_week
+from core.utils.commit_store import CommitTable
+
+
+def make_table(commits, authors, seed=42):
+    """Генерирует таблицу: авторы по закону Ципфа, даты за 10 лет."""
+    rng = np.random.default_rng(seed)
+    author_ids = np.minimum(rng.zipf(1.5, commits) - 1, authors - 1).astype(np.int32)
+    timestamps = np.sort(rng.integers(1_400_000_000, 1_715_000_000, commits)).astype(np.int64)
+    return CommitTable(
+        [f"author_{i}" for i in range(authors)],
+        rng.integers(0, 256, (commits, 20), dtype=np.uint8),
+        author_ids,
+        timestamps,
+        rng.poisson(2, commits).astype(np.int32),
+        rng.poisson(5, commits).astype(np.int32),
+        rng.poisson(1, commits).astype(np.int32),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк аналитики коммитов")
+    parser.add_argument("--commits", type=int, default=1_000_000)
+    parser.add_argument("--authors", type=int, default=5_000)
+    args = parser.parse_args()
+
+    table = make_table(args.commits, args.authors)
+    size_mb = sum(a.nbytes for a in (table.commit_ids, table.author_ids, table.timestamps,
+                                     table.adds, table.edits, table.deletes)) / 2**20
+    print(f"Коммитов: {len(table):,}, авторов: {len(table.authors):,}, размер таблицы: {size_mb:.1f} МБ")
+
+    started = time.perf_counter()
+    result = analyze_commit_table(table)
+    cells = commits_per_author_per_week(table)
+    elapsed = time.perf_counter() - started
+
+    print(f"Аналитика: {elapsed:.3f} с")
+    print(f"  bus factor: {result['bus_factor']}, перцентили churn: {result['churn_percentiles']}")
+    print(f"  ячеек автор×неделя: {len(cells['counts']):,}, недель: {len(result['active_contributors'][0]):,}")
+
+
+if __name__ == "__main__":
+    main()
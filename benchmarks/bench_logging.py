@@ -0,0 +1,50 @@
+# benchmarks/bench_logging.py
+"""
+Бенчмарк записи логов в SQLite: записей в секунду для прежнего обработчика
+(соединение и commit на каждую запись) и пакетного BatchedSQLiteHandler.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_logging --records 100000
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from core.logging.logger import SQLiteHandler, BatchedSQLiteHandler
+
+
+def measure(name, handler, records):
+    """Пишет records записей через handler и печатает записей/с (с учётом полной записи в БД)."""
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"))
+    logger = logging.Logger(f"bench.{name}")
+    logger.addHandler(handler)
+    started = time.perf_counter()
+    for i in range(records):
+        logger.info(f"📄 Запись {i}: обработан файл src/module_{i % 500}.py")
+    emitted = time.perf_counter() - started
+    handler.close()
+    elapsed = time.perf_counter() - started
+
+    with sqlite3.connect(handler.db_path) as conn:
+        (count,) = conn.execute("SELECT COUNT(*) FROM logs").fetchone()
+    assert count == records, f"Записано {count} из {records}"
+    print(f"{name:<32} {records / elapsed:>12,.0f} записей/с   "
+          f"(всего {elapsed:.3f} с, в вызывающем потоке {emitted:.3f} с)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк записи логов в SQLite")
+    parser.add_argument("--records", type=int, default=100000, help="Количество записей лога")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Записей: {args.records}\n")
+        measure("до: SQLiteHandler", SQLiteHandler(os.path.join(tmp, "legacy.db")), args.records)
+        measure("после: BatchedSQLiteHandler", BatchedSQLiteHandler(os.path.join(tmp, "batched.db")), args.records)
+
+
+if __name__ == "__main__":
+    main()
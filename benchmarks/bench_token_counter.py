@@ -0,0 +1,80 @@
+# benchmarks/bench_token_counter.py
+"""
+Микро-бенчмарк подсчёта токенов: файлов в секунду до и после кэширования кодировщика
+и пакетного подсчёта.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_token_counter --files 2000
+"""
+import argparse
+import random
+import time
+
+import tiktoken
+
+from core.utils.token_counter import count_tokens_in_text, count_tokens_in_texts, TOKENIZE_BATCH_SIZE
+
+SAMPLE_LINES = [
+    "def handle_request(request, context=None):",
+    "    # Проверяем права пользователя перед обработкой",
+    "    if not request.user.is_authenticated:",
+    "        return HttpResponse(status=401)",
+    "public class OrderService : IOrderService {",
+    "    private readonly ILogger<OrderService> _logger;",
+    "    /* Пересчёт суммы заказа с учётом скидок */",
+    "    var total = items.Sum(i => i.Price * i.Quantity);",
+    "}",
+]
+
+
+def make_texts(files, lines_per_file, seed=42):
+    """Генерирует синтетические «исходники» для замера."""
+    rng = random.Random(seed)
+    return ["\n".join(rng.choice(SAMPLE_LINES) for _ in range(lines_per_file)) for _ in range(files)]
+
+
+def legacy_count(text, model_encoding="cl100k_base"):
+    """
+    Прежняя реализация: кодировщик запрашивается на каждый вызов. Кодирование то же, что сейчас
+    (encode_ordinary), чтобы замер сравнивал только кэширование кодировщика и пакетный подсчёт.
+    """
+    encoding = tiktoken.get_encoding(model_encoding)
+    return len(encoding.encode_ordinary(text))
+
+
+def measure(name, func, texts):
+    """Замеряет функцию и печатает файлов/с."""
+    started = time.perf_counter()
+    total = func(texts)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<28} {len(texts) / elapsed:>12,.0f} файлов/с   ({elapsed:.3f} с, токенов: {total})")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк подсчёта токенов")
+    parser.add_argument("--files", type=int, default=2000, help="Количество синтетических файлов")
+    parser.add_argument("--lines", type=int, default=200, help="Строк в каждом файле")
+    args = parser.parse_args()
+
+    texts = make_texts(args.files, args.lines)
+    print(f"Файлов: {args.files}, строк в файле: {args.lines}, размер пакета: {TOKENIZE_BATCH_SIZE}\n")
+
+    # Прогрев, чтобы в замер не попала первая загрузка словаря кодировки
+    count_tokens_in_text("warmup")
+
+    legacy = measure("до: get_encoding на вызов", lambda t: sum(legacy_count(x) for x in t), texts)
+    single = measure("после: кэш кодировщика", lambda t: sum(count_tokens_in_text(x) for x in t), texts)
+
+    def batched(t):
+        return sum(
+            sum(count_tokens_in_texts(t[i:i + TOKENIZE_BATCH_SIZE]))
+            for i in range(0, len(t), TOKENIZE_BATCH_SIZE)
+        )
+
+    batch = measure("после: пакетный подсчёт", batched, texts)
+    assert legacy == single == batch, "Результаты подсчёта токенов расходятся"
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,19 @@
 
 import os
 from datetime import datetime
-from core.ai.code_advisor import query_openai
+from core.ai.code_advisor import OPENAI_MODEL, query_openai
+from core.utils.ai_cache import get_ai_cache, response_key
 from core.utils.token_counter import count_tokens_in_text
 from core.logging.logger import log
+from core.logging.metrics import span, timed
 
 REPORTS_DIR = "ai_reports"
 
+@timed("ai_report")
 def generate_ai_report(project_name, repository_name, folder_name, file_name, file_content):
     """
     Генерирует ИИ-отчёт по коду файла.
+    Ответ OpenAI на тот же промпт берётся из кэша ответов (core.utils.ai_cache), если он там есть.
     """
     lines = file_content.split("\n")
     num_lines = len(lines)
@@ -28,9 +32,19 @@ def generate_ai_report(project_name, repository_name, folder_name, file_name, fi
     4. Насколько сложен этот код (1-10)?
     """.strip()
     
-    log(f"🔍 Отправка запроса в OpenAI для файла {file_name}")
-    analysis = query_openai(prompt)
-    
+    ai_cache = get_ai_cache()
+    cache_key = response_key(OPENAI_MODEL, prompt)
+    analysis = ai_cache.get(cache_key)
+    if analysis is not None:
+        log(f"♻ Анализ файла {file_name} взят из кэша ответов OpenAI")
+    else:
+        log(f"🔍 Отправка запроса в OpenAI для файла {file_name}")
+        with span("openai", api_call=True) as s:
+            analysis = query_openai(prompt)
+            s.bytes = len((analysis or "").encode("utf-8"))
+        if analysis:
+            ai_cache.put(cache_key, OPENAI_MODEL, analysis)
+
     if analysis:
         log(f"📄 Получен анализ от OpenAI для файла {file_name}")
     else:
@@ -85,6 +99,14 @@ def generate_deep_report_for_repo(project_name, repository_name, files_data):
         except Exception as e:
             log(f"❌ Ошибка генерации ИИ‑отчёта для файла {file_name}: {e}", level="ERROR")
     
+    return write_aggregated_deep_report(project_name, repository_name, deep_report_paths)
+
+def write_aggregated_deep_report(project_name, repository_name, deep_report_paths):
+    """
+    Записывает агрегированный отчёт глубокого анализа по уже созданным ИИ‑отчётам файлов
+    и выводит его в консоль. Если отчётов нет, записывается сообщение об отсутствии файлов.
+    Возвращает абсолютный путь к агрегированному отчёту.
+    """
     aggregated_dir = os.path.join(REPORTS_DIR, project_name, repository_name)
     os.makedirs(aggregated_dir, exist_ok=True)
     aggregated_report_path = os.path.join(aggregated_dir, "aggregated_deep_report.txt")
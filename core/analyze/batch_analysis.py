@@ -1,52 +1,130 @@
 # core/analyze/batch_analysis.py
+import itertools
 import json
+import os
+import time
 from core.analyze.repository_analysis import analyze_repository
 from core.reports.summary import generate_summary
+from core.reports.artifacts import write_run_manifest
 from core.logging.logger import log
-from core.utils.cache import is_repo_changed
+from core.utils.cache import is_repo_changed, load_project_heads, load_repo_totals
+from core.azure.repo_commits import get_head_commits
+from core.azure.connection import get_connection_stats
+from core.logging import metrics
+from core.utils.concurrency import ordered_bounded_map
+from core.utils import checkpoints, cache_manager
+from core.utils.file_metrics import spill_file_metrics
+from core.analyze import scheduling, pipeline
 
-def analyze_all_repositories(project_name, repositories, analysis_mode="fast"):
+# Сколько репозиториев анализируется одновременно (1 — по очереди)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "1"))
+
+# Как выполнять анализ: "pool" — репозиторий целиком на одном потоке, "pipeline" — конвейер этапов
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "pool")
+
+def analyze_all_repositories(project_name, repositories, analysis_mode="fast", workers=None, policy=None,
+                             executor=None, run_id=None, worker_pool=None):
     """
     Анализирует все репозитории в проекте с учетом выбранного типа анализа.
     Выводит сообщения о том, откуда берутся данные (из кэша или анализ с нуля).
+    workers — сколько репозиториев анализировать одновременно (по умолчанию ANALYSIS_WORKERS).
+    При параллельном анализе вывод каждого репозитория печатается одним блоком
+    в порядке запуска; ошибка в одном репозитории не прерывает остальные.
+    Порядок запуска задаёт политика планирования policy (по умолчанию scheduling.SCHEDULING_POLICY —
+    сначала самые долгие по оценке из кэша); сводный отчёт строится в исходном порядке.
+    executor="pipeline" (по умолчанию ANALYSIS_EXECUTOR) — быстрый анализ конвейером этапов
+    (см. core.analyze.pipeline); блоки вывода идут в порядке готовности репозиториев.
+    Ход запуска сохраняется в контрольных точках (core.utils.checkpoints): повторный вызов
+    с тем же run_id пропускает завершённые репозитории и продолжает незаконченные с места остановки.
+    worker_pool — общий пул потоков (например, для нескольких проектов одного задания);
+    размер пула тогда задаёт он, а workers — только окно задач проекта.
+    Отчёты запуска (созданные и взятые из хранилища отчётов) перечисляются в манифесте запуска
+    (core.reports.artifacts.write_run_manifest).
+    Возвращает {"run_id", "results", "summary_path"}.
     """
+    workers = max(1, workers or ANALYSIS_WORKERS)
+    use_pipeline = (executor or ANALYSIS_EXECUTOR) == "pipeline" and analysis_mode == "fast"
     repositories_count = len(repositories)
-    log(f"📊 Начат анализ всех репозиториев проекта {project_name}...")
+    run_id = metrics.start_run(run_id)
+    cache_counters = cache_manager.counters()
+    store = checkpoints.get_checkpoint_store()
+    completed = store.completed_repositories(run_id) if store.begin_run(run_id, project_name, analysis_mode) else {}
+    log(f"📊 Начат анализ всех репозиториев проекта {project_name} (запуск {run_id})...")
 
     print()
     print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
     print(f"🔎 Старт анализа: проект «{project_name}», репозиториев: {repositories_count}")
+    print(f"🆔 Запуск {run_id}" + (f": продолжение, уже завершено {len(completed)}" if completed else ""))
     print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
 
-    repository_results = []
+    # Репозитории, завершённые в прерванном запуске, повторно не анализируются
+    finished = [
+        (completed[repository.name], [f"♻ {repository.name} уже проанализирован в запуске {run_id}"])
+        for repository in repositories if repository.name in completed
+    ]
+    repositories_to_run = [repository for repository in repositories if repository.name not in completed]
 
-    for i, repository in enumerate(repositories, start=1):
-        repository_name = repository.name
-        repo_changed = is_repo_changed(project_name, repository_name)
+    # Предварительный проход: head-коммиты всех репозиториев сверяем с сохранёнными в кэше.
+    # Совпавшие репозитории считаются неизменёнными без обхода списка их файлов.
+    head_commits = get_head_commits(project_name, repositories)
+    cached_heads = load_project_heads(project_name)
+    unchanged_count = sum(
+        1 for name, head in head_commits.items() if head and cached_heads.get(name) == head
+    )
+    log(f"📌 Head-коммиты не изменились у {unchanged_count} из {repositories_count} репозиториев")
 
-        if analysis_mode == "fast":
-            if not repo_changed:
-                print(f"{repository_name} взят из кэша")
-            else:
-                print(f"🔍 Идёт анализ {repository_name}...")
+    durations = {}
+
+    def run_buffered(repository):
+        lines = []
+        started = time.perf_counter()
+        result = analyze_single(project_name, repository, analysis_mode, head_commits, cached_heads, lines.append,
+                                run_id)
+        durations[repository.name] = time.perf_counter() - started
+        return result, lines
+
+    estimates = None
+    if workers == 1 and not use_pipeline and worker_pool is None:
+        outcomes = (
+            (analyze_single(project_name, repository, analysis_mode, head_commits, cached_heads, print, run_id), [])
+            for repository in repositories_to_run
+        )
+    else:
+        unchanged = {name for name, head in head_commits.items() if head and cached_heads.get(name) == head}
+        estimates = scheduling.estimate_costs(project_name, repositories_to_run, unchanged)
+        ordered = scheduling.plan(repositories_to_run, estimates, policy)
+        if use_pipeline:
+            log(f"🏭 Конвейерный анализ, порядок запуска: {policy or scheduling.SCHEDULING_POLICY}")
+            outcomes = pipeline_outcomes(project_name, ordered, head_commits, unchanged, run_id,
+                                         worker_pool=worker_pool, workers=workers, durations=durations)
         else:
-            # При глубоком анализе всегда выполняем полный анализ
-            print(f"🔍 Идёт глубокий анализ {repository_name}...")
+            log(f"⚙ Параллельный анализ: {workers} репозиториев одновременно, "
+                f"порядок запуска: {policy or scheduling.SCHEDULING_POLICY}")
+            outcomes = ordered_bounded_map(run_buffered, ordered, workers, window=workers * 4, executor=worker_pool)
 
-        result = analyze_repository(project_name, repository, repo_changed, analysis_mode)
+    wall_started = time.perf_counter()
+    results_by_name = {}
+    for i, (result, lines) in enumerate(itertools.chain(finished, outcomes), start=1):
+        # Блок вывода репозитория печатается целиком, когда он готов и все предыдущие уже выведены
+        for line in lines:
+            print(line)
         if result:
-            tokens_str = f"{result['tokens']:,}".replace(",", " ")
-            print(f"💠 Анализ {repository_name} завершён, количество токенов: {tokens_str}")
-            report_path = result.get("report_path")
-            if report_path:
-                print(f"📄 Отчёт анализа {repository_name} сохранён: {report_path}")
-            repository_results.append(result)
-        else:
-            print(f"⚠ Анализ не дал результатов для {repository_name}")
+            results_by_name[result["repository"]] = spill_result_files(project_name, result)
 
         progress_percent = int((i / repositories_count) * 100)
-        print(f"📈 Прогресс анализа проекта «{project_name}»: {progress_percent}%\n")
+        print(f"📈 Прогресс анализа проекта «{project_name}»: {progress_percent}%\n", flush=True)
+
+    if estimates is not None:
+        scheduling.log_plan_accuracy(
+            [repository.name for repository in ordered], estimates, durations, workers,
+            time.perf_counter() - wall_started
+        )
 
+    repository_results = [
+        results_by_name[repository.name] for repository in repositories if repository.name in results_by_name
+    ]
+
+    summary_path = None
     if repository_results:
         summary_path = generate_summary(project_name, repository_results)
         if summary_path:
@@ -55,5 +133,165 @@ def analyze_all_repositories(project_name, repositories, analysis_mode="fast"):
     else:
         log("⚠ Не удалось создать сводный отчёт: нет обработанных репозиториев.", level="WARNING")
 
+    try:
+        write_run_manifest(project_name, run_id, repository_results, summary_path)
+    except Exception as e:
+        log(f"⚠ Не удалось сохранить манифест запуска: {e}", level="WARNING")
+
+    stats = get_connection_stats()
+    log(f"🔌 Соединения Azure DevOps: открыто HTTP-соединений {stats['http_connections']}, "
+        f"запросов {stats['http_requests']}, из них по открытому соединению {stats['reused']}")
+
+    try:
+        cache_manager.prune()
+    except Exception as e:
+        log(f"⚠ Не удалось освободить кэш: {e}", level="WARNING")
+    metrics.flush()
+    print_run_metrics(run_id, cache_manager.counters_since(cache_counters))
+    metrics.finish_run(run_id)
+    store.finish_run(run_id)
+
     log(f"✅ Анализ всех репозиториев проекта {project_name} завершён!")
     print(f"✅ Анализ всех репозиториев проекта «{project_name}» завершён!")
+    return {"run_id": run_id, "results": repository_results, "summary_path": summary_path}
+
+def spill_result_files(project_name, result):
+    """
+    До сводного отчёта метрики файлов репозитория хранятся в файле (core.utils.file_metrics)
+    и читаются через mmap, а не держатся в памяти процесса. При ошибке записи остаются в памяти.
+    """
+    if result.get("files") is None:
+        return result
+    try:
+        result["files"] = spill_file_metrics(project_name, result["repository"], result["files"])
+    except Exception as e:
+        log(f"⚠ Не удалось сохранить метрики файлов {result['repository']}: {e}", level="WARNING")
+    return result
+
+def analyze_single(project_name, repository, analysis_mode, head_commits, cached_heads, say, run_id=None):
+    """
+    Анализирует один репозиторий в рамках пакетного запуска.
+    say — куда выводить строки прогресса (print или буфер при параллельном анализе).
+    run_id — запуск, в контрольных точках которого отмечается ход анализа и его завершение.
+    Исключения не выходят наружу: репозиторий с ошибкой пропускается. Возвращает результат или None.
+    """
+    repository_name = repository.name
+    checkpoint = None
+    if run_id:
+        checkpoint = checkpoints.RepoCheckpoint(checkpoints.get_checkpoint_store(), run_id, repository_name)
+    try:
+        head_commit = head_commits.get(repository_name)
+        cached_commit = None
+        if head_commit and cached_heads.get(repository_name) != head_commit and analysis_mode == "fast":
+            cached_commit = _cached_commit(project_name, repository_name)
+        if head_commit and cached_heads.get(repository_name) == head_commit:
+            repo_changed = False
+        elif cached_commit:
+            # Head сдвинулся, а в кэше есть проанализированный коммит: без обхода списка файлов
+            # анализ сразу идёт по diff (analyze_repository_incremental) — один запрос diff
+            # и загрузка только изменённых файлов
+            repo_changed = cached_commit != head_commit
+        else:
+            repo_changed = is_repo_changed(project_name, repository_name)
+
+        if analysis_mode == "fast":
+            if not repo_changed:
+                say(f"{repository_name} взят из кэша")
+            else:
+                say(f"🔍 Идёт анализ {repository_name}...")
+        else:
+            # При глубоком анализе всегда выполняем полный анализ
+            say(f"🔍 Идёт глубокий анализ {repository_name}...")
+
+        if checkpoint and checkpoint.files:
+            say(f"♻ Продолжение анализа {repository_name}: в контрольной точке {len(checkpoint.files)} файлов")
+        result = analyze_repository(project_name, repository, repo_changed, analysis_mode, head_commit,
+                                    checkpoint=checkpoint)
+    except Exception as e:
+        log(f"❌ Ошибка анализа репозитория {repository_name}: {e}", level="ERROR")
+        say(f"❌ Анализ {repository_name} завершился с ошибкой: {e}")
+        return None
+
+    if result:
+        if checkpoint:
+            checkpoint.store.mark_repository_done(run_id, result)
+        tokens_str = f"{result['tokens']:,}".replace(",", " ")
+        say(f"💠 Анализ {repository_name} завершён, количество токенов: {tokens_str}")
+        report_path = result.get("report_path")
+        if report_path:
+            say(f"📄 Отчёт анализа {repository_name} сохранён: {report_path}")
+    else:
+        say(f"⚠ Анализ не дал результатов для {repository_name}")
+    return result
+
+def _cached_commit(project_name, repository_name):
+    """Коммит, на котором репозиторий проанализирован в кэше, или None."""
+    totals = load_repo_totals(project_name, repository_name)
+    return totals.get("commit_id") if totals else None
+
+def pipeline_outcomes(project_name, repositories, head_commits, unchanged, run_id=None, worker_pool=None,
+                      workers=None, durations=None):
+    """
+    Прогоняет репозитории через конвейер и отдаёт (результат, строки вывода) по мере готовности.
+    Репозитории с неизменившимся head идут сразу на отчёт по кэшу; у остальных
+    неизменившиеся файлы отбираются по objectId на этапе листинга.
+    Посчитанные файлы и завершённые репозитории отмечаются в контрольных точках запуска run_id.
+    worker_pool — общий пул: этапы конвейера выполняются на нём, а потоков загрузки у проекта
+    не больше workers.
+    durations — словарь {репозиторий: время работы этапов над ним, с} для сверки плана с фактом.
+    """
+    # Задания создаются по мере того, как конвейер готов их принять
+    jobs = (
+        pipeline.make_job(project_name, repository, repository.name not in unchanged,
+                          head_commits.get(repository.name), run_id)
+        for repository in repositories
+    )
+    repository_pipeline = None
+    if worker_pool is not None:
+        repository_pipeline = pipeline.make_repository_pipeline(
+            fetch_workers=min(workers or pipeline.PIPELINE_FETCH_WORKERS, pipeline.PIPELINE_FETCH_WORKERS),
+            executor=worker_pool,
+        )
+    for job in pipeline.run_pipeline(jobs, repository_pipeline):
+        repository_name = job["repository"].name
+        if durations is not None:
+            durations[repository_name] = job.get("elapsed", 0.0)
+        result = pipeline.job_result(job)
+        if result is None:
+            yield None, [f"❌ Анализ {repository_name} завершился с ошибкой: {job.get('error')}"]
+            continue
+        if run_id:
+            checkpoints.get_checkpoint_store().mark_repository_done(run_id, result)
+        lines = [f"{repository_name} взят из кэша" if result["cached"] else f"🔍 Проанализирован {repository_name}"]
+        tokens_str = f"{result['tokens']:,}".replace(",", " ")
+        lines.append(f"💠 Анализ {repository_name} завершён, количество токенов: {tokens_str}")
+        lines.append(f"📄 Отчёт анализа {repository_name} сохранён: {result['report_path']}")
+        yield result, lines
+
+def print_run_metrics(run_id, cache_counters=None):
+    """
+    Печатает сводку запуска по этапам (p50/p95, байты, вызовы API), итоги по репозиториям
+    и попадания, промахи и вытеснения по областям кэша (cache_counters — cache_manager.counters_since()).
+    """
+    if cache_counters:
+        log("💾 Кэш за запуск: " + "; ".join(
+            f"{name}: попаданий {c['hits']}, промахов {c['misses']}, вытеснено {c['evictions']}"
+            for name, c in cache_counters.items()
+        ))
+        print()
+        print(f"💾 Кэш за запуск {run_id}:")
+        print(cache_manager.format_counters(cache_counters))
+    stages = metrics.run_rollup(run_id=run_id)
+    if not stages:
+        return
+    print()
+    print(f"⏱ Метрики запуска {run_id}:")
+    print(metrics.format_rollup(stages))
+
+    totals = metrics.repository_totals(run_id)
+    if totals:
+        print()
+        print(f"{'Репозиторий':<40} {'время, с':>10} {'скачано':>12} {'API':>6}")
+        for repository_name, t in sorted(totals.items(), key=lambda item: item[1]["duration"], reverse=True):
+            print(f"{repository_name:<40} {t['duration']:>10.2f} {metrics.format_bytes(t['bytes']):>12} {t['api_calls']:>6}")
+    print()
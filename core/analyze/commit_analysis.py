@@ -1,21 +1,124 @@
 from collections import Counter
+import numpy as np
 from core.logging.logger import log
 
 def analyze_commits(commits):
     """
-    Анализ списка коммитов.
+    Анализ коммитов.
+    commits — итерируемый набор записей из локального хранилища (dict) или объектов SDK;
+    обрабатывается потоково, без загрузки всей истории в память.
     Возвращает количество коммитов и самых активных авторов.
     """
-    if not commits:
+    authors = Counter()
+    total_commits = 0
+    for commit in commits:
+        total_commits += 1
+        if isinstance(commit, dict):
+            author = commit.get("author")
+        else:
+            author = commit.author.name if commit.author else None
+        if author:
+            authors[author] += 1
+
+    if not total_commits:
         log("Коммиты отсутствуют. Анализ невозможен.", level="WARNING")
         return {"total_commits": 0, "top_authors": []}
 
-    authors = [commit.author.name for commit in commits if commit.author]
-    total_commits = len(commits)
-    top_authors = Counter(authors).most_common(5)  # Топ-5 авторов
+    top_authors = authors.most_common(5)  # Топ-5 авторов
 
     log(f"Анализ коммитов завершён: всего {total_commits}, топ-5 авторов: {top_authors}")
     return {
         "total_commits": total_commits,
         "top_authors": top_authors
     }
+
+# Границы недель считаются от эпохи Unix (по 7 суток)
+WEEK_SECONDS = 7 * 24 * 3600
+
+def _week_numbers(table):
+    """Номер недели от эпохи для каждого коммита."""
+    return table.timestamps // WEEK_SECONDS
+
+def commits_per_author_per_week(table):
+    """
+    Коммиты каждого автора по неделям в разреженном виде (только ненулевые ячейки).
+    Возвращает {"author_ids", "weeks", "counts"} — массивы одинаковой длины;
+    weeks — номера недель от эпохи (неделя начинается в weeks * WEEK_SECONDS).
+    """
+    if not len(table):
+        empty = np.empty(0, dtype=np.int64)
+        return {"author_ids": empty, "weeks": empty, "counts": empty}
+    weeks = _week_numbers(table)
+    first_week = weeks.min()
+    span = int(weeks.max() - first_week) + 1
+    keys = table.author_ids.astype(np.int64) * span + (weeks - first_week)
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    return {
+        "author_ids": unique_keys // span,
+        "weeks": unique_keys % span + first_week,
+        "counts": counts,
+    }
+
+def active_contributors_over_time(table):
+    """
+    Число разных авторов, делавших коммиты, по неделям.
+    Возвращает (weeks, counts): номера недель от эпохи без пропусков и количество активных авторов.
+    """
+    cells = commits_per_author_per_week(table)
+    if not len(cells["weeks"]):
+        return cells["weeks"], cells["counts"]
+    first_week = cells["weeks"].min()
+    counts = np.bincount(cells["weeks"] - first_week)
+    return np.arange(first_week, first_week + len(counts)), counts
+
+def bus_factor(table, threshold=0.5, by="commits"):
+    """
+    Минимальное число авторов, на которых приходится не меньше threshold всей работы.
+    by: "commits" — доля коммитов, "churn" — доля изменённых файлов (adds + edits + deletes).
+    """
+    if not len(table):
+        return 0
+    weights = _churn(table) if by == "churn" else None
+    per_author = np.bincount(table.author_ids, weights=weights, minlength=len(table.authors))
+    shares = np.cumsum(np.sort(per_author)[::-1]) / per_author.sum()
+    return int(np.searchsorted(shares, threshold) + 1)
+
+def churn_percentiles(table, percentiles=(50, 90, 99)):
+    """
+    Перцентили churn на коммит (количество добавленных, изменённых и удалённых файлов).
+    Возвращает {перцентиль: значение}.
+    """
+    if not len(table):
+        return {p: 0.0 for p in percentiles}
+    values = np.percentile(_churn(table), percentiles)
+    return {p: float(v) for p, v in zip(percentiles, values)}
+
+def _churn(table):
+    return table.adds.astype(np.int64) + table.edits + table.deletes
+
+def analyze_commit_table(table, top=5):
+    """
+    Векторизованная аналитика по колоночной таблице коммитов (см. core.utils.commit_store).
+    Возвращает сводку: общее число коммитов, топ авторов, bus factor,
+    перцентили churn и число активных авторов по неделям.
+    """
+    if not len(table):
+        log("Коммиты отсутствуют. Анализ невозможен.", level="WARNING")
+        return {"total_commits": 0, "top_authors": [], "bus_factor": 0,
+                "churn_percentiles": churn_percentiles(table), "active_contributors": ([], [])}
+
+    per_author = np.bincount(table.author_ids, minlength=len(table.authors))
+    top_ids = np.argsort(per_author)[::-1][:top]
+    top_authors = [(table.authors[i] or "Неизвестный автор", int(per_author[i])) for i in top_ids]
+    weeks, active = active_contributors_over_time(table)
+
+    result = {
+        "total_commits": len(table),
+        "top_authors": top_authors,
+        "bus_factor": bus_factor(table),
+        "churn_percentiles": churn_percentiles(table),
+        "active_contributors": (weeks, active),
+    }
+    log(f"Анализ коммитов завершён: всего {len(table)}, топ-{top} авторов: {top_authors}, "
+        f"bus factor: {result['bus_factor']}")
+    return result
@@ -0,0 +1,226 @@
+# core/analyze/jobs.py
+"""
+Пакетные задания без диалога с пользователем (main.py --job <файл> или --project <имя>).
+
+Задание описывается файлом JSON или YAML (для YAML нужен PyYAML):
+
+    {
+        "mode": "fast",               # fast | deep
+        "workers": 8,                 # размер общего пула потоков
+        "executor": "pool",           # pool | pipeline
+        "policy": "lpt",              # политика планирования (core.analyze.scheduling)
+        "clear_cache": false,         # очистить кэш проекта перед анализом
+        "output": "reports/job.json", # куда записать итоги задания (необязательно)
+        "projects": [
+            "ProjectA",
+            {"name": "Platform*", "include": ["api-*"], "exclude": ["*-legacy"], "mode": "deep"}
+        ]
+    }
+
+Имена проектов и шаблоны include/exclude — glob (fnmatch). mode, workers, executor,
+policy и clear_cache можно переопределить у отдельного проекта.
+Проекты обрабатываются одновременно (до JOB_PROJECT_WORKERS), а их репозитории — на одном
+общем пуле потоков: пока один проект ждёт последние репозитории, пул занят репозиториями
+других проектов. Клиенты Azure DevOps и пул HTTP-соединений общие для всего процесса,
+метрики и контрольные точки у каждого проекта свои (запуск "<run_id>:<проект>").
+"""
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from core.analyze.batch_analysis import analyze_all_repositories, ANALYSIS_WORKERS
+from core.azure.projects import get_projects
+from core.azure.repos import get_repositories
+from core.logging.logger import log
+from core.reports.report_formatter import summarize_repository
+from core.utils.atomic_io import atomic_write
+from core.utils.cache import clear_project_summary_cache
+
+ANALYSIS_MODES = ("fast", "deep")
+EXECUTORS = ("pool", "pipeline")
+# Сколько проектов задания анализируется одновременно (их репозитории делят общий пул)
+JOB_PROJECT_WORKERS = int(os.getenv("JOB_PROJECT_WORKERS", "4"))
+
+PROJECT_OPTIONS = ("mode", "workers", "executor", "policy", "clear_cache")
+JOB_OPTIONS = PROJECT_OPTIONS + ("projects", "output")
+
+
+def load_job_spec(path):
+    """Читает файл задания: .yaml/.yml — через PyYAML, остальное — как JSON."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("Для заданий в YAML установите PyYAML (pip install pyyaml) или используйте JSON")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    return validate_job_spec(spec)
+
+
+def validate_job_spec(spec):
+    """
+    Проверяет задание и приводит его к полному виду: каждый проект — словарь
+    {"name", "include", "exclude", "mode", "workers", "executor", "policy", "clear_cache"}
+    с унаследованными от задания значениями. Ошибки описания — ValueError.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("Задание должно быть объектом с полем projects")
+    unknown = set(spec) - set(JOB_OPTIONS)
+    if unknown:
+        raise ValueError(f"Неизвестные поля задания: {', '.join(sorted(unknown))}")
+    projects = spec.get("projects")
+    if not projects or not isinstance(projects, list):
+        raise ValueError("В задании нет списка projects")
+
+    defaults = {
+        "mode": spec.get("mode", "fast"),
+        "workers": spec.get("workers", ANALYSIS_WORKERS),
+        "executor": spec.get("executor"),
+        "policy": spec.get("policy"),
+        "clear_cache": spec.get("clear_cache", False),
+    }
+    normalized = []
+    for entry in projects:
+        if isinstance(entry, str):
+            entry = {"name": entry}
+        if not isinstance(entry, dict) or not entry.get("name"):
+            raise ValueError(f"У проекта в задании нет имени: {entry!r}")
+        unknown = set(entry) - set(PROJECT_OPTIONS) - {"name", "include", "exclude"}
+        if unknown:
+            raise ValueError(f"Неизвестные поля проекта {entry['name']}: {', '.join(sorted(unknown))}")
+        project = dict(defaults)
+        project.update(entry)
+        for key in ("include", "exclude"):
+            patterns = project.get(key) or []
+            project[key] = [patterns] if isinstance(patterns, str) else list(patterns)
+        if project["mode"] not in ANALYSIS_MODES:
+            raise ValueError(f"Неизвестный тип анализа {project['mode']} у проекта {project['name']}")
+        if project["executor"] not in (None,) + EXECUTORS:
+            raise ValueError(f"Неизвестный исполнитель {project['executor']} у проекта {project['name']}")
+        if not isinstance(project["workers"], int) or project["workers"] < 1:
+            raise ValueError(f"workers у проекта {project['name']} должно быть положительным числом")
+        normalized.append(project)
+
+    return {"projects": normalized, "output": spec.get("output"),
+            "workers": max(project["workers"] for project in normalized)}
+
+
+def select_names(names, include=(), exclude=()):
+    """Имена, подходящие под любой шаблон include (все, если include пуст) и ни под один exclude."""
+    return [
+        name for name in names
+        if (not include or any(fnmatchcase(name, pattern) for pattern in include))
+        and not any(fnmatchcase(name, pattern) for pattern in exclude)
+    ]
+
+
+def resolve_projects(job):
+    """
+    Раскрывает шаблоны имён проектов по списку проектов организации.
+    Возвращает [(имя проекта, настройки)]; проект, подходящий под несколько записей,
+    берёт настройки первой.
+    """
+    available = None
+    resolved = {}
+    for project in job["projects"]:
+        pattern = project["name"]
+        if any(ch in pattern for ch in "*?["):
+            if available is None:
+                available = get_projects()
+            names = select_names(available, [pattern])
+            if not names:
+                log(f"⚠ Под шаблон {pattern} не подошёл ни один проект", level="WARNING")
+        else:
+            names = [pattern]
+        for name in names:
+            resolved.setdefault(name, project)
+    return list(resolved.items())
+
+
+def run_job(job, run_id=None):
+    """
+    Выполняет задание: проекты анализируются одновременно (каждый — отдельной задачей,
+    не больше JOB_PROJECT_WORKERS), их репозитории — на общем пуле потоков.
+    run_id — продолжить прерванное задание (у каждого проекта свой запуск "<run_id>:<проект>"
+    в контрольных точках). Итоги проектов идут в порядке задания.
+    Возвращает итоги: {"run_id", "projects": [{"project", "run_id", "status", "summary_path", "repositories"}]}.
+    """
+    run_id = run_id or time.strftime("job-%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    log(f"🗂 Задание {run_id}: {len(job['projects'])} записей проектов, пул на {job['workers']} потоков")
+    print(f"🗂 Задание {run_id}", flush=True)
+
+    projects = resolve_projects(job)
+    outcome = {"run_id": run_id, "projects": []}
+    with ThreadPoolExecutor(max_workers=job["workers"], thread_name_prefix="job") as pool, \
+            ThreadPoolExecutor(max_workers=max(1, min(JOB_PROJECT_WORKERS, len(projects))),
+                               thread_name_prefix="job-project") as project_pool:
+        futures = [
+            project_pool.submit(_run_project, project_name, settings, f"{run_id}:{project_name}", pool)
+            for project_name, settings in projects
+        ]
+        outcome["projects"] = [future.result() for future in futures]
+
+    if job.get("output"):
+        write_job_output(job["output"], outcome)
+    failed = [p["project"] for p in outcome["projects"] if p["status"] != "ok"]
+    if failed:
+        log(f"⚠ Задание {run_id}: проекты с ошибками: {', '.join(failed)}", level="WARNING")
+    else:
+        log(f"✅ Задание {run_id} выполнено")
+    return outcome
+
+
+def _run_project(project_name, settings, project_run_id, pool):
+    """Анализ одного проекта задания; ошибка проекта не прерывает остальные."""
+    entry = {"project": project_name, "run_id": project_run_id, "status": "ok", "summary_path": None,
+             "repositories": []}
+    try:
+        repositories = get_repositories(project_name)
+        names = set(select_names([repository.name for repository in repositories],
+                                 settings["include"], settings["exclude"]))
+        selected = [repository for repository in repositories if repository.name in names]
+        if not selected:
+            log(f"⚠ В проекте {project_name} нет репозиториев под фильтр задания", level="WARNING")
+            entry["status"] = "empty"
+            return entry
+        if settings["clear_cache"]:
+            clear_project_summary_cache(project_name)
+
+        outcome = analyze_all_repositories(
+            project_name, selected, settings["mode"], settings["workers"], policy=settings["policy"],
+            executor=settings["executor"], run_id=project_run_id, worker_pool=pool
+        )
+        entry["summary_path"] = outcome["summary_path"]
+        entry["repositories"] = [
+            {
+                "repository": result["repository"],
+                "cached": result.get("cached", False),
+                "report_path": result.get("report_path"),
+                **summarize_repository(result),
+            }
+            for result in outcome["results"]
+        ]
+        if len(outcome["results"]) < len(selected):
+            entry["status"] = "partial"
+    except Exception as e:
+        log(f"❌ Ошибка анализа проекта {project_name}: {e}", level="ERROR")
+        entry["status"] = "failed"
+        entry["error"] = str(e)
+    return entry
+
+
+def write_job_output(path, outcome):
+    """
+    Записывает итоги задания в JSON. Файл подменяется атомарно: планировщик, читающий итоги,
+    не увидит недописанный файл.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with atomic_write(path) as f:
+        json.dump(outcome, f, ensure_ascii=False, indent=4)
+    log(f"📄 Итоги задания сохранены: {path}")
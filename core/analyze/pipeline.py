@@ -0,0 +1,319 @@
+# core/analyze/pipeline.py
+"""
+Конвейерный анализ репозиториев: листинг → загрузка → декодирование и метрики →
+запись кэша → отчёт. Каждый этап работает в своих потоках и передаёт репозитории
+следующему через ограниченную очередь, поэтому, пока один репозиторий считается,
+следующий уже скачивается, а в каждой очереди лежит не больше PIPELINE_QUEUE_SIZE
+репозиториев (backpressure). Задания создаются лениво, кэш репозитория читается на этапе
+листинга, а загруженное содержимое до подсчёта метрик хранится во временных файлах на диске,
+поэтому память процесса не растёт с размером репозиториев в очередях.
+Задание с run_id ведёт пофайловую контрольную точку (core.utils.checkpoints.RepoCheckpoint):
+посчитанные файлы сохраняются на этапе метрик, а при продолжении прерванного запуска
+файлы из неё с тем же objectId не загружаются заново.
+
+Этапы построены на тех же функциях, что и последовательный анализ:
+plan_repo_fetch / fetch_repo_files / count_fetched_files (token_counter),
+save_repo_data_to_cache (cache) и generate_report (reports/generate); отчёт, уже созданный
+для того же состояния репозитория, берётся из хранилища отчётов (reports/artifacts).
+"""
+import contextvars
+import os
+import queue
+import threading
+import time
+from core.logging.logger import log
+from core.logging.metrics import span
+from core.reports.generate import generate_report
+from core.reports.artifacts import report_key, report_for_state
+from core.utils import checkpoints
+from core.utils.cache import load_repo_data_from_cache, save_repo_data_to_cache, save_project_head
+from core.utils.file_metrics import FileMetrics
+from core.utils.token_counter import plan_repo_fetch, fetch_repo_files, count_fetched_files
+
+# Ёмкость очереди между этапами
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+# Потоков на этапе загрузки (остальные этапы — по одному потоку)
+PIPELINE_FETCH_WORKERS = int(os.getenv("PIPELINE_FETCH_WORKERS", "4"))
+
+_DONE = object()
+
+
+class Stage:
+    """Этап конвейера: func(job) -> job выполняется на workers потоках."""
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.depth_max = 0
+        self._lock = threading.Lock()
+
+    def observe_depth(self, depth):
+        with self._lock:
+            self.depth_samples += 1
+            self.depth_total += depth
+            self.depth_max = max(self.depth_max, depth)
+
+    def account(self, elapsed, failed):
+        with self._lock:
+            self.processed += 1
+            self.failed += 1 if failed else 0
+            self.busy += elapsed
+
+    def stats(self, wall_time):
+        """Счётчики этапа: обработано, ошибок, загрузка потоков, пропускная способность, глубина входной очереди."""
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "failed": self.failed,
+                "busy": self.busy,
+                "utilization": self.busy / (wall_time * self.workers) if wall_time else 0.0,
+                "throughput": self.processed / wall_time if wall_time else 0.0,
+                "queue_avg": self.depth_total / self.depth_samples if self.depth_samples else 0.0,
+                "queue_max": self.depth_max,
+            }
+
+
+class Pipeline:
+    """
+    Цепочка этапов с ограниченными очередями между ними.
+    Задание, на котором этап упал, получает job["error"] и проходит остальные этапы без обработки.
+    В job["elapsed"] накапливается время работы этапов над заданием (без ожидания в очередях).
+    executor — общий пул потоков (например, задания на несколько проектов): работа этапов выполняется
+    на нём, поэтому одновременно идёт не больше задач, чем потоков в пуле, а потоки этапов только
+    передают задания между очередями. Время ожидания свободного потока пула входит в загрузку этапа.
+    """
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE, executor=None):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.executor = executor
+        self.wall_time = 0.0
+
+    def run(self, jobs):
+        """Прогоняет задания через конвейер и отдаёт их по мере выхода из последнего этапа."""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        output = queue.Queue()
+        threads = []
+
+        feed_errors = []
+
+        def feed():
+            try:
+                for job in jobs:
+                    queues[0].put(job)  # блокируется, пока первый этап не освободит место
+            except BaseException as e:
+                feed_errors.append(e)
+                log(f"❌ Конвейер: ошибка при получении заданий: {e}", level="ERROR")
+            finally:
+                # Этапы закрываются и при ошибке, иначе run() ждал бы выход конвейера бесконечно
+                for _ in range(self.stages[0].workers):
+                    queues[0].put(_DONE)
+
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+
+        def work(index):
+            stage = self.stages[index]
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(self.stages) else output
+            while True:
+                stage.observe_depth(inbox.qsize())
+                job = inbox.get()
+                if job is _DONE:
+                    break
+                started = time.perf_counter()
+                failed = False
+                if not job.get("error"):
+                    try:
+                        if self.executor is None:
+                            job = stage.func(job)
+                        else:
+                            job = self.executor.submit(contextvars.copy_context().run, stage.func, job).result()
+                    except Exception as e:
+                        failed = True
+                        job["error"] = f"{stage.name}: {e}"
+                        log(f"❌ Конвейер, этап {stage.name}, {job['repository'].name}: {e}", level="ERROR")
+                elapsed = time.perf_counter() - started
+                stage.account(elapsed, failed)
+                job["elapsed"] = job.get("elapsed", 0.0) + elapsed
+                outbox.put(job)
+            # Последний поток этапа закрывает следующий этап
+            with remaining_lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last:
+                if index + 1 < len(self.stages):
+                    for _ in range(self.stages[index + 1].workers):
+                        outbox.put(_DONE)
+                else:
+                    outbox.put(_DONE)
+
+        started = time.perf_counter()
+        # Потоки этапов работают в копии контекста вызывающего кода (запуск метрик и т. п.)
+        threads.append(threading.Thread(target=contextvars.copy_context().run, args=(feed,),
+                                        name="pipeline-feed", daemon=True))
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(threading.Thread(target=contextvars.copy_context().run, args=(work, index),
+                                                name=f"pipeline-{stage.name}-{n}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        while True:
+            job = output.get()
+            if job is _DONE:
+                break
+            yield job
+
+        for thread in threads:
+            thread.join()
+        self.wall_time = time.perf_counter() - started
+        if feed_errors:
+            raise feed_errors[0]
+
+    def stats(self):
+        """Статистика по этапам за последний запуск: {имя этапа: счётчики Stage.stats()}."""
+        return {stage.name: stage.stats(self.wall_time) for stage in self.stages}
+
+    def log_stats(self):
+        for name, s in self.stats().items():
+            log(f"🏭 Этап {name}: обработано {s['processed']} (ошибок {s['failed']}), "
+                f"{s['throughput']:.2f} репоз./с, загрузка {s['utilization']:.0%}, "
+                f"очередь ср. {s['queue_avg']:.1f} / макс. {s['queue_max']}")
+
+
+def _list_stage(job):
+    """
+    Кэш и листинг: неизменённый репозиторий с кэшем идёт сразу на отчёт (следующие шаги его пропускают),
+    у остальных выбираются файлы к загрузке. Кэш и контрольная точка читаются здесь, а не при создании
+    задания, поэтому в памяти одновременно лежат данные только заданий, уже вошедших в конвейер.
+    """
+    project_name, repository_name = job["project_name"], job["repository"].name
+    cached_data = load_repo_data_from_cache(project_name, repository_name)
+    if cached_data and not job["repo_changed"]:
+        job.update(from_cache=True, files=cached_data.get("files", []),
+                   tokens=cached_data.get("total_tokens", 0), cached_commit=cached_data.get("commit_id"))
+        return job
+    cached_files = cached_data.get("files") if cached_data else None
+    if job["run_id"]:
+        checkpoint = job["checkpoint"] = checkpoints.RepoCheckpoint(
+            checkpoints.get_checkpoint_store(), job["run_id"], repository_name
+        )
+        if checkpoint.files:
+            # Файлы, посчитанные в прерванном запуске, берутся из контрольной точки по objectId
+            log(f"♻ Продолжение анализа {repository_name}: в контрольной точке {len(checkpoint.files)} файлов")
+            checkpoint_paths = set(checkpoint.files)
+            cached_files = checkpoint.records() + [
+                f for f in cached_files or [] if f.get("path") not in checkpoint_paths
+            ]
+    job["plan"] = plan_repo_fetch(project_name, repository_name, cached_files=cached_files)
+    if job["plan"] is None:
+        job["error"] = "не удалось получить список файлов"
+    return job
+
+
+def _fetch_stage(job):
+    if job["from_cache"]:
+        return job
+    # Содержимое загруженных файлов (и архив) ждёт следующего этапа во временных файлах на диске,
+    # а не в памяти: в очередях лежат только пути
+    fetch_repo_files(job["project_name"], job["repository"].name, job["plan"], materialize=True, spool=True)
+    return job
+
+
+def _metrics_stage(job):
+    if job["from_cache"]:
+        return job
+    checkpoint = job.get("checkpoint")
+    try:
+        job["files"], job["tokens"] = count_fetched_files(
+            job["repository"].name, job.pop("plan"), on_record=checkpoint.add if checkpoint else None
+        )
+    finally:
+        # Посчитанное сохраняется и при ошибке — продолжение запуска начнёт с этого места
+        if checkpoint:
+            checkpoint.flush()
+    return job
+
+
+def _cache_stage(job):
+    project_name, repository_name = job["project_name"], job["repository"].name
+    if job["from_cache"]:
+        # Файлы не менялись, но head мог сдвинуться — запоминаем его
+        if job["head_commit"] and job.get("cached_commit") != job["head_commit"]:
+            save_project_head(project_name, repository_name, job["head_commit"])
+        return job
+    save_repo_data_to_cache(project_name, repository_name, job["tokens"], job["files"], commit_id=job["head_commit"])
+    return job
+
+
+def _report_stage(job):
+    repository_name = job["repository"].name
+    # Дальше (до сводного отчёта) метрики файлов хранятся компактно
+    job["files"] = FileMetrics.from_records(job["files"])
+    # Неизменённый репозиторий берёт отчёт из хранилища, если он уже создавался для того же состояния
+    commit_id = job.get("cached_commit") if job["from_cache"] else job["head_commit"]
+    key = report_key(job["project_name"], repository_name, commit_id, job["tokens"])
+    job.update(report_for_state(job["project_name"], repository_name, key,
+                                lambda: generate_report(job["project_name"], repository_name, job["files"])))
+    if not job["report_path"]:
+        job["error"] = "отчёт не создан"
+    return job
+
+
+def make_repository_pipeline(fetch_workers=None, queue_size=None, executor=None):
+    """Конвейер быстрого анализа репозиториев; executor — общий пул, на котором выполняются этапы."""
+    return Pipeline([
+        Stage("listing", _list_stage),
+        Stage("fetch", _fetch_stage, fetch_workers or PIPELINE_FETCH_WORKERS),
+        Stage("metrics", _metrics_stage),
+        Stage("cache", _cache_stage),
+        Stage("report", _report_stage),
+    ], queue_size or PIPELINE_QUEUE_SIZE, executor)
+
+
+def make_job(project_name, repository, repo_changed, head_commit=None, run_id=None):
+    """
+    Задание конвейера для репозитория. Кэш читается на этапе листинга: неизменённый
+    репозиторий с кэшем оттуда сразу идёт на отчёт по данным из кэша.
+    run_id — запуск, в контрольной точке которого сохраняются посчитанные файлы.
+    """
+    return {
+        "project_name": project_name,
+        "repository": repository,
+        "repo_changed": repo_changed,
+        "head_commit": head_commit,
+        "run_id": run_id,
+        "checkpoint": None,
+        "from_cache": False,
+    }
+
+
+def job_result(job):
+    """Результат в формате analyze_repository или None, если репозиторий не обработан."""
+    if job.get("error"):
+        return None
+    return {
+        "repository": job["repository"].name,
+        "tokens": job["tokens"],
+        "cached": job["from_cache"],
+        "files": job["files"],
+        "report_path": job["report_path"],
+        "report_artifact": job["report_artifact"],
+        "report_reused": job["report_reused"],
+    }
+
+
+def run_pipeline(jobs, pipeline=None):
+    """
+    Прогоняет задания через конвейер; отдаёт задания по мере готовности.
+    По завершении логирует статистику этапов.
+    """
+    pipeline = pipeline or make_repository_pipeline()
+    with span("pipeline"):
+        yield from pipeline.run(jobs)
+    pipeline.log_stats()
@@ -1,150 +1,238 @@
 # core/analyze/repository_analysis.py
 import os
 from core.reports.generate import generate_report
-from core.utils.cache import load_repo_data_from_cache, save_repo_data_to_cache
-from core.utils.token_counter import count_tokens_in_repo
-from core.logging.logger import log
-from core.ai.report_generator import (
-    generate_ai_report,
-    generate_deep_report_for_repo,
-    get_deep_reports_for_repo
+from core.reports.artifacts import report_key, report_for_state, store_report
+from core.utils.cache import (
+    load_repo_data_from_cache, save_repo_data_to_cache, update_repo_files, save_project_head, RepoCacheWriter
 )
+from core.utils.token_counter import iter_repo_files, count_tokens_for_items, is_whitelisted
+from core.utils.file_metrics import FileMetrics, FileMetricsBuilder
+from core.azure.repo_commits import get_changed_files
+from core.logging.logger import log
+from core.logging.metrics import span
+from core.ai.report_generator import generate_ai_report, write_aggregated_deep_report
 
-def analyze_repository(project_name, repository, repo_changed, analysis_mode="fast"):
+def analyze_repository(project_name, repository, repo_changed, analysis_mode="fast", head_commit=None,
+                       checkpoint=None):
     """
     Анализ одного репозитория.
       - Если analysis_mode == "fast" и repo_changed == False, пытаемся взять кэш.
       - Если analysis_mode == "deep" или кэш отсутствует, выполняем полный анализ.
-    Возвращает словарь с результатами анализа.
+    head_commit — текущий head ветки по умолчанию; сохраняется в кэш вместе с результатом.
+    checkpoint — контрольная точка репозитория в пакетном запуске (core.utils.checkpoints.RepoCheckpoint).
+    Отчёт неизменённого репозитория берётся из хранилища отчётов (core.reports.artifacts), если он уже
+    создавался для того же состояния; "report_reused" в результате — отчёт взят из хранилища.
+    Возвращает словарь с результатами анализа; метрики файлов в нём ("files") — колоночная
+    таблица core.utils.file_metrics.FileMetrics.
     """
     repository_name = repository.name
+    with span("analyze_repository", repository=repository_name):
+        return _analyze_repository(project_name, repository, repo_changed, analysis_mode, head_commit, checkpoint)
+
+def _analyze_repository(project_name, repository, repo_changed, analysis_mode, head_commit, checkpoint=None):
+    repository_name = repository.name
 
     if analysis_mode == "fast" and not repo_changed:
         cached_data = load_repo_data_from_cache(project_name, repository_name)
         if cached_data:
+            # Файлы из белого списка не менялись, но head мог сдвинуться — запоминаем его
+            if head_commit and cached_data.get("commit_id") != head_commit:
+                save_project_head(project_name, repository_name, head_commit)
             total_tokens = cached_data.get("total_tokens", 0)
             files_data = cached_data.get("files", [])
-            report_path = generate_report(project_name, repository_name, files_data)
-            if report_path:
-                log(f"📄 Отчёт анализа {repository_name} сохранён (из кэша): {report_path}")
+            key = report_key(project_name, repository_name, cached_data.get("commit_id"), total_tokens)
+            report = report_for_state(project_name, repository_name, key,
+                                      lambda: generate_report(project_name, repository_name, files_data))
+            if report["report_path"]:
+                if report["report_reused"]:
+                    log(f"♻ Отчёт анализа {repository_name} взят из хранилища: {report['report_path']}")
+                else:
+                    log(f"📄 Отчёт анализа {repository_name} сохранён (из кэша): {report['report_path']}")
                 return {
                     "repository": repository_name,
                     "tokens": total_tokens,
                     "cached": True,
-                    "files": files_data,
-                    "report_path": report_path
+                    "files": FileMetrics.from_records(files_data),
+                    **report
                 }
             else:
                 log(f"❌ Ошибка при генерации отчёта из кэша для {repository_name}!", level="ERROR")
                 return None
 
-    return analyze_repository_from_scratch(project_name, repository.name, analysis_mode)
+    if analysis_mode == "fast" and head_commit:
+        cached_data = load_repo_data_from_cache(project_name, repository_name)
+        if cached_data and cached_data.get("commit_id") and cached_data["commit_id"] != head_commit:
+            result = analyze_repository_incremental(project_name, repository_name, cached_data, head_commit)
+            if result:
+                return result
+            log(f"⚠ Инкрементальный анализ {repository_name} не удался, выполняем полный", level="WARNING")
+
+    return analyze_repository_from_scratch(project_name, repository.name, analysis_mode, head_commit, checkpoint)
 
-def analyze_repository_from_scratch(project_name, repository_name, analysis_mode="fast"):
+def analyze_repository_incremental(project_name, repository_name, cached_data, head_commit):
+    """
+    Быстрый анализ по diff: берёт последний проанализированный коммит из кэша,
+    запрашивает изменения до head_commit и пересчитывает только добавленные и изменённые файлы,
+    удалённые убирает из files_data. Генерирует отчёт и точечно обновляет кэш
+    (записываются только пересчитанные файлы, удалённые стираются).
+    Возвращает словарь с результатами анализа или None, если diff получить не удалось.
+    """
+    base_commit = cached_data["commit_id"]
+    changes = get_changed_files(project_name, repository_name, base_commit, head_commit)
+    if changes is None:
+        return None
+
+    files = {f["path"]: f for f in cached_data.get("files", []) if "path" in f}
+    cached_paths = list(files)
+    to_fetch = []
+    for change in changes:
+        # При переименовании старый путь исчезает
+        if "rename" in change["change_type"] and change.get("original_path"):
+            files.pop(change["original_path"], None)
+        if "delete" in change["change_type"] or not is_whitelisted(change["path"]):
+            files.pop(change["path"], None)
+            continue
+        to_fetch.append({"path": change["path"], "object_id": change["object_id"]})
+
+    fetched_data, _ = count_tokens_for_items(project_name, repository_name, to_fetch)
+    # Изменённые файлы остаются на своих местах в списке, новые добавляются в конец
+    fetched_paths = {record["path"] for record in fetched_data}
+    for item in to_fetch:
+        if item["path"] not in fetched_paths:
+            files.pop(item["path"], None)
+    for record in fetched_data:
+        files[record["path"]] = record
+
+    files_data = list(files.values())
+    total_tokens = sum(f.get("tokens", 0) for f in files_data)
+    log(f"🔀 Инкрементальный анализ {repository_name}: изменений {len(changes)}, пересчитано файлов {len(fetched_data)}")
+
+    report_path = generate_report(project_name, repository_name, files_data)
+    if not report_path:
+        log(f"❌ Ошибка при генерации отчёта для {repository_name}", level="ERROR")
+        return None
+
+    removed = [path for path in cached_paths if path not in files]
+    if not update_repo_files(project_name, repository_name, fetched_data, removed, commit_id=head_commit):
+        save_repo_data_to_cache(project_name, repository_name, total_tokens, files_data, commit_id=head_commit)
+    log(f"📄 Отчёт анализа {repository_name} сохранён: {report_path}")
+
+    return {
+        "repository": repository_name,
+        "tokens": total_tokens,
+        "cached": False,
+        "files": FileMetrics.from_records(files_data),
+        "report_path": report_path,
+        "report_artifact": store_report(report_key(project_name, repository_name, head_commit, total_tokens),
+                                        report_path),
+        "report_reused": False
+    }
+
+def analyze_repository_from_scratch(project_name, repository_name, analysis_mode="fast", head_commit=None,
+                                    checkpoint=None):
     """
     Считает токены заново, генерирует отчёт и (при глубоком анализе) ИИ‑отчёты,
     затем сохраняет данные в кэше (при быстром анализе).
+    Файлы идут потоком (iter_repo_files): содержимое файла освобождается сразу после подсчёта
+    метрик и ИИ‑анализа, а отчёт, кэш и итоги для сводки пополняются по мере поступления записей.
+    В памяти остаются только метрики файлов (без содержимого) в колоночной таблице FileMetrics.
+    checkpoint — контрольная точка прерванного запуска: посчитанные в нём файлы с тем же objectId
+    не скачиваются заново (быстрый анализ), а полученные ИИ‑отчёты не запрашиваются повторно (глубокий).
     Возвращает словарь с результатами анализа.
     """
-    token_result = count_tokens_in_repo(project_name, repository_name)
-    if not token_result or not isinstance(token_result, tuple) or len(token_result) != 2:
-        log("❌ Неверный формат данных от count_tokens_in_repo!", level="ERROR")
-        return None
+    # При быстром анализе файлы с неизменившимся objectId берутся из кэша без загрузки
+    cached_files = None
+    if analysis_mode == "fast":
+        cached_data = load_repo_data_from_cache(project_name, repository_name)
+        cached_files = cached_data.get("files") if cached_data else None
+        if checkpoint and checkpoint.files:
+            checkpoint_paths = set(checkpoint.files)
+            cached_files = checkpoint.records() + [
+                f for f in cached_files or [] if f.get("path") not in checkpoint_paths
+            ]
 
-    files_data, total_tokens = token_result
+    files = FileMetricsBuilder()
+    totals = {"files": 0, "lines": 0, "comments": 0, "tokens": 0}
+    ai_reports = []
+    cache_writer = RepoCacheWriter(project_name, repository_name) if analysis_mode == "fast" else None
 
-    if analysis_mode == "fast":
-        report_path = generate_report(project_name, repository_name, files_data)
-    elif analysis_mode == "deep":
-        # Выполнение глубокого анализа: генерируется агрегированный ИИ‑отчёт
-        report_path = generate_deep_report_for_repo(project_name, repository_name, files_data)
+    def analyze_content(record, content):
+        # ИИ‑отчёт по файлу строится, пока его содержимое ещё в памяти
+        path = record["path"]
+        report_path = checkpoint.ai_report(record) if checkpoint else None
+        if report_path:
+            ai_reports.append(report_path)
+            return
+        folder = os.path.dirname(path).strip("/").replace("/", "_") or "root"
+        file_name = os.path.basename(path)
         try:
-            with open(report_path, "r", encoding="utf-8") as f:
-                aggregated_content = f.read()
-            print("Aggregated Deep Analysis Report:\n", aggregated_content, flush=True)
+            report_path = generate_ai_report(project_name, repository_name, folder, file_name, content)
+            if report_path:
+                ai_reports.append(os.path.abspath(report_path))
         except Exception as e:
-            log(f"❌ Ошибка при чтении агрегированного отчёта: {e}", level="ERROR")
-    else:
-        report_path = generate_report(project_name, repository_name, files_data)
+            log(f"❌ Ошибка генерации ИИ‑отчёта для файла {file_name}: {e}", level="ERROR")
+        if checkpoint:
+            checkpoint.add(record, os.path.abspath(report_path) if report_path else None)
+
+    def tee(records):
+        for record in records:
+            files.add(record)
+            totals["files"] += 1
+            totals["lines"] += record.get("lines", 0)
+            totals["comments"] += record.get("comments", 0)
+            totals["tokens"] += record.get("tokens", 0)
+            if cache_writer:
+                cache_writer.add(record)
+            if checkpoint and analysis_mode != "deep":
+                checkpoint.add(record)
+            yield record
+
+    records = tee(iter_repo_files(
+        project_name, repository_name, cached_files=cached_files,
+        on_content=analyze_content if analysis_mode == "deep" else None
+    ))
+    try:
+        if analysis_mode == "deep":
+            # Выполнение глубокого анализа: генерируется агрегированный ИИ‑отчёт
+            for _ in records:
+                pass
+            report_path = write_aggregated_deep_report(project_name, repository_name, ai_reports)
+        else:
+            report_path = generate_report(project_name, repository_name, records)
+    except BaseException:
+        if cache_writer:
+            cache_writer.abort()
+        raise
+    finally:
+        # Посчитанное сохраняется и при прерывании — следующий запуск продолжит с этого места
+        if checkpoint:
+            checkpoint.flush()
 
     if not report_path:
+        if cache_writer:
+            cache_writer.abort()
         log(f"❌ Ошибка при генерации отчёта для {repository_name}", level="ERROR")
         return None
 
-    if analysis_mode == "fast":
-        from core.utils.cache import save_repo_data_to_cache
-        save_repo_data_to_cache(project_name, repository_name, total_tokens, files_data)
-    
+    if cache_writer:
+        cache_writer.close(totals["tokens"], commit_id=head_commit)
+
     log(f"📄 Отчёт анализа {repository_name} сохранён: {report_path}")
 
     result = {
         "repository": repository_name,
-        "tokens": total_tokens,
+        "tokens": totals["tokens"],
         "cached": False,  # Анализ с нуля – кэш не используется
-        "files": files_data,
+        "files": files.build(),
+        "totals": totals,
         "report_path": report_path
     }
 
     if analysis_mode == "deep":
-        deep_reports = get_deep_reports_for_repo(project_name, repository_name, files_data)
-        result["ai_reports"] = deep_reports
+        result["ai_reports"] = ai_reports
+    else:
+        # Следующий запуск с неизменённым репозиторием возьмёт этот отчёт из хранилища
+        key = report_key(project_name, repository_name, head_commit, totals["tokens"])
+        result.update(report_artifact=store_report(key, report_path), report_reused=False)
 
     return result
-def generate_deep_report_for_repo(project_name, repository_name, files_data):
-    """
-    Для глубокого анализа генерирует ИИ‑отчёты для каждого файла репозитория.
-    Собирает пути созданных отчётов и формирует агрегированный сводный отчёт.
-    После создания агрегированного отчёта его содержимое выводится в консоль.
-    Возвращает абсолютный путь к агрегированному отчёту.
-    """
-    # Локальный импорт, чтобы избежать циклического импорта
-    from core.ai.report_generator import generate_ai_report
-    deep_report_paths = []
-    for file_info in files_data:
-        # Ожидается, что file_info содержит "file_name", "folder" и "content"
-        file_name = file_info.get("file_name")
-        folder = file_info.get("folder", "root")
-        file_content = file_info.get("content")
-        if not file_content:
-            continue
-        try:
-            report_path = generate_ai_report(project_name, repository_name, folder, file_name, file_content)
-            deep_report_paths.append(report_path)
-        except Exception as e:
-            log(f"❌ Ошибка генерации ИИ‑отчёта для файла {file_name}: {e}", level="ERROR")
-    
-    aggregated_dir = os.path.join("ai_reports", project_name, repository_name)
-    os.makedirs(aggregated_dir, exist_ok=True)
-    aggregated_report_path = os.path.join(aggregated_dir, "aggregated_deep_report.txt")
-    try:
-        with open(aggregated_report_path, "w", encoding="utf-8") as f:
-            header = f"Агрегированный ИИ‑анализ для репозитория {repository_name}\n\n"
-            f.write(header)
-            for path in deep_report_paths:
-                f.write(f"{path}\n")
-        # Вывод агрегированного отчёта в консоль
-        print(header, flush=True)
-        with open(aggregated_report_path, "r", encoding="utf-8") as f:
-            print(f.read(), flush=True)
-    except Exception as e:
-        log(f"❌ Ошибка при сохранении агрегированного ИИ‑отчёта: {e}", level="ERROR")
-    return os.path.abspath(aggregated_report_path)
-
-def get_deep_reports_for_repo(project_name, repository_name, files_data):
-    """
-    Возвращает список абсолютных путей к индивидуальным ИИ‑отчётам для каждого файла.
-    """
-    from core.ai.report_generator import generate_ai_report
-    deep_reports = []
-    for file_info in files_data:
-        file_name = file_info.get("file_name")
-        folder = file_info.get("folder", "root")
-        file_content = file_info.get("content")
-        if not file_content:
-            continue
-        try:
-            report_path = generate_ai_report(project_name, repository_name, folder, file_name, file_content)
-            deep_reports.append(os.path.abspath(report_path))
-        except Exception as e:
-            log(f"❌ Ошибка генерации ИИ‑отчёта для файла {file_name}: {e}", level="ERROR")
-    return deep_reports
@@ -0,0 +1,136 @@
+# core/analyze/scheduling.py
+"""
+Порядок запуска репозиториев при параллельном анализе.
+
+Стоимость репозитория оценивается по кэшу прошлых запусков (число файлов и токенов),
+а для репозиториев без истории — по размеру листинга get_items.
+Политика планирования выбирается по имени (SCHEDULING_POLICY) и может быть дополнена
+через register_policy(); по умолчанию — «сначала самые долгие» (LPT), чтобы огромный
+монорепозиторий не стартовал последним и не растягивал общее время.
+"""
+import heapq
+import os
+from core.azure.repos import get_repo_items
+from core.logging.logger import log
+from core.utils.cache import load_repo_totals
+from core.utils.concurrency import ordered_bounded_map
+from core.utils.token_counter import is_whitelisted
+
+SCHEDULING_POLICY = os.getenv("SCHEDULING_POLICY", "lpt")
+
+# Модель стоимости в «токенах»: загрузка файла стоит как FILE_COST_TOKENS токенов подсчёта
+FILE_COST_TOKENS = 2000
+# Средний размер файла, если токены репозитория ещё не считались
+DEFAULT_TOKENS_PER_FILE = 1500
+# Репозиторий с неизменившимся head берётся из кэша: только отчёт
+CACHED_COST_FACTOR = 0.05
+# Сколько листингов для оценки запрашивается одновременно
+LISTING_CONCURRENCY = 8
+
+
+def fifo(repositories, estimates):
+    """Исходный порядок."""
+    return list(repositories)
+
+
+def longest_first(repositories, estimates):
+    """LPT: по убыванию оценки стоимости; при равенстве сохраняется исходный порядок."""
+    return sorted(repositories, key=lambda repository: -estimates.get(repository.name, 0))
+
+
+SCHEDULING_POLICIES = {
+    "fifo": fifo,
+    "lpt": longest_first,
+}
+
+
+def register_policy(name, policy):
+    """Регистрирует политику: policy(repositories, estimates) -> repositories в порядке запуска."""
+    SCHEDULING_POLICIES[name] = policy
+
+
+def estimate_costs(project_name, repositories, unchanged=()):
+    """
+    Оценивает стоимость анализа каждого репозитория: {имя: стоимость}.
+    unchanged — имена репозиториев, которые будут взяты из кэша (head не изменился).
+    Без кэша оценка строится по числу файлов из листинга; если и его нет —
+    берётся средняя оценка остальных репозиториев.
+    """
+    estimates = {}
+    without_history = []
+    for repository in repositories:
+        cached = load_repo_totals(project_name, repository.name)
+        if cached:
+            tokens = cached.get("total_tokens") or cached.get("tokens", 0)
+            cost = tokens + FILE_COST_TOKENS * cached.get("files", 0)
+            if repository.name in unchanged:
+                cost *= CACHED_COST_FACTOR
+            estimates[repository.name] = cost
+        else:
+            without_history.append(repository)
+
+    if without_history:
+        log(f"📐 Оценка по листингу для {len(without_history)} репозиториев без истории")
+        listings = ordered_bounded_map(
+            lambda repository: get_repo_items(project_name, repository.name),
+            without_history,
+            LISTING_CONCURRENCY
+        )
+        unknown = []
+        for repository, items in zip(without_history, listings):
+            if items:
+                files = sum(1 for item in items if is_whitelisted(item["path"]))
+                estimates[repository.name] = files * (DEFAULT_TOKENS_PER_FILE + FILE_COST_TOKENS)
+            else:
+                unknown.append(repository.name)
+        default = sum(estimates.values()) / len(estimates) if estimates else 0
+        for name in unknown:
+            estimates[name] = default
+
+    return estimates
+
+
+def plan(repositories, estimates, policy=None):
+    """Возвращает репозитории в порядке запуска по политике (по умолчанию SCHEDULING_POLICY)."""
+    policy = policy or SCHEDULING_POLICY
+    if policy not in SCHEDULING_POLICIES:
+        log(f"⚠ Неизвестная политика планирования {policy}, используется fifo", level="WARNING")
+        policy = "fifo"
+    return SCHEDULING_POLICIES[policy](repositories, estimates)
+
+
+def simulate_makespan(durations, workers):
+    """Время выполнения списка задач (в порядке запуска) на workers исполнителях."""
+    finish_times = [0.0] * max(1, workers)
+    for duration in durations:
+        earliest = heapq.heappop(finish_times)
+        heapq.heappush(finish_times, earliest + duration)
+    return max(finish_times)
+
+
+def log_plan_accuracy(ordered_names, estimates, actual, workers, wall_time):
+    """
+    Сравнивает план с фактом: оценки переводятся в секунды по средней скорости запуска
+    (сумма факта / сумма оценок), для каждого репозитория логируются план и факт,
+    а также ожидаемое и фактическое общее время.
+    """
+    total_cost = sum(estimates.get(name, 0) for name in ordered_names)
+    total_actual = sum(actual.get(name, 0) for name in ordered_names)
+    if not total_cost or not total_actual:
+        return
+    seconds_per_unit = total_actual / total_cost
+
+    errors = []
+    for name in ordered_names:
+        planned = estimates.get(name, 0) * seconds_per_unit
+        fact = actual.get(name, 0)
+        log(f"📐 {name}: план {planned:.2f} с, факт {fact:.2f} с")
+        if fact:
+            errors.append(abs(planned - fact) / fact)
+
+    planned_makespan = simulate_makespan(
+        [estimates.get(name, 0) * seconds_per_unit for name in ordered_names], workers
+    )
+    mean_error = sum(errors) / len(errors) if errors else 0
+    log(f"📐 Планирование: ожидаемое время {planned_makespan:.2f} с, фактическое {wall_time:.2f} с, "
+        f"средняя ошибка оценки {mean_error:.0%}")
@@ -1,18 +1,164 @@
 # core/azure/connection.py
 import configparser
 import os
+import threading
 from azure.devops.connection import Connection
 from msrest.authentication import BasicAuthentication
+from requests.adapters import HTTPAdapter
+from core.logging.logger import log
 
-def connect_to_azure():
+SETTINGS_PATH = os.path.join(os.path.dirname(__file__), '../../config/settings.ini')
+
+# Размер пула HTTP-соединений по умолчанию (можно переопределить POOL_SIZE в settings.ini)
+DEFAULT_POOL_SIZE = 16
+
+_lock = threading.Lock()
+_connection = None
+_clients = {}
+_adapter = None
+_stats = {"connections": 0, "clients": 0}
+
+
+def _load_settings():
     """
-    Устанавливает соединение с Azure DevOps.
+    Читает settings.ini и возвращает секцию AZURE_DEVOPS.
     """
     config = configparser.ConfigParser()
-    config.read(os.path.join(os.path.dirname(__file__), '../../config/settings.ini'))
+    config.read(SETTINGS_PATH)
+    return config['AZURE_DEVOPS']
 
-    org_url = config['AZURE_DEVOPS']['ORG_URL']
-    access_token = config['AZURE_DEVOPS']['ACCESS_TOKEN']
 
-    credentials = BasicAuthentication('', access_token)
-    return Connection(base_url=org_url.rstrip('/') + '/', creds=credentials)
+def _shared_adapter(pool_size):
+    """Общий для всех клиентов и потоков HTTPAdapter с пулом keep-alive соединений (вызывать под _lock)."""
+    global _adapter
+    if _adapter is None:
+        _adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    return _adapter
+
+
+def _find_driver(client):
+    """HTTP-драйвер msrest клиента (RequestsHTTPSender) или None, если структура SDK изменилась."""
+    pipeline = getattr(getattr(getattr(client, "_client", None), "config", None), "pipeline", None)
+    driver = getattr(getattr(pipeline, "_sender", None), "driver", None)
+    if not hasattr(driver, "_init_session") or not hasattr(driver, "_session_mapping"):
+        return None
+    return driver
+
+
+def _configure_pool(client, adapter):
+    """
+    Подключает общий HTTPAdapter к сессиям requests клиента.
+    msrest держит отдельную requests.Session на каждый поток (threading.local) и настраивает
+    новую сессию в _init_session, поэтому адаптер подключается там: сессии всех потоков
+    (пул загрузки, параллельные репозитории, предварительный проход по head) работают
+    через один пул соединений. Если структура SDK изменилась — оставляем настройки по умолчанию.
+    """
+    driver = _find_driver(client)
+    if driver is None:
+        log("⚠ Не удалось настроить пул соединений: сессия клиента Azure не найдена", level="WARNING")
+        return False
+
+    init_session = driver._init_session
+
+    def init_pooled_session(session):
+        for prefix in ("https://", "http://"):
+            session.mount(prefix, adapter)
+        session.headers["Connection"] = "keep-alive"
+        init_session(session)
+
+    driver._init_session = init_pooled_session
+    # Сессия потока, создавшего клиента, могла появиться раньше
+    session = getattr(driver._session_mapping, "session", None)
+    if session is not None:
+        init_pooled_session(session)
+    return True
+
+
+def connect_to_azure():
+    """
+    Возвращает общее (на весь процесс) соединение с Azure DevOps.
+    Соединение создаётся один раз, повторные вызовы переиспользуют его.
+    """
+    global _connection
+    with _lock:
+        if _connection is None:
+            settings = _load_settings()
+            org_url = settings['ORG_URL']
+            access_token = settings['ACCESS_TOKEN']
+
+            credentials = BasicAuthentication('', access_token)
+            _connection = Connection(base_url=org_url.rstrip('/') + '/', creds=credentials)
+            _stats["connections"] += 1
+            log("🔌 Создано соединение с Azure DevOps")
+        return _connection
+
+
+def _get_client(kind):
+    """
+    Возвращает клиент Azure DevOps из реестра (git, core, ...), создавая его при первом обращении.
+    Клиенты потокобезопасно разделяются между всеми вызовами и используют общий пул соединений.
+    """
+    with _lock:
+        client = _clients.get(kind)
+        if client is not None:
+            return client
+
+    connection = connect_to_azure()
+    with _lock:
+        client = _clients.get(kind)
+        if client is None:
+            client = getattr(connection.clients, f"get_{kind}_client")()
+            pool_size = _load_settings().getint('POOL_SIZE', fallback=DEFAULT_POOL_SIZE)
+            _configure_pool(client, _shared_adapter(pool_size))
+            _clients[kind] = client
+            _stats["clients"] += 1
+            log(f"🔌 Создан {kind}-клиент Azure DevOps (пул соединений: {pool_size})")
+        return client
+
+
+def get_git_client():
+    """Возвращает общий git-клиент Azure DevOps."""
+    return _get_client("git")
+
+
+def get_core_client():
+    """Возвращает общий core-клиент Azure DevOps."""
+    return _get_client("core")
+
+
+def get_connection_stats():
+    """
+    Статистика соединений:
+      connections, clients — сколько создано соединений Azure DevOps и клиентов;
+      http_connections     — сколько HTTP-соединений открыто в общем пуле (urllib3);
+      http_requests        — сколько запросов через них отправлено;
+      reused               — сколько запросов ушло по уже открытому соединению (keep-alive).
+    """
+    with _lock:
+        stats = dict(_stats)
+        adapter = _adapter
+    stats["http_connections"] = stats["http_requests"] = 0
+    if adapter is not None:
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                stats["http_connections"] += pool.num_connections
+                stats["http_requests"] += pool.num_requests
+    stats["reused"] = max(0, stats["http_requests"] - stats["http_connections"])
+    return stats
+
+
+def reset_connections():
+    """
+    Сбрасывает реестр соединений и клиентов (например, после смены settings.ini или в тестах).
+    """
+    global _connection, _adapter
+    with _lock:
+        _connection = None
+        _clients.clear()
+        if _adapter is not None:
+            _adapter.close()
+        _adapter = None
+        _stats["connections"] = 0
+        _stats["clients"] = 0
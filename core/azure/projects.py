@@ -1,5 +1,5 @@
 # core/azure/projects.py
-from core.azure.connection import connect_to_azure
+from core.azure.connection import get_core_client
 from core.logging.logger import log
 
 def get_projects():
@@ -7,8 +7,7 @@ def get_projects():
     Получает список проектов в Azure DevOps.
     """
     try:
-        connection = connect_to_azure()
-        core_client = connection.clients.get_core_client()
+        core_client = get_core_client()
         projects = core_client.get_projects()
         log(f"Получено {len(projects)} проектов.")
         return [project.name for project in projects]
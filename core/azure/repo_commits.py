@@ -1,78 +1,214 @@
-from core.azure.connection import connect_to_azure
+from core.azure.connection import get_git_client
 from core.logging.logger import log
+from core.logging.metrics import span
+from core.utils.concurrency import ordered_bounded_map
 from azure.devops.v7_0.git.models import GitQueryCommitsCriteria  # Импортируем критерии поиска коммитов
+from azure.devops.v7_0.git.models import GitBaseVersionDescriptor, GitTargetVersionDescriptor, GitVersionDescriptor
+from core.utils.commit_store import append_commits, commit_to_record, iter_commits, load_watermark
+import os
 
+# Сколько запросов head-коммитов выполняется одновременно
+HEADS_CONCURRENCY = int(os.getenv("HEADS_CONCURRENCY", "16"))
 
-def get_all_commits(project_name, repository):
+# Размер страницы при запросе изменений между коммитами
+DIFF_PAGE_SIZE = 2000
+
+
+def sync_commits(project_name, repository):
     """
-    Получает ВСЕ коммиты из репозитория, используя постраничную загрузку.
+    Догружает в локальное хранилище (core.utils.commit_store) только коммиты,
+    появившиеся после водяного знака — самого нового ранее сохранённого коммита.
+    Новые коммиты выбираются фильтрами GitQueryCommitsCriteria: item_version (ветка по умолчанию)
+    + compare_version (коммит водяного знака); если такой коммит больше недоступен
+    (например, после force push), используется фильтр from_date по дате водяного знака.
+    Возвращает количество новых коммитов.
     """
     try:
-        log(f"Начало получения коммитов для проекта {project_name}, репозитория {repository.name}")
-        connection = connect_to_azure()
-        git_client = connection.clients.get_git_client()
+        log(f"Синхронизация коммитов для проекта {project_name}, репозитория {repository.name}")
+        git_client = get_git_client()
+        watermark = load_watermark(project_name, repository.name)
 
-        # Получаем ID репозитория
-        repository_id = repository.id
+        search_criteria = GitQueryCommitsCriteria()  # Создаем объект критериев поиска
+        if repository.default_branch:
+            search_criteria.item_version = GitVersionDescriptor(
+                version=repository.default_branch.replace("refs/heads/", "", 1), version_type="branch"
+            )
+        if watermark:
+            search_criteria.compare_version = GitVersionDescriptor(
+                version=watermark["commit_id"], version_type="commit"
+            )
+
+        try:
+            new_commits = _fetch_commit_pages(git_client, project_name, repository, search_criteria)
+        except Exception as e:
+            if not watermark:
+                raise
+            log(f"⚠ Коммит водяного знака {watermark['commit_id'][:8]} недоступен ({e}), фильтруем по дате",
+                level="WARNING")
+            search_criteria.compare_version = None
+            search_criteria.from_date = watermark["date"]
+            new_commits = _fetch_commit_pages(git_client, project_name, repository, search_criteria)
+
+        known_id = watermark["commit_id"] if watermark else None
+        records = [commit_to_record(commit) for commit in new_commits if commit.commit_id != known_id]
+        append_commits(project_name, repository.name, records)
+
+        log(f"Новых коммитов для {repository.name}: {len(records)}")
+        return len(records)
 
-        # Запрашиваем коммиты с постраничной загрузкой
-        all_commits = []
-        batch_size = 500
-        skip = 0
+    except Exception as e:
+        log(f"Ошибка при синхронизации коммитов: {str(e)}", level="ERROR")
+        return 0
 
-        search_criteria = GitQueryCommitsCriteria()  # Создаем объект критериев поиска
 
-        while True:
+def _fetch_commit_pages(git_client, project_name, repository, search_criteria):
+    """
+    Постранично запрашивает коммиты по критериям и возвращает их списком (от новых к старым).
+    """
+    commits_found = []
+    batch_size = 500
+    skip = 0
+
+    while True:
+        with span("azure.get_commits", repository=repository.name, api_call=True):
             commits = list(git_client.get_commits(
-                repository_id=repository_id,
+                repository_id=repository.id,
                 project=project_name,
                 search_criteria=search_criteria,  # Передаем критерии поиска
                 top=batch_size,
                 skip=skip
             ))
 
-            if not commits:
-                break
+        if not commits:
+            break
 
-            all_commits.extend(commits)
-            skip += batch_size
+        commits_found.extend(commits)
+        log(f"Загружено {len(commits)} коммитов, всего {len(commits_found)}")
+        if len(commits) < batch_size:
+            break
+        skip += batch_size
 
-            log(f"Загружено {len(commits)} коммитов, всего {len(all_commits)}")
+    return commits_found
 
-        log(f"Всего получено {len(all_commits)} коммитов для {repository.name}")
-        return all_commits
 
-    except Exception as e:
-        log(f"Ошибка при получении коммитов: {str(e)}", level="ERROR")
-        return []
+def get_all_commits(project_name, repository):
+    """
+    Возвращает итератор по ВСЕМ коммитам репозитория (компактные записи из локального хранилища).
+    Перед чтением догружает только новые коммиты (см. sync_commits).
+    """
+    sync_commits(project_name, repository)
+    return iter_commits(project_name, repository.name)
 
 
-def get_last_commit(project_name, repository_name):
+def get_last_commit(project_name, repository):
     """
-    Получает хэш последнего коммита для репозитория.
+    Получает хэш последнего коммита (head) ветки по умолчанию репозитория.
+    repository — объект репозитория с полями .id, .name и .default_branch.
     """
     try:
-        log(f"Получение последнего коммита для проекта {project_name}, репозитория {repository_name}")
-        connection = connect_to_azure()
-        git_client = connection.clients.get_git_client()
-
-        # Запрос на получение последнего коммита
-        search_criteria = GitQueryCommitsCriteria()
-        commits = git_client.get_commits(
-            repository_id=repository_name,
-            project=project_name,
-            search_criteria=search_criteria,
-            top=1
-        )
-
-        if commits:
-            last_commit_id = commits[0].commit_id
-            log(f"Последний коммит для {repository_name}: {last_commit_id}")
-            return last_commit_id
-
-        log(f"⚠ Нет коммитов в репозитории {repository_name}", level="WARNING")
+        log(f"Получение последнего коммита для проекта {project_name}, репозитория {repository.name}")
+        git_client = get_git_client()
+
+        branch = repository.default_branch
+        if not branch:
+            log(f"⚠ У репозитория {repository.name} нет ветки по умолчанию (пустой репозиторий?)", level="WARNING")
+            return None
+
+        # filter — префикс без "refs/", поэтому точное имя ветки сверяем отдельно
+        with span("azure.get_refs", repository=repository.name, api_call=True):
+            response = git_client.get_refs(
+                repository_id=repository.id,
+                project=project_name,
+                filter=branch.replace("refs/", "", 1)
+            )
+        refs = getattr(response, "value", response) or []
+
+        for ref in refs:
+            if ref.name == branch:
+                log(f"Последний коммит для {repository.name}: {ref.object_id}")
+                return ref.object_id
+
+        log(f"⚠ Нет коммитов в репозитории {repository.name}", level="WARNING")
         return None
 
     except Exception as e:
         log(f"Ошибка при получении последнего коммита: {e}", level="ERROR")
         return None
+
+
+def get_head_commits(project_name, repositories, concurrency=None):
+    """
+    Получает head-коммиты веток по умолчанию сразу для всех репозиториев проекта.
+    REST API Azure DevOps не умеет отдавать refs нескольких репозиториев одним вызовом,
+    поэтому запросы идут параллельно на пуле потоков поверх общего пула соединений.
+    Возвращает {имя репозитория: commit_id или None}.
+    """
+    repositories = list(repositories)
+    log(f"📌 Запрос head-коммитов для {len(repositories)} репозиториев проекта {project_name}...")
+    heads = ordered_bounded_map(
+        lambda repository: get_last_commit(project_name, repository),
+        repositories,
+        concurrency or HEADS_CONCURRENCY
+    )
+    return {repository.name: head for repository, head in zip(repositories, heads)}
+
+
+def _field(obj, key, attr):
+    """Читает поле и из словаря (сырые объекты REST API), и из модели SDK."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, attr, None)
+
+
+def get_changed_files(project_name, repository_name, base_commit, target_commit):
+    """
+    Получает список файлов, изменённых между двумя коммитами (get_commit_diffs).
+    Возвращает [{"path", "object_id", "change_type", "original_path"}, ...]
+    или None, если diff получить не удалось.
+    change_type — строка из Azure DevOps в нижнем регистре ("add", "edit", "delete", "edit, rename", ...).
+    """
+    try:
+        log(f"🔀 Запрос изменений {repository_name}: {base_commit[:8]}..{target_commit[:8]}")
+        git_client = get_git_client()
+
+        base = GitBaseVersionDescriptor(base_version=base_commit, base_version_type="commit")
+        target = GitTargetVersionDescriptor(target_version=target_commit, target_version_type="commit")
+
+        changes = []
+        skip = 0
+        while True:
+            with span("azure.get_commit_diffs", repository=repository_name, api_call=True):
+                diffs = git_client.get_commit_diffs(
+                    repository_id=repository_name,
+                    project=project_name,
+                    diff_common_commit=False,
+                    top=DIFF_PAGE_SIZE,
+                    skip=skip,
+                    base_version_descriptor=base,
+                    target_version_descriptor=target
+                )
+            page = diffs.changes or []
+            for change in page:
+                item = _field(change, "item", "item")
+                is_folder = _field(item, "isFolder", "is_folder") or _field(item, "gitObjectType", "git_object_type") == "tree"
+                if item is None or is_folder:
+                    continue
+                changes.append({
+                    "path": _field(item, "path", "path"),
+                    "object_id": _field(item, "objectId", "object_id"),
+                    "change_type": str(_field(change, "changeType", "change_type") or "").lower(),
+                    "original_path": _field(change, "sourceServerItem", "source_server_item"),
+                })
+
+            if diffs.all_changes_included or not page:
+                break
+            skip += len(page)
+
+        log(f"✅ Изменено файлов в {repository_name}: {len(changes)}")
+        return changes
+
+    except Exception as e:
+        log(f"❌ Ошибка при получении изменений {repository_name}: {e}", level="ERROR")
+        return None
@@ -1,6 +1,8 @@
 import os
-from core.azure.connection import connect_to_azure
+import tempfile
+from core.azure.connection import get_git_client
 from core.logging.logger import log
+from core.logging.metrics import span
 from azure.devops.v7_0.git.models import GitRepository
 from tqdm import tqdm  # Прогресс-бар для операций с файлами
 
@@ -9,11 +11,11 @@ def get_repositories(project_name):
     Получает список репозиториев в указанном проекте и возвращает объекты с полями .id и .name.
     """
     try:
-        connection = connect_to_azure()
-        git_client = connection.clients.get_git_client()
+        git_client = get_git_client()
         
         log(f"📌 Запрос списка репозиториев для проекта {project_name}...")
-        repos = git_client.get_repositories(project=project_name)
+        with span("azure.get_repositories", api_call=True):
+            repos = git_client.get_repositories(project=project_name)
 
         if not repos:
             log(f"⚠ Нет репозиториев в проекте {project_name}.", level="WARNING")
@@ -28,39 +30,51 @@ def get_repositories(project_name):
         return []
 
 
-def fetch_files_from_azure(project_name, repository_name):
+def fetch_items_from_azure(project_name, repository_name):
     """
-    Получает список файлов в репозитории через API Azure DevOps.
+    Получает список файлов репозитория вместе с их objectId (хэш git-блоба) через API Azure DevOps.
+    Возвращает список словарей [{"path": ..., "object_id": ...}, ...].
     """
     try:
-        connection = connect_to_azure()
-        git_client = connection.clients.get_git_client()
+        git_client = get_git_client()
 
         log(f"📂 Запрос списка файлов для репозитория {repository_name}...")
-        items = git_client.get_items(project=project_name, repository_id=repository_name, recursion_level="full")
+        with span("azure.get_items", repository=repository_name, api_call=True):
+            items = git_client.get_items(project=project_name, repository_id=repository_name, recursion_level="full")
 
         if not items:
             log(f"⚠ Репозиторий {repository_name} не содержит файлов или доступ ограничен.", level="WARNING")
             return []
 
-        # Фильтруем только пути файлов
-        file_paths = [item.path for item in items if not item.is_folder]
-        log(f"✅ Получено {len(file_paths)} файлов из {repository_name}")
-        return file_paths
+        # Оставляем только файлы
+        file_items = [
+            {"path": item.path, "object_id": item.object_id}
+            for item in items if not item.is_folder
+        ]
+        log(f"✅ Получено {len(file_items)} файлов из {repository_name}")
+        return file_items
 
     except Exception as e:
         log(f"❌ Ошибка при получении файлов из {repository_name}: {e}", level="ERROR")
         return []
 
 
-def get_repo_files(project_name, repository_name):
+def fetch_files_from_azure(project_name, repository_name):
     """
-    Получает список файлов в репозитории, используя `fetch_files_from_azure`.
+    Получает список путей файлов в репозитории через API Azure DevOps.
+    """
+    return [item["path"] for item in fetch_items_from_azure(project_name, repository_name)]
+
+
+def get_repo_items(project_name, repository_name):
+    """
+    Получает список файлов репозитория с objectId, используя `fetch_items_from_azure`.
+    Возвращает None, если файлов нет или их не удалось получить.
     """
     try:
-        files = fetch_files_from_azure(project_name, repository_name)
+        items = fetch_items_from_azure(project_name, repository_name)
 
-        if not files:
+        if not items:
             log(f"⚠ DEBUG: В репозитории **{repository_name}** **не найдено файлов**. Возможные причины:\n"
                 f"   - 🔹 Репозиторий пуст\n"
                 f"   - 🔹 Ошибка при получении файлов\n"
@@ -68,26 +82,38 @@ def get_repo_files(project_name, repository_name):
                 f"   - 🔹 Сбой сети/API", level="WARNING")
             return None
 
-        return files
+        return items
 
     except Exception as e:
         log(f"❌ Ошибка при получении файлов из {repository_name}: {e}", level="ERROR")
         return None
 
 
+def get_repo_files(project_name, repository_name):
+    """
+    Получает список путей файлов в репозитории, используя `get_repo_items`.
+    """
+    items = get_repo_items(project_name, repository_name)
+    if not items:
+        return None
+    return [item["path"] for item in items]
+
+
 def get_file_content(project_name, repository_name, file_path):
     """
     Загружает содержимое файла по его пути через API Azure DevOps.
     """
     try:
-        connection = connect_to_azure()
-        git_client = connection.clients.get_git_client()
+        git_client = get_git_client()
 
         log(f"📄 Загрузка файла {file_path} из репозитория {repository_name}...")
-        content_generator = git_client.get_item_content(repository_name, path=file_path, project=project_name)
+        with span("azure.get_item_content", repository=repository_name, api_call=True) as s:
+            content_generator = git_client.get_item_content(repository_name, path=file_path, project=project_name)
 
-        # Корректно извлекаем данные из генератора
-        file_content = b"".join(content_generator).decode("utf-8", errors="ignore")
+            # Корректно извлекаем данные из генератора
+            data = b"".join(content_generator)
+            s.bytes = len(data)
+        file_content = data.decode("utf-8", errors="ignore")
 
         if file_content:
             log(f"✅ Файл {file_path} успешно загружен ({len(file_content)} символов)")
@@ -99,3 +125,67 @@ def get_file_content(project_name, repository_name, file_path):
     except Exception as e:
         log(f"❌ Ошибка при загрузке файла {file_path}: {e}", level="ERROR")
         return ""
+
+
+def download_repo_archive(project_name, repository_name):
+    """
+    Загружает снимок репозитория одним zip-потоком (эндпоинт items/zip Azure DevOps).
+    Возвращает байты архива или None, если архив получить не удалось.
+    """
+    try:
+        git_client = get_git_client()
+
+        log(f"📦 Загрузка архива репозитория {repository_name}...")
+        with span("azure.get_item_zip", repository=repository_name, api_call=True) as s:
+            content_generator = git_client.get_item_zip(
+                repository_name, path="/", project=project_name, recursion_level="full"
+            )
+            archive = b"".join(content_generator)
+            s.bytes = len(archive)
+
+        if not archive:
+            log(f"⚠ Архив репозитория {repository_name} пуст", level="WARNING")
+            return None
+
+        log(f"✅ Архив {repository_name} загружен ({len(archive)} байт)")
+        return archive
+
+    except Exception as e:
+        log(f"❌ Ошибка при загрузке архива {repository_name}: {e}", level="ERROR")
+        return None
+
+
+def download_repo_archive_to_file(project_name, repository_name):
+    """
+    То же, что download_repo_archive, но архив потоком пишется во временный файл на диске,
+    поэтому память не растёт с размером репозитория.
+    Возвращает открытый файл (позиция в начале; удаляется при закрытии) или None.
+    """
+    archive_file = None
+    try:
+        git_client = get_git_client()
+
+        log(f"📦 Загрузка архива репозитория {repository_name} во временный файл...")
+        archive_file = tempfile.TemporaryFile()
+        with span("azure.get_item_zip", repository=repository_name, api_call=True) as s:
+            content_generator = git_client.get_item_zip(
+                repository_name, path="/", project=project_name, recursion_level="full"
+            )
+            for chunk in content_generator:
+                archive_file.write(chunk)
+                s.bytes += len(chunk)
+
+        if not s.bytes:
+            archive_file.close()
+            log(f"⚠ Архив репозитория {repository_name} пуст", level="WARNING")
+            return None
+
+        archive_file.seek(0)
+        log(f"✅ Архив {repository_name} загружен ({s.bytes} байт)")
+        return archive_file
+
+    except Exception as e:
+        log(f"❌ Ошибка при загрузке архива {repository_name}: {e}", level="ERROR")
+        if archive_file is not None:
+            archive_file.close()
+        return None
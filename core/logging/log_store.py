@@ -0,0 +1,265 @@
+# core/logging/log_store.py
+"""
+Хранилище логов (logs.db): схема с индексами, ретенция, сжатые большие сообщения
+и консольный запрос логов.
+
+Большие сообщения (полные промпты и ответы OpenAI) хранятся в таблице payloads
+в сжатом виде, а в logs.message остаётся только их начало.
+
+Запуск из корня проекта:
+    python -m core.logging.log_store query --level ERROR --since 2025-03-01 --contains OpenAI
+    python -m core.logging.log_store prune --days 14 --max-mb 100
+    python -m core.logging.log_store stats
+"""
+import argparse
+import os
+import sqlite3
+import time
+import zlib
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '../../logs.db')
+
+# Ретенция при запуске: записи старше LOG_RETENTION_DAYS дней удаляются, размер БД ограничен LOG_MAX_MB.
+# По умолчанию выключена (0 — без ограничения): логи удаляются только явно, командой prune
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "0"))
+LOG_MAX_MB = int(os.getenv("LOG_MAX_MB", "0"))
+# Значения по умолчанию для команды prune, если ретенция не настроена
+PRUNE_DEFAULT_DAYS = 30
+PRUNE_DEFAULT_MAX_MB = 200
+# Сообщения длиннее порога (в символах) сжимаются в таблицу payloads (0 — не сжимать)
+LOG_PAYLOAD_THRESHOLD = int(os.getenv("LOG_PAYLOAD_THRESHOLD", "2048"))
+PAYLOAD_PREVIEW_CHARS = 500
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def connect(db_path=DB_PATH):
+    """Открывает logs.db в режиме WAL и приводит схему к актуальной."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    ensure_schema(conn)
+    return conn
+
+
+def ensure_schema(conn):
+    """
+    Создаёт таблицы logs и payloads и индексы по времени и уровню.
+    Старая БД один раз переводится в режим incremental auto_vacuum (нужен VACUUM).
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS logs(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created TEXT,
+        level TEXT,
+        message TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS payloads(
+        log_id INTEGER PRIMARY KEY,
+        size INTEGER,
+        data BLOB
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_created ON logs(created)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_level_created ON logs(level, created)")
+    conn.commit()
+
+    (auto_vacuum,) = conn.execute("PRAGMA auto_vacuum").fetchone()
+    if auto_vacuum != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def insert_records(conn, rows, payload_threshold=LOG_PAYLOAD_THRESHOLD):
+    """
+    Вставляет записи (created, level, message). Сообщения длиннее payload_threshold
+    сохраняются сжатыми в payloads, в logs остаётся их начало. Коммит — на вызывающем.
+    """
+    if not payload_threshold:
+        conn.executemany("INSERT INTO logs(created, level, message) VALUES (?, ?, ?)", rows)
+        return
+
+    small = []
+    for created, level, message in rows:
+        if len(message) <= payload_threshold:
+            small.append((created, level, message))
+            continue
+        if small:
+            conn.executemany("INSERT INTO logs(created, level, message) VALUES (?, ?, ?)", small)
+            small = []
+        preview = f"{message[:PAYLOAD_PREVIEW_CHARS]}… [сжато, {len(message)} симв.]"
+        cursor = conn.execute("INSERT INTO logs(created, level, message) VALUES (?, ?, ?)", (created, level, preview))
+        conn.execute(
+            "INSERT INTO payloads(log_id, size, data) VALUES (?, ?, ?)",
+            (cursor.lastrowid, len(message), zlib.compress(message.encode("utf-8"), 6))
+        )
+    if small:
+        conn.executemany("INSERT INTO logs(created, level, message) VALUES (?, ?, ?)", small)
+
+
+def db_size_bytes(conn):
+    """Занятый объём БД (без свободных страниц)."""
+    (page_size,) = conn.execute("PRAGMA page_size").fetchone()
+    (page_count,) = conn.execute("PRAGMA page_count").fetchone()
+    (freelist,) = conn.execute("PRAGMA freelist_count").fetchone()
+    return (page_count - freelist) * page_size
+
+
+def apply_retention(conn, max_age_days=LOG_RETENTION_DAYS, max_mb=LOG_MAX_MB):
+    """
+    Удаляет записи старше max_age_days дней, затем самые старые записи, пока БД
+    не уложится в max_mb мегабайт, и возвращает освободившиеся страницы (incremental_vacuum).
+    Возвращает число удалённых записей.
+    """
+    removed = 0
+    if max_age_days:
+        cutoff = time.strftime(TIME_FORMAT, time.localtime(time.time() - max_age_days * 86400))
+        removed += conn.execute("DELETE FROM logs WHERE created < ?", (cutoff,)).rowcount
+
+    if max_mb:
+        max_bytes = max_mb * 1024 * 1024
+        while db_size_bytes(conn) > max_bytes:
+            (count,) = conn.execute("SELECT COUNT(*) FROM logs").fetchone()
+            if not count:
+                break
+            # Удаляем старейшие 10% записей за шаг
+            deleted = conn.execute(
+                "DELETE FROM logs WHERE id IN (SELECT id FROM logs ORDER BY id LIMIT ?)", (max(1, count // 10),)
+            ).rowcount
+            conn.execute("DELETE FROM payloads WHERE log_id NOT IN (SELECT id FROM logs)")
+            conn.commit()
+            removed += deleted
+
+    if removed:
+        conn.execute("DELETE FROM payloads WHERE log_id NOT IN (SELECT id FROM logs)")
+        conn.commit()
+        conn.execute("PRAGMA incremental_vacuum")
+    conn.commit()
+    return removed
+
+
+def _normalize_bound(value, end=False):
+    """'2025-03-01' → начало (или конец) дня в формате колонки created."""
+    if value and len(value) == 10:
+        return value + (" 23:59:59" if end else " 00:00:00")
+    return value
+
+
+def query_logs(conn, level=None, since=None, until=None, contains=None, limit=100, full=False):
+    """
+    Возвращает записи логов [{"id", "created", "level", "message"}] по фильтрам:
+    уровень, диапазон времени (включительно, "YYYY-MM-DD" или "YYYY-MM-DD HH:MM:SS")
+    и подстрока сообщения. Фильтры по времени и уровню используют индексы.
+    Подстрока ищется в полном тексте сообщения, в том числе сжатого (распаковывается только
+    у записей, прошедших остальные фильтры). full=True подставляет полный текст сжатых сообщений.
+    """
+    conditions = []
+    params = []
+    if level:
+        conditions.append("level = ?")
+        params.append(level.upper())
+    if since:
+        conditions.append("created >= ?")
+        params.append(_normalize_bound(since))
+    if until:
+        conditions.append("created <= ?")
+        params.append(_normalize_bound(until, end=True))
+
+    sql = "SELECT logs.id, created, level, message FROM logs"
+    if contains:
+        # У сжатых записей в message только превью — ищем в распакованном тексте
+        conn.create_function("unz", 1, _decompress_text, deterministic=True)
+        sql += " LEFT JOIN payloads ON payloads.log_id = logs.id"
+        conditions.append("instr(COALESCE(unz(payloads.data), message), ?) > 0")
+        params.append(contains)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY created DESC, logs.id DESC LIMIT ?"
+    params.append(limit)
+
+    records = [
+        {"id": row[0], "created": row[1], "level": row[2], "message": row[3]}
+        for row in conn.execute(sql, params)
+    ]
+    if full and records:
+        ids = [r["id"] for r in records]
+        payloads = dict(conn.execute(
+            f"SELECT log_id, data FROM payloads WHERE log_id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall())
+        for record in records:
+            if record["id"] in payloads:
+                record["message"] = _decompress_text(payloads[record["id"]])
+    return records
+
+
+def _decompress_text(data):
+    """Полный текст сжатого сообщения из payloads.data (None для записей без payload)."""
+    return None if data is None else zlib.decompress(data).decode("utf-8")
+
+
+def log_stats(conn):
+    """Сводка по хранилищу: число записей по уровням, диапазон времени, размер, сжатые сообщения."""
+    levels = dict(conn.execute("SELECT level, COUNT(*) FROM logs GROUP BY level").fetchall())
+    first, last = conn.execute("SELECT MIN(created), MAX(created) FROM logs").fetchone()
+    payload_count, payload_raw, payload_stored = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length(data)), 0) FROM payloads"
+    ).fetchone()
+    return {
+        "levels": levels,
+        "first": first,
+        "last": last,
+        "size_bytes": db_size_bytes(conn),
+        "payloads": payload_count,
+        "payload_raw_bytes": payload_raw,
+        "payload_stored_bytes": payload_stored,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Работа с хранилищем логов logs.db")
+    parser.add_argument("--db", default=DB_PATH, help="Путь к logs.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="Поиск записей лога")
+    query.add_argument("--level", help="Уровень: DEBUG, INFO, WARNING, ERROR")
+    query.add_argument("--since", help="Начало периода: YYYY-MM-DD или 'YYYY-MM-DD HH:MM:SS'")
+    query.add_argument("--until", help="Конец периода (включительно)")
+    query.add_argument("--contains", help="Подстрока сообщения")
+    query.add_argument("--limit", type=int, default=100, help="Максимум записей (по умолчанию 100)")
+    query.add_argument("--full", action="store_true", help="Показывать сжатые сообщения целиком")
+
+    prune = commands.add_parser("prune", help="Применить ретенцию")
+    prune.add_argument("--days", type=int, default=LOG_RETENTION_DAYS or PRUNE_DEFAULT_DAYS,
+                       help=f"Хранить записи не старше N дней (по умолчанию {PRUNE_DEFAULT_DAYS}, 0 — без ограничения)")
+    prune.add_argument("--max-mb", type=int, default=LOG_MAX_MB or PRUNE_DEFAULT_MAX_MB,
+                       help=f"Максимальный размер БД в МБ (по умолчанию {PRUNE_DEFAULT_MAX_MB}, 0 — без ограничения)")
+
+    commands.add_parser("stats", help="Сводка по хранилищу")
+
+    args = parser.parse_args(argv)
+    conn = connect(args.db)
+    try:
+        if args.command == "query":
+            records = query_logs(conn, args.level, args.since, args.until, args.contains, args.limit, args.full)
+            for record in reversed(records):
+                print(f"{record['created']} [{record['level']}] {record['message']}")
+            print(f"\nНайдено записей: {len(records)}")
+        elif args.command == "prune":
+            removed = apply_retention(conn, args.days, args.max_mb)
+            print(f"🧹 Удалено записей: {removed}, размер БД: {db_size_bytes(conn) / 1024 / 1024:.1f} МБ")
+        else:
+            stats = log_stats(conn)
+            print(f"Период: {stats['first']} — {stats['last']}")
+            print(f"Размер: {stats['size_bytes'] / 1024 / 1024:.1f} МБ")
+            for level, count in sorted(stats["levels"].items()):
+                print(f"  {level:<8} {count}")
+            print(f"Сжатых сообщений: {stats['payloads']} "
+                  f"({stats['payload_raw_bytes']} → {stats['payload_stored_bytes']} байт)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
+import atexit
 import logging
 import os
+import queue
 import sqlite3
+import threading
+import time
+from core.logging.log_store import DB_PATH, connect, insert_records, apply_retention
 
-DB_PATH = os.path.join(os.path.dirname(__file__), '../../logs.db')
+# Пакетная запись логов: сколько записей копить и как долго ждать перед записью в БД
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
 
 class SQLiteHandler(logging.Handler):
     """
@@ -50,6 +57,127 @@ class SQLiteHandler(logging.Handler):
         except Exception as e:
             self.handleError(record)  # Логируем ошибку обработки
 
+class BatchedSQLiteHandler(logging.Handler):
+    """
+    Асинхронный обработчик логов в SQLite.
+    emit() только форматирует запись и кладёт её в очередь в памяти;
+    фоновый поток держит одно долгоживущее соединение (WAL) и вставляет записи пачками —
+    как только набралось batch_size записей или прошло flush_interval секунд.
+    Большие сообщения сжимаются в таблицу payloads (см. log_store), при старте применяется ретенция.
+    При завершении процесса очередь дописывается (atexit).
+    """
+    _STOP = object()
+
+    def __init__(self, db_path=DB_PATH, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        super().__init__()
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._start_writer()
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            # В дочернем процессе после fork фонового потока нет — запускаем свой
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def _start_writer(self):
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._run, name="sqlite-log-writer", daemon=True)
+        self._writer.start()
+
+    def _restart_after_fork(self):
+        if not self._closed:
+            self._start_writer()
+
+    def emit(self, record):
+        """
+        Ставит лог в очередь на запись.
+        """
+        try:
+            msg = self.format(record)
+            if self.formatter:
+                created = self.formatter.formatTime(record, "%Y-%m-%d %H:%M:%S")
+            else:
+                created = record.created
+            self._queue.put((created, record.levelname, msg))
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        """Фоновый поток: собирает записи из очереди и пишет их пачками."""
+        conn = connect(self.db_path)
+        try:
+            # Ничего не удаляет, если ретенция не включена (LOG_RETENTION_DAYS / LOG_MAX_MB)
+            apply_retention(conn)
+        except Exception as e:
+            print(f"⚠ Ошибка очистки старых логов: {e}", flush=True)
+        batch = []
+        waiters = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            stop = item is self._STOP
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif callable(item):
+                # Запись других данных в ту же БД (например, спанов метрик) этим же соединением
+                try:
+                    item(conn)
+                    conn.commit()
+                except Exception as e:
+                    print(f"⚠ Ошибка фоновой записи в SQLite: {e}", flush=True)
+            elif item is not None and not stop:
+                batch.append(item)
+
+            if stop or waiters or len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    try:
+                        insert_records(conn, batch)
+                        conn.commit()
+                    except Exception as e:
+                        print(f"⚠ Ошибка записи логов в SQLite: {e}", flush=True)
+                    batch = []
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+                deadline = time.monotonic() + self.flush_interval
+
+            if stop:
+                break
+        conn.close()
+
+    def submit(self, write):
+        """
+        Ставит в очередь фонового потока запись write(conn) в ту же БД.
+        Возвращает False, если поток остановлен (тогда писать нужно самому).
+        """
+        if self._closed or not self._writer.is_alive():
+            return False
+        self._queue.put(write)
+        return True
+
+    def flush(self, timeout=10):
+        """Дожидается записи всех логов, поставленных в очередь до вызова."""
+        if self._closed or not self._writer.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Дописывает очередь и останавливает фоновый поток."""
+        if not self._closed:
+            self._closed = True
+            if self._writer.is_alive():
+                self._queue.put(self._STOP)
+                self._writer.join(timeout=30)
+        super().close()
+
 def setup_logging(level=logging.INFO):
     """
     Настройка логирования в SQLite.
@@ -59,16 +187,23 @@ def setup_logging(level=logging.INFO):
 
     # Удаляем старые хендлеры, чтобы не писать в файл
     while logger.handlers:
-        logger.handlers.pop()
+        logger.handlers.pop().close()
 
-    # Создаём новый SQLite-хендлер
-    sqlite_handler = SQLiteHandler(DB_PATH)
+    # Создаём новый SQLite-хендлер (пакетная запись в фоновом потоке)
+    sqlite_handler = BatchedSQLiteHandler(DB_PATH)
     formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S")
     sqlite_handler.setFormatter(formatter)  # ✅ Устанавливаем форматтер с временем
     logger.addHandler(sqlite_handler)
 
     logging.info("Логирование инициализировано (SQLite).")
 
+def get_writer():
+    """Обработчик BatchedSQLiteHandler корневого логгера (его фоновый поток пишет в logs.db) или None."""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, BatchedSQLiteHandler):
+            return handler
+    return None
+
 def log(message, level=logging.INFO):
     """
     Универсальный логгер.
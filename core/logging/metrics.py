@@ -0,0 +1,374 @@
+# core/logging/metrics.py
+"""
+Лёгкие спаны для замера этапов анализа: листинг, загрузка, декодирование, токенизация,
+подсчёт комментариев, запись отчётов, запросы к OpenAI.
+
+Спаны копятся в памяти и пачками пишутся в таблицу spans в logs.db (рядом с логами) —
+фоновым потоком записи логов (core.logging.logger.BatchedSQLiteHandler).
+Для сводок за запуск в памяти хранятся только агрегаты по этапам и репозиториям
+(число, сумма, байты, вызовы API) и ограниченная случайная выборка длительностей
+(reservoir sampling) для p50/p95, поэтому память не растёт с числом спанов.
+Точная сводка сохранённого запуска строится по таблице spans (load_rollup).
+Агрегаты хранятся отдельно для каждого запуска (start_run): текущий запуск передаётся через
+contextvars, поэтому несколько запусков в одном процессе (проекты одного задания) не смешиваются.
+Потоки, которые работают на запуск, должны получать контекст создавшего их кода
+(core.utils.concurrency.ordered_bounded_map и конвейер делают это сами).
+
+    with span("azure.get_item_zip", repository=name, api_call=True) as s:
+        archive = ...
+        s.bytes = len(archive)
+"""
+import atexit
+import contextvars
+import functools
+import math
+import random
+import threading
+import time
+import uuid
+from array import array
+from contextlib import contextmanager
+from core.logging import log_store
+from core.logging.logger import get_writer
+
+# Сколько спанов копить в памяти перед записью в БД
+SPAN_FLUSH_SIZE = 1000
+
+# Размер выборки длительностей для перцентилей: по этапу за запуск и по этапу репозитория
+SPAN_SAMPLE_SIZE = 1024
+SPAN_REPOSITORY_SAMPLE_SIZE = 64
+
+_lock = threading.Lock()
+_pending = []
+_random = random.Random()
+_runs = {}
+_default_run = None
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+_repository = contextvars.ContextVar("metrics_repository", default=None)
+
+
+class Span:
+    """Открытый спан: код внутри with может дописать скачанные байты."""
+    __slots__ = ("stage", "repository", "bytes", "api_calls")
+
+    def __init__(self, stage, repository, api_call):
+        self.stage = stage
+        self.repository = repository
+        self.bytes = 0
+        self.api_calls = 1 if api_call else 0
+
+
+class _StageAggregate:
+    """Накопленные замеры этапа: счётчики и выборка длительностей (reservoir sampling) для перцентилей."""
+    __slots__ = ("count", "total", "bytes", "api_calls", "sample", "capacity")
+
+    def __init__(self, capacity):
+        self.count = 0
+        self.total = 0.0
+        self.bytes = 0
+        self.api_calls = 0
+        self.sample = array("d")
+        self.capacity = capacity
+
+    def add(self, duration, bytes_count, api_calls):
+        self.count += 1
+        self.total += duration
+        self.bytes += bytes_count or 0
+        self.api_calls += api_calls or 0
+        if len(self.sample) < self.capacity:
+            self.sample.append(duration)
+        else:
+            index = _random.randrange(self.count)
+            if index < self.capacity:
+                self.sample[index] = duration
+
+    def summary(self):
+        values = sorted(self.sample)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "bytes": self.bytes,
+            "api_calls": self.api_calls,
+        }
+
+
+class _Run:
+    """Агрегаты одного запуска: по этапам, по этапам репозиториев и итоги по репозиториям."""
+    __slots__ = ("run_id", "stages", "repository_stages", "repositories")
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.stages = {}
+        self.repository_stages = {}
+        self.repositories = {}
+
+    def add(self, stage, duration, repository, bytes_count, api_calls):
+        aggregate = self.stages.get(stage)
+        if aggregate is None:
+            aggregate = self.stages[stage] = _StageAggregate(SPAN_SAMPLE_SIZE)
+        aggregate.add(duration, bytes_count, api_calls)
+        if repository is None:
+            return
+        key = (repository, stage)
+        aggregate = self.repository_stages.get(key)
+        if aggregate is None:
+            aggregate = self.repository_stages[key] = _StageAggregate(SPAN_REPOSITORY_SAMPLE_SIZE)
+        aggregate.add(duration, bytes_count, api_calls)
+        totals = self.repositories.setdefault(repository, {"bytes": 0, "api_calls": 0, "duration": 0.0})
+        totals["bytes"] += bytes_count or 0
+        totals["api_calls"] += api_calls or 0
+        if stage == "analyze_repository":
+            totals["duration"] += duration
+
+
+def _ensure_schema(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS spans(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT,
+        repository TEXT,
+        stage TEXT,
+        started REAL,
+        duration REAL,
+        bytes INTEGER,
+        api_calls INTEGER
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_run ON spans(run_id, repository)")
+    conn.commit()
+
+
+def start_run(run_id=None):
+    """
+    Начинает новый запуск в текущем контексте: последующие спаны этого контекста (и потоков,
+    получивших его копию) помечаются его идентификатором. Возвращает run_id.
+    run_id — продолжить существующий запуск под его идентификатором (агрегаты начинаются заново).
+    """
+    global _default_run
+    run = _Run(run_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6])
+    with _lock:
+        _runs[run.run_id] = run
+        _default_run = run
+    _current_run.set(run)
+    return run.run_id
+
+
+def finish_run(run_id):
+    """Освобождает агрегаты завершённого запуска (сводка по нему остаётся в таблице spans)."""
+    with _lock:
+        _runs.pop(run_id, None)
+
+
+def _active_run():
+    """
+    Запуск текущего контекста; для потоков без контекста запуска — последний начатый
+    (создаётся при первом обращении).
+    """
+    run = _current_run.get() or _default_run
+    if run is None:
+        start_run()
+        run = _current_run.get()
+    return run
+
+
+def current_run_id():
+    """Идентификатор текущего запуска (создаётся при первом обращении)."""
+    return _active_run().run_id
+
+
+@contextmanager
+def span(stage, repository=None, api_call=False):
+    """
+    Замеряет время блока как этап stage.
+    repository наследуется вложенными спанами того же потока, если не указан явно.
+    api_call=True — блок является одним вызовом внешнего API.
+    """
+    token = None
+    if repository is None:
+        repository = _repository.get()
+    else:
+        token = _repository.set(repository)
+    current = Span(stage, repository, api_call)
+    started = time.time()
+    clock = time.perf_counter()
+    try:
+        yield current
+    finally:
+        duration = time.perf_counter() - clock
+        if token is not None:
+            _repository.reset(token)
+        record(stage, duration, repository=current.repository, bytes_count=current.bytes,
+               api_calls=current.api_calls, started=started)
+
+
+def timed(stage, api_call=False):
+    """
+    Декоратор: оборачивает вызов в span(stage).
+    Для функций вида f(project_name, repository_name, ...) репозиторий берётся из второго аргумента.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            repository = args[1] if len(args) > 1 else kwargs.get("repository_name")
+            with span(stage, repository=repository if isinstance(repository, str) else None, api_call=api_call):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(stage, duration, repository=None, bytes_count=0, api_calls=0, started=None):
+    """Добавляет готовый замер (например, накопленный внутри цикла)."""
+    run = _active_run()
+    row = (run.run_id, repository, stage, started or time.time(), duration, bytes_count, api_calls)
+    with _lock:
+        _pending.append(row)
+        run.add(stage, duration, repository, bytes_count, api_calls)
+        should_flush = len(_pending) >= SPAN_FLUSH_SIZE
+    if should_flush:
+        flush(wait=False)
+
+
+def flush(db_path=None, wait=True):
+    """
+    Записывает накопленные спаны в таблицу spans. Запись выполняет фоновый поток логов
+    (тем же соединением, что и логи), а не поток, накопивший спаны; wait=True — дождаться записи.
+    db_path — писать в указанную БД напрямую.
+    """
+    with _lock:
+        rows = _pending[:]
+        _pending.clear()
+    if not rows:
+        return
+    writer = get_writer() if db_path is None else None
+    if writer is not None and writer.submit(lambda conn: _insert_spans(conn, rows)):
+        if wait:
+            writer.flush()
+        return
+    try:
+        conn = log_store.connect(db_path or log_store.DB_PATH)
+        try:
+            _insert_spans(conn, rows)
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"⚠ Ошибка записи метрик: {e}", flush=True)
+
+
+def _insert_spans(conn, rows):
+    _ensure_schema(conn)
+    conn.executemany(
+        "INSERT INTO spans(run_id, repository, stage, started, duration, bytes, api_calls) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+    )
+
+
+atexit.register(flush)
+
+
+def _percentile(sorted_values, q):
+    """Перцентиль по методу ближайшего ранга."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def rollup(rows):
+    """
+    Сводка по этапам из строк (run_id, repository, stage, started, duration, bytes, api_calls):
+    {stage: {"count", "total", "p50", "p95", "bytes", "api_calls"}}.
+    """
+    durations = {}
+    totals = {}
+    for _, _, stage, _, duration, bytes_count, api_calls in rows:
+        durations.setdefault(stage, []).append(duration)
+        stage_totals = totals.setdefault(stage, [0, 0])
+        stage_totals[0] += bytes_count or 0
+        stage_totals[1] += api_calls or 0
+
+    result = {}
+    for stage, values in durations.items():
+        values.sort()
+        result[stage] = {
+            "count": len(values),
+            "total": sum(values),
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "bytes": totals[stage][0],
+            "api_calls": totals[stage][1],
+        }
+    return result
+
+
+def _run_for(run_id):
+    if run_id is None:
+        return _active_run()
+    return _runs.get(run_id) or _Run(run_id)
+
+
+def run_rollup(repository=None, run_id=None):
+    """
+    Сводка по этапам запуска run_id (по умолчанию текущего; при repository — только по этому репозиторию),
+    в формате rollup(). Счётчики точные, p50/p95 — по выборке не больше SPAN_SAMPLE_SIZE
+    (SPAN_REPOSITORY_SAMPLE_SIZE) замеров.
+    """
+    with _lock:
+        run = _run_for(run_id)
+        if repository is None:
+            return {stage: aggregate.summary() for stage, aggregate in run.stages.items()}
+        return {
+            stage: aggregate.summary()
+            for (name, stage), aggregate in run.repository_stages.items() if name == repository
+        }
+
+
+def repository_totals(run_id=None):
+    """
+    Итоги запуска run_id (по умолчанию текущего) по репозиториям: {repository: {"bytes", "api_calls", "duration"}},
+    где duration — время спана analyze_repository.
+    """
+    with _lock:
+        return {repository: dict(totals) for repository, totals in _run_for(run_id).repositories.items()}
+
+
+def load_rollup(run_id, repository=None, db_path=None):
+    """Сводка по этапам сохранённого запуска из таблицы spans."""
+    conn = log_store.connect(db_path or log_store.DB_PATH)
+    try:
+        _ensure_schema(conn)
+        sql = "SELECT run_id, repository, stage, started, duration, bytes, api_calls FROM spans WHERE run_id = ?"
+        params = [run_id]
+        if repository is not None:
+            sql += " AND repository = ?"
+            params.append(repository)
+        return rollup(conn.execute(sql, params).fetchall())
+    finally:
+        conn.close()
+
+
+def format_bytes(n):
+    """Человекочитаемый размер: 1536 → '1.5 КБ'."""
+    if n < 1024:
+        return f"{n} Б"
+    for unit in ("КБ", "МБ"):
+        n /= 1024
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+    return f"{n / 1024:.1f} ГБ"
+
+
+def format_rollup(stages):
+    """Форматирует сводку по этапам в текстовую таблицу (этапы по убыванию суммарного времени)."""
+    lines = [
+        f"{'Этап':<28} {'вызовов':>8} {'всего, с':>10} {'p50, мс':>10} {'p95, мс':>10} {'байт':>10} {'API':>6}",
+        "-" * 88,
+    ]
+    for stage, s in sorted(stages.items(), key=lambda item: item[1]["total"], reverse=True):
+        lines.append(
+            f"{stage:<28} {s['count']:>8} {s['total']:>10.2f} {s['p50'] * 1000:>10.1f} {s['p95'] * 1000:>10.1f} "
+            f"{format_bytes(s['bytes']):>10} {s['api_calls']:>6}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,149 @@
+# core/reports/artifacts.py
+"""
+Повторное использование отчётов репозиториев между запусками.
+
+Отчёт быстрого анализа полностью определяется проанализированным состоянием репозитория:
+коммитом, по которому посчитаны метрики в кэше, итогом токенов и настройками, от которых зависит
+содержимое отчёта (белый список расширений, версия формата). Ключ состояния — report_key.
+Готовый отчёт сохраняется в хранилище артефактов в папке кэша (cache/reports/<ключ>.txt) жёсткой
+ссылкой, без копирования. Если у репозитория, взятого из кэша, ключ не изменился, отчёт
+не генерируется заново: в папку отчётов запуска добавляется жёсткая ссылка на сохранённый файл
+(или его копия, если файловая система не поддерживает ссылки).
+Какие отчёты запуска взяты из хранилища, записывается в манифест запуска (write_run_manifest).
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from core.logging.logger import log
+from core.reports.generate import REPORTS_DIR, REPORT_FORMAT_VERSION, new_report_path
+from core.utils import cache
+from core.utils.atomic_io import atomic_write
+from core.utils.token_counter import WHITE_EXTENSIONS
+
+REPORT_ARTIFACTS_SUBDIR = "reports"
+
+
+def report_config_hash():
+    """Хэш настроек, от которых зависит содержимое отчёта."""
+    config = {
+        "format": REPORT_FORMAT_VERSION,
+        "extensions": sorted(extension for extension in WHITE_EXTENSIONS if extension),
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def report_key(project_name, repository_name, commit_id, total_tokens):
+    """
+    Ключ проанализированного состояния репозитория (sha256).
+    None, если коммит неизвестен — тогда состояние нельзя назвать однозначно и отчёт не переиспользуется.
+    """
+    if not commit_id:
+        return None
+    state = [project_name, repository_name, commit_id, total_tokens, report_config_hash()]
+    return hashlib.sha256(json.dumps(state, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def artifact_path(key):
+    """Путь отчёта с ключом key в хранилище артефактов."""
+    return os.path.join(cache.CACHE_DIR, REPORT_ARTIFACTS_SUBDIR, key[:2], f"{key}.txt")
+
+
+def _link(source, target):
+    """Атомарно помещает в target жёсткую ссылку на source (или копию, если ссылки не поддерживаются)."""
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            if not os.path.exists(source):
+                raise
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def store_report(key, report_path):
+    """Сохраняет готовый отчёт в хранилище под ключом key. Возвращает путь артефакта или None."""
+    if not key or not report_path:
+        return None
+    target = artifact_path(key)
+    try:
+        _link(report_path, target)
+    except OSError as e:
+        log(f"⚠ Не удалось сохранить отчёт {report_path} для повторного использования: {e}", level="WARNING")
+        return None
+    return target
+
+
+def reuse_report(project_name, repository_name, key):
+    """
+    Отчёт из хранилища для состояния key в папке отчётов запуска.
+    Возвращает абсолютный путь нового отчёта или None, если сохранённого отчёта нет.
+    """
+    if not key:
+        return None
+    source = artifact_path(key)
+    if not os.path.exists(source):
+        return None
+    report_path = new_report_path(project_name, repository_name)
+    try:
+        _link(source, report_path)
+    except OSError as e:
+        log(f"⚠ Не удалось взять сохранённый отчёт {repository_name}: {e}", level="WARNING")
+        return None
+    return os.path.abspath(report_path)
+
+
+def report_for_state(project_name, repository_name, key, render):
+    """
+    Отчёт для состояния key: сохранённый, если он есть, иначе render() с сохранением результата.
+    Возвращает {"report_path", "report_artifact", "report_reused"}; report_path None — отчёт не создан.
+    """
+    report_path = reuse_report(project_name, repository_name, key)
+    if report_path:
+        return {"report_path": report_path, "report_artifact": artifact_path(key), "report_reused": True}
+    report_path = render()
+    return {"report_path": report_path, "report_artifact": store_report(key, report_path), "report_reused": False}
+
+
+def manifest_path(project_name, run_id):
+    return os.path.join(REPORTS_DIR, project_name, f"manifest_{run_id}.json")
+
+
+def write_run_manifest(project_name, run_id, results, summary_path=None):
+    """
+    Манифест запуска: какие отчёты репозиториев в нём созданы, какие взяты из хранилища
+    и на какие артефакты они ссылаются. Возвращает путь манифеста.
+    """
+    reports = [
+        {
+            "repository": result["repository"],
+            "report_path": result.get("report_path"),
+            "artifact": result.get("report_artifact"),
+            "reused": bool(result.get("report_reused")),
+            "cached": bool(result.get("cached")),
+        }
+        for result in results
+    ]
+    manifest = {
+        "run_id": run_id,
+        "project": project_name,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "summary_path": summary_path,
+        "reused": sum(1 for report in reports if report["reused"]),
+        "reports": reports,
+    }
+    path = manifest_path(project_name, run_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_write(path) as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    log(f"🧾 Манифест запуска {run_id} сохранён: {path} "
+        f"(отчётов из хранилища: {manifest['reused']} из {len(reports)})")
+    return path
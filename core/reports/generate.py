@@ -1,6 +1,22 @@
 import os
 from datetime import datetime
+from core.logging.metrics import timed
+from core.utils.atomic_io import atomic_write
 
+REPORTS_DIR = "reports"
+
+# Версия формата отчёта: входит в ключ повторно используемых отчётов (core.reports.artifacts),
+# при изменении формата ранее сохранённые отчёты не используются
+REPORT_FORMAT_VERSION = 1
+
+def new_report_path(project_name, repository_name):
+    """Путь нового отчёта репозитория с отметкой времени; папка создаётся."""
+    report_folder = os.path.join(REPORTS_DIR, project_name, repository_name)
+    os.makedirs(report_folder, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+    return os.path.join(report_folder, f"report_{repository_name}_{timestamp}.txt")
+
+@timed("report")
 def generate_report(project_name, repository_name, files_data):
     """
     Генерирует отчёт о быстром анализе репозитория.
@@ -28,12 +44,7 @@ def generate_report(project_name, repository_name, files_data):
     🏷 Всего токенов: <total_tokens>
     ====================================================================================
     """
-    reports_dir = "reports"
-    report_folder = os.path.join(reports_dir, project_name, repository_name)
-    os.makedirs(report_folder, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
-    report_filename = f"report_{repository_name}_{timestamp}.txt"
-    report_path = os.path.join(report_folder, report_filename)
+    report_path = new_report_path(project_name, repository_name)
     
     # Группируем файлы по папке. Предполагаем, что файлы в files_data – словари с ключами:
     # "path" (или "file_name"), "lines", "comments", "tokens", "role"
@@ -107,7 +118,9 @@ def generate_report(project_name, repository_name, files_data):
     
     full_report = header + group_texts + summary
     
-    with open(report_path, "w", encoding="utf-8") as f:
+    # Через временный файл: отчёт с тем же именем может быть жёсткой ссылкой на сохранённый отчёт,
+    # который нельзя перезаписывать на месте
+    with atomic_write(report_path) as f:
         f.write(full_report)
     
     return os.path.abspath(report_path)
@@ -1,5 +1,6 @@
 import os
 import json  # Для отладки
+from core.utils.file_metrics import FileMetrics
 
 def format_repository_report(project_name, repository_name, files_data):
     """
@@ -80,24 +81,36 @@ def format_repository_report(project_name, repository_name, files_data):
 
     return "\n".join(report_lines)
 
+def summarize_repository(repo):
+    """
+    Итоги репозитория за один проход по его файлам: {"files", "lines", "comments", "tokens"}.
+    Если анализ уже посчитал итоги потоково (repo["totals"]), файлы не перебираются;
+    у колоночной таблицы FileMetrics итоги считаются по столбцам.
+    """
+    if repo.get("totals"):
+        return repo["totals"]
+    if isinstance(repo.get("files"), FileMetrics):
+        return repo["files"].totals()
+    totals = {"files": 0, "lines": 0, "comments": 0, "tokens": 0}
+    for file in repo.get("files", []):
+        totals["files"] += 1
+        totals["lines"] += file.get("lines", 0)
+        totals["comments"] += file.get("comments", 0)
+        totals["tokens"] += file.get("tokens", 0)
+    return totals
+
 def format_project_summary(project_name, repositories_reports):
     """
     Форматирует сводный отчёт по проекту.
     """
+    repositories_reports = [repo for repo in repositories_reports if isinstance(repo, dict)]
+    repo_totals = [summarize_repository(repo) for repo in repositories_reports]
+
     # Суммы
-    total_files = sum(len(repo.get("files", [])) for repo in repositories_reports if isinstance(repo, dict))
-    total_lines = sum(
-        sum(file.get("lines", 0) for file in repo.get("files", []))
-        for repo in repositories_reports if isinstance(repo, dict)
-    )
-    total_comments = sum(
-        sum(file.get("comments", 0) for file in repo.get("files", []))
-        for repo in repositories_reports if isinstance(repo, dict)
-    )
-    total_tokens = sum(
-        sum(file.get("tokens", 0) for file in repo.get("files", []))
-        for repo in repositories_reports if isinstance(repo, dict)
-    )
+    total_files = sum(t["files"] for t in repo_totals)
+    total_lines = sum(t["lines"] for t in repo_totals)
+    total_comments = sum(t["comments"] for t in repo_totals)
+    total_tokens = sum(t["tokens"] for t in repo_totals)
 
     # Форматируем с пробелами
     total_files_str = f"{total_files:,}".replace(",", " ")
@@ -117,11 +130,9 @@ def format_project_summary(project_name, repositories_reports):
         "\n📂 Анализированные репозитории:\n"
     ]
 
-    for idx, repo in enumerate(repositories_reports, start=1):
-        if not isinstance(repo, dict):
-            continue
-        repo_tokens = sum(file.get("tokens", 0) for file in repo.get("files", []))
-        repo_lines = sum(file.get("lines", 0) for file in repo.get("files", []))
+    for idx, (repo, totals) in enumerate(zip(repositories_reports, repo_totals), start=1):
+        repo_tokens = totals["tokens"]
+        repo_lines = totals["lines"]
 
         repo_tokens_str = f"{repo_tokens:,}".replace(",", " ")
         repo_lines_str = f"{repo_lines:,}".replace(",", " ")
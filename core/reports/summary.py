@@ -1,6 +1,6 @@
 import os
 from datetime import datetime
-from core.reports.report_formatter import format_project_summary
+from core.reports.report_formatter import format_project_summary, summarize_repository
 from core.logging.logger import log
 
 REPORTS_DIR = "reports"
@@ -12,20 +12,17 @@ def generate_summary(project_name, repositories_reports):
     """
     log(f"📄 Генерация сводного отчёта для проекта {project_name}...")
 
-    if not repositories_reports or not isinstance(repositories_reports, list):
+    if repositories_reports is not None and not isinstance(repositories_reports, list):
+        repositories_reports = list(repositories_reports)
+    if not repositories_reports:
         log(f"⚠ Ошибка! Нет данных для сводного отчёта {project_name}.", level="ERROR")
         return None
 
     try:
-        total_files = sum(len(repo.get("files", [])) for repo in repositories_reports if isinstance(repo, dict))
-        total_lines = sum(sum(file.get("lines", 0) for file in repo.get("files", [])) for repo in repositories_reports if isinstance(repo, dict))
-        total_comments = sum(sum(file.get("comments", 0) for file in repo.get("files", [])) for repo in repositories_reports if isinstance(repo, dict))
-        total_tokens = sum(sum(file.get("tokens", 0) for file in repo.get("files", [])) for repo in repositories_reports if isinstance(repo, dict))
-
         # Обновляем repo["tokens"] для каждого репо (чтобы в отчёте были актуальные)
         for repo in repositories_reports:
             if isinstance(repo, dict):
-                repo["tokens"] = sum(file.get("tokens", 0) for file in repo.get("files", []))
+                repo["tokens"] = summarize_repository(repo)["tokens"]
 
     except Exception as e:
         log(f"❌ Ошибка при обработке данных в generate_summary(): {e}", level="ERROR")
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from core.utils import cache
+
+AI_CACHE_FILENAME = "ai_responses.db"
+
+# Оценка байт на запись сверх ключа и текста ответа (числа и служебные данные SQLite)
+AI_CACHE_ROW_OVERHEAD = 40
+
+
+def response_key(model, prompt):
+    """Ключ ответа: sha256 от модели и полного текста промпта (в промпт входит содержимое файла)."""
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class AIResponseCache:
+    """
+    Постоянное хранилище ответов OpenAI: повторный запрос с тем же промптом к той же модели
+    (тот же файл в другом репозитории или при следующем запуске) не оплачивается заново.
+    Хранится в SQLite (WAL), безопасно используется из нескольких потоков и процессов.
+    Объём и срок жизни записей ограничивает core.utils.cache_manager.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses(
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            response TEXT,
+            created REAL,
+            last_used REAL
+        )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Текст ответа или None; найденная запись отмечается как недавно использованная."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses(key, model, response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self._conn.commit()
+
+    def usage(self):
+        """{"entries": число ответов, "bytes": оценка их размера}."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(key) + LENGTH(CAST(response AS BLOB))), 0) "
+                f"+ COUNT(*) * {AI_CACHE_ROW_OVERHEAD} FROM responses"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def iter_lru(self, batch=1000):
+        """Ответы от давно не использованных к недавним: (last_used, key, байт)."""
+        position = (-1.0, "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT last_used, key, LENGTH(key) + LENGTH(CAST(response AS BLOB)) + {AI_CACHE_ROW_OVERHEAD} "
+                    "FROM responses WHERE (last_used, key) > (?, ?) ORDER BY last_used, key LIMIT ?",
+                    (*position, batch)
+                ).fetchall()
+            yield from rows
+            if len(rows) < batch:
+                return
+            position = rows[-1][:2]
+
+    def expire(self, cutoff):
+        """Удаляет ответы, к которым не обращались с момента cutoff (time.time()). Возвращает их число."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM responses WHERE last_used < ?", (cutoff,)).rowcount
+            self._conn.commit()
+            self.evictions += removed
+        return removed
+
+    def evict(self, keys):
+        """Удаляет ответы с ключами keys. Возвращает их число."""
+        keys = list(keys)
+        with self._lock:
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in keys])
+            self._conn.commit()
+            self.evictions += len(keys)
+        return len(keys)
+
+    def stats(self):
+        """Возвращает счётчики попаданий, промахов и вытеснений за время жизни объекта."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_ai_cache = None
+_ai_cache_lock = threading.Lock()
+
+
+def get_ai_cache():
+    """Возвращает общий для процесса кэш ответов OpenAI (ai_responses.db в папке кэша)."""
+    global _ai_cache
+    with _ai_cache_lock:
+        db_path = os.path.join(cache.CACHE_DIR, AI_CACHE_FILENAME)
+        if _ai_cache is None or _ai_cache.db_path != db_path:
+            os.makedirs(cache.CACHE_DIR, exist_ok=True)
+            _ai_cache = AIResponseCache(db_path)
+        return _ai_cache
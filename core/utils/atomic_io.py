@@ -0,0 +1,100 @@
+# core/utils/atomic_io.py
+"""
+Безопасная запись файлов кэша при параллельной работе потоков и процессов:
+  atomic_write — запись во временный файл рядом с целевым и атомарная подмена (os.replace),
+                 читатель видит либо старый файл, либо новый целиком;
+  file_lock    — межпроцессная эксклюзивная блокировка (fcntl.flock / msvcrt.locking)
+                 для операций чтение-изменение-запись;
+  quarantine   — переименование повреждённого файла в сторону, чтобы он был пересоздан.
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from core.logging.logger import log
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_POLL_INTERVAL = 0.05
+
+# umask процесса читается один раз при импорте: os.umask меняет её для всех потоков
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_write(path, mode="w", encoding="utf-8"):
+    """
+    Открывает временный файл в папке path для записи; по выходу из блока без ошибок
+    данные сбрасываются на диск и файл атомарно заменяет path. При ошибке временный файл удаляется.
+    Права файла — как у заменяемого, а у нового файла — как у обычного open() (0o666 с учётом umask),
+    а не 0o600 временного файла mkstemp.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _target_mode(path):
+    """Права для файла path: права существующего файла или 0o666 с учётом umask."""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Эксклюзивная блокировка ресурса path между процессами (и потоками) на время блока.
+    Блокируется служебный файл path + ".lock"; он остаётся на диске.
+    """
+    with open(path + ".lock", "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def quarantine(path, reason=""):
+    """
+    Убирает повреждённый файл в сторону (path.corrupt-<время>) и возвращает новый путь,
+    или None, если файла нет.
+    """
+    if not os.path.exists(path):
+        return None
+    target = f"{path}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+    try:
+        os.replace(path, target)
+    except FileNotFoundError:
+        return None  # Уже убран другим процессом
+    log(f"🩹 Повреждённый файл {path} перемещён в {target}" + (f": {reason}" if reason else ""), level="WARNING")
+    return target
@@ -1,133 +1,891 @@
+import argparse
 import json
 import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from core.logging.logger import log
+from core.utils.atomic_io import file_lock, quarantine
 
 CACHE_DIR = "cache"
 
+CACHE_DB_FILENAME = "cache.db"
+
+# Сколько секунд процесс ждёт, пока другой процесс допишет свою транзакцию в cache.db
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", "60"))
+
+# Незавершённые поколения старше этого срока (секунды) считаются брошенными (check --repair)
+CACHE_ORPHAN_AGE = int(os.getenv("CACHE_ORPHAN_AGE", str(24 * 3600)))
+
+# Как часто (секунды) обновлять время последнего обращения к записи кэша (last_used):
+# чтение записи, к которой обращались недавно, ничего не пишет в БД
+CACHE_TOUCH_INTERVAL = int(os.getenv("CACHE_TOUCH_INTERVAL", "3600"))
+
+# Сколько записей файлов RepoCacheWriter копит перед записью в БД
+CACHE_WRITE_BATCH = 500
+
+# Поля записи файла, хранящиеся в отдельных столбцах; остальные — в extra (JSON)
+_FILE_COLUMNS = ("path", "object_id", "tokens", "lines", "comments")
+
+# Оценка байт на запись файла сверх текстовых полей (числа, ключи, служебные данные SQLite)
+CACHE_FILE_ROW_OVERHEAD = 48
+
+# Выражение оценки размера строки files в байтах (см. repos.bytes)
+_FILE_ROW_BYTES = f"LENGTH(path) + COALESCE(LENGTH(object_id), 0) + COALESCE(LENGTH(extra), 0) + {CACHE_FILE_ROW_OVERHEAD}"
+
+
 def get_cache_path(project_name, repository_name=None):
     """
-    Возвращает путь к файлу кэша.
-    Если repository_name не указано, считается, что мы хотим сохранить сводный кэш по всему проекту.
+    Возвращает путь к JSON-файлу кэша прежнего формата (до перехода на cache.db).
+    Нужен для миграции и удаления старых файлов.
+    Если repository_name не указано, это сводный кэш по всему проекту.
     """
     os.makedirs(CACHE_DIR, exist_ok=True)
     if repository_name:
         return os.path.join(CACHE_DIR, f"{project_name}_{repository_name}.json")
     return os.path.join(CACHE_DIR, f"{project_name}_summary.json")
 
-def load_cache(project_name, repository_name=None):
-    """Загружает данные из кэша (json)."""
-    cache_file = get_cache_path(project_name, repository_name)
-    if not os.path.exists(cache_file):
+
+class CacheDB:
+    """
+    Кэш анализа репозиториев в SQLite (cache.db в папке кэша):
+      repos — по репозиторию: анализированный коммит, total_tokens и агрегаты по файлам;
+      files — по файлу (project, repository, path): objectId и метрики;
+      heads — head-коммиты, на которых репозитории анализировались в последний раз.
+    Записи файлов относятся к поколению (generation): RepoCacheWriter пишет новое поколение
+    рядом со старым и переключает repos.generation по завершении, поэтому читатели
+    до этого момента видят прежний кэш целиком.
+    Одно соединение на процесс, доступ из потоков — под блокировкой. Каждая запись — отдельная
+    транзакция BEGIN IMMEDIATE, поэтому несколько процессов могут писать в одну БД
+    (WAL, ожидание блокировки до CACHE_LOCK_TIMEOUT секунд).
+    Файл, который не открывается как БД SQLite, убирается в сторону и создаётся заново;
+    записи репозитория, не согласованные с агрегатами, удаляются при чтении (см. check).
+    Для менеджера кэша (core.utils.cache_manager) ведутся оценка размера репозитория (repos.bytes),
+    время последнего обращения (repos.last_used) и счётчики попаданий, промахов и вытеснений.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Имена JSON-файлов прежнего формата, проект и репозиторий которых по имени не определить однозначно;
+        # переносятся при первом обращении к репозиторию (migrate_legacy_repo)
+        self.legacy_files = set()
+        self._lock = threading.Lock()
+        try:
+            self._conn = self._connect()
+        except sqlite3.OperationalError:
+            raise  # БД занята или недоступна — это не повреждение
+        except sqlite3.DatabaseError as e:
+            self._quarantine(str(e))
+            self._conn = self._connect()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=CACHE_LOCK_TIMEOUT, check_same_thread=False,
+                               isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS repos(
+                project TEXT,
+                repository TEXT,
+                generation INTEGER,
+                commit_id TEXT,
+                total_tokens INTEGER,
+                files INTEGER,
+                tokens INTEGER,
+                lines INTEGER,
+                comments INTEGER,
+                updated REAL,
+                bytes INTEGER,
+                last_used REAL,
+                PRIMARY KEY(project, repository)
+            );
+            CREATE TABLE IF NOT EXISTS files(
+                project TEXT,
+                repository TEXT,
+                generation INTEGER,
+                path TEXT,
+                seq INTEGER,
+                object_id TEXT,
+                tokens INTEGER,
+                lines INTEGER,
+                comments INTEGER,
+                extra TEXT,
+                PRIMARY KEY(project, repository, generation, path)
+            );
+            CREATE TABLE IF NOT EXISTS heads(
+                project TEXT,
+                repository TEXT,
+                commit_id TEXT,
+                PRIMARY KEY(project, repository)
+            );
+            """)
+            self._add_usage_columns(conn)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    def _add_usage_columns(conn):
+        """Добавляет bytes и last_used в repos, созданную до их появления, и заполняет их."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(repos)")}
+        if {"bytes", "last_used"} <= columns:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(repos)")}
+            if "bytes" not in columns:
+                conn.execute("ALTER TABLE repos ADD COLUMN bytes INTEGER")
+                conn.execute(f"""
+                UPDATE repos SET bytes = (
+                    SELECT COALESCE(SUM({_FILE_ROW_BYTES}), 0) FROM files f
+                    WHERE f.project = repos.project AND f.repository = repos.repository
+                      AND f.generation = repos.generation
+                )""")
+            if "last_used" not in columns:
+                conn.execute("ALTER TABLE repos ADD COLUMN last_used REAL")
+                conn.execute("UPDATE repos SET last_used = updated")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _quarantine(self, reason):
+        """Убирает повреждённый файл БД (вместе с -wal и -shm) в сторону."""
+        for suffix in ("", "-wal", "-shm"):
+            quarantine(self.db_path + suffix, reason if not suffix else "")
+
+    @contextmanager
+    def _write(self):
+        """Транзакция записи: BEGIN IMMEDIATE сразу берёт блокировку записи БД у других процессов."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @contextmanager
+    def _read(self):
+        """Транзакция чтения: несколько запросов видят один и тот же снимок БД."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+            finally:
+                self._conn.execute("ROLLBACK")
+
+    # --- репозитории и файлы ---
+
+    def repo_info(self, project_name, repository_name):
+        """Строка repos репозитория как словарь или None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generation, commit_id, total_tokens, files, tokens, lines, comments, updated "
+                "FROM repos WHERE project = ? AND repository = ?", (project_name, repository_name)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("generation", "commit_id", "total_tokens", "files", "tokens", "lines", "comments", "updated")
+        return dict(zip(keys, row))
+
+    def project_totals(self, project_name):
+        """{репозиторий: агрегаты} по всем закэшированным репозиториям проекта."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT repository, commit_id, total_tokens, files, tokens, lines, comments "
+                "FROM repos WHERE project = ?", (project_name,)
+            ).fetchall()
+        keys = ("commit_id", "total_tokens", "files", "tokens", "lines", "comments")
+        return {row[0]: dict(zip(keys, row[1:])) for row in rows}
+
+    def load_repo(self, project_name, repository_name):
+        """
+        Кэш репозитория одним снимком: ({"commit_id", "total_tokens"}, записи файлов в порядке записи)
+        или None, если кэша нет (или он оказался повреждён).
+        """
+        found = self._current_files(
+            project_name, repository_name, "path, object_id, tokens, lines, comments, extra", "ORDER BY seq"
+        )
+        if found is None:
+            return None
+        info, rows = found
+        try:
+            return info, [_row_to_record(row) for row in rows]
+        except ValueError as e:
+            self._drop_corrupt(project_name, repository_name, f"повреждены поля записи файла: {e}")
+            return None
+
+    def iter_files(self, project_name, repository_name):
+        """Записи файлов текущего поколения репозитория в порядке записи."""
+        found = self.load_repo(project_name, repository_name)
+        return [] if found is None else found[1]
+
+    def object_ids(self, project_name, repository_name):
+        """{path: objectId} текущего поколения или None, если репозиторий не закэширован."""
+        found = self._current_files(project_name, repository_name, "path, object_id")
+        return None if found is None else dict(found[1])
+
+    def _current_files(self, project_name, repository_name, columns, order=""):
+        """
+        ({"commit_id", "total_tokens"}, строки files текущего поколения) одним снимком
+        или None, если кэша нет; обращение учитывается в счётчиках попаданий и промахов.
+        repos.last_used обновляется, только если он старше CACHE_TOUCH_INTERVAL.
+        Если число строк не совпадает с repos.files, кэш репозитория повреждён: он удаляется
+        и возвращается None — репозиторий будет проанализирован заново.
+        """
+        try:
+            with self._read() as conn:
+                info = conn.execute(
+                    "SELECT generation, files, commit_id, total_tokens, last_used FROM repos "
+                    "WHERE project = ? AND repository = ?",
+                    (project_name, repository_name)
+                ).fetchone()
+                rows = info and conn.execute(
+                    f"SELECT {columns} FROM files WHERE project = ? AND repository = ? AND generation = ? {order}",
+                    (project_name, repository_name, info[0])
+                ).fetchall()
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.DatabaseError as e:
+            log(f"⚠ Ошибка чтения кэша {project_name}/{repository_name}: {e}. "
+                f"Проверьте БД: python -m core.utils.cache check --repair", level="ERROR")
+            info = rows = None
+        if info is not None and len(rows) != info[1]:
+            self._drop_corrupt(project_name, repository_name,
+                               f"в кэше {len(rows)} файлов вместо {info[1]}")
+            info = None
+        if info is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        now = time.time()
+        if info[4] is None or now - info[4] >= CACHE_TOUCH_INTERVAL:
+            with self._write() as conn:
+                conn.execute("UPDATE repos SET last_used = ? WHERE project = ? AND repository = ?",
+                             (now, project_name, repository_name))
+                self.hits += 1
+        else:
+            with self._lock:
+                self.hits += 1
+        return {"commit_id": info[2], "total_tokens": info[3]}, rows
+
+    def _drop_corrupt(self, project_name, repository_name, reason):
+        log(f"🩹 Кэш {project_name}/{repository_name} повреждён ({reason}) и будет пересоздан", level="WARNING")
+        self.delete_repo(project_name, repository_name)
+
+    def insert_files(self, project_name, repository_name, generation, records, first_seq):
+        """Добавляет записи файлов в поколение generation (seq — порядок, начиная с first_seq)."""
+        rows = [
+            (project_name, repository_name, generation, seq, *_record_to_row(record))
+            for seq, record in enumerate(records, start=first_seq)
+        ]
+        with self._write() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO files(project, repository, generation, seq, path, object_id, tokens, "
+                "lines, comments, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def commit_generation(self, project_name, repository_name, generation, total_tokens=None, commit_id=None):
+        """
+        Делает поколение generation текущим: пересчитывает агрегаты, удаляет записи прежнего
+        текущего поколения. Поколения, которые в это время пишут другие процессы, не затрагиваются:
+        из нескольких одновременных записей репозитория остаётся последняя завершённая.
+        total_tokens=None — сумма токенов файлов.
+        """
+        with self._write() as conn:
+            row = conn.execute(
+                "SELECT generation FROM repos WHERE project = ? AND repository = ?", (project_name, repository_name)
+            ).fetchone()
+            self._update_repo(conn, project_name, repository_name, generation, total_tokens, commit_id)
+            if row is not None and row[0] != generation:
+                conn.execute(
+                    "DELETE FROM files WHERE project = ? AND repository = ? AND generation = ?",
+                    (project_name, repository_name, row[0])
+                )
+
+    def drop_generation(self, project_name, repository_name, generation):
+        """Удаляет записи незавершённого поколения."""
+        with self._write() as conn:
+            conn.execute(
+                "DELETE FROM files WHERE project = ? AND repository = ? AND generation = ?",
+                (project_name, repository_name, generation)
+            )
+
+    def update_files(self, project_name, repository_name, upserts=(), deleted=(), commit_id=None):
+        """
+        Точечно обновляет текущее поколение: upserts — записи файлов (новые или изменённые),
+        deleted — пути удалённых файлов. Агрегаты репозитория пересчитываются.
+        Возвращает False, если репозиторий ещё не закэширован.
+        """
+        upserts = list(upserts)
+        with self._write() as conn:
+            row = conn.execute(
+                "SELECT generation FROM repos WHERE project = ? AND repository = ?", (project_name, repository_name)
+            ).fetchone()
+            if row is None:
+                return False
+            generation = row[0]
+            conn.executemany(
+                "DELETE FROM files WHERE project = ? AND repository = ? AND generation = ? AND path = ?",
+                [(project_name, repository_name, generation, path) for path in deleted]
+            )
+            seqs = dict(conn.execute(
+                "SELECT path, seq FROM files WHERE project = ? AND repository = ? AND generation = ?",
+                (project_name, repository_name, generation)
+            ).fetchall())
+            next_seq = max(seqs.values(), default=-1) + 1
+            rows = []
+            for record in upserts:
+                seq = seqs.get(record["path"])
+                if seq is None:
+                    seq, next_seq = next_seq, next_seq + 1
+                rows.append((project_name, repository_name, generation, seq, *_record_to_row(record)))
+            conn.executemany(
+                "INSERT OR REPLACE INTO files(project, repository, generation, seq, path, object_id, tokens, "
+                "lines, comments, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._update_repo(conn, project_name, repository_name, generation, None, commit_id, keep_commit=True)
+        return True
+
+    @staticmethod
+    def _update_repo(conn, project_name, repository_name, generation, total_tokens, commit_id, keep_commit=False):
+        """
+        Пересчитывает агрегаты репозитория по поколению generation (UPSERT: строка обновляется на месте).
+        keep_commit=True — при commit_id=None сохранённый коммит не стирается (точечное обновление файлов).
+        """
+        files, tokens, lines, comments, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tokens), 0), COALESCE(SUM(lines), 0), COALESCE(SUM(comments), 0), "
+            f"COALESCE(SUM({_FILE_ROW_BYTES}), 0) "
+            "FROM files WHERE project = ? AND repository = ? AND generation = ?",
+            (project_name, repository_name, generation)
+        ).fetchone()
+        now = time.time()
+        commit_update = "COALESCE(excluded.commit_id, commit_id)" if keep_commit else "excluded.commit_id"
+        conn.execute(
+            "INSERT INTO repos(project, repository, generation, commit_id, total_tokens, files, tokens, "
+            "lines, comments, updated, bytes, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(project, repository) DO UPDATE SET generation = excluded.generation, "
+            f"commit_id = {commit_update}, total_tokens = excluded.total_tokens, files = excluded.files, "
+            "tokens = excluded.tokens, lines = excluded.lines, comments = excluded.comments, "
+            "updated = excluded.updated, bytes = excluded.bytes, last_used = excluded.last_used",
+            (project_name, repository_name, generation, commit_id,
+             tokens if total_tokens is None else total_tokens, files, tokens, lines, comments, now, size, now)
+        )
+
+    def delete_repo(self, project_name, repository_name):
+        """Удаляет кэш репозитория. Возвращает True, если он был."""
+        with self._write() as conn:
+            deleted = conn.execute(
+                "DELETE FROM repos WHERE project = ? AND repository = ?", (project_name, repository_name)
+            ).rowcount
+            conn.execute("DELETE FROM files WHERE project = ? AND repository = ?", (project_name, repository_name))
+        return bool(deleted)
+
+    def delete_project(self, project_name):
+        """Удаляет кэш всех репозиториев проекта и его head-коммиты. Возвращает число репозиториев."""
+        with self._write() as conn:
+            deleted = conn.execute("DELETE FROM repos WHERE project = ?", (project_name,)).rowcount
+            conn.execute("DELETE FROM files WHERE project = ?", (project_name,))
+            conn.execute("DELETE FROM heads WHERE project = ?", (project_name,))
+        return deleted
+
+    # --- объём и вытеснение (core.utils.cache_manager) ---
+
+    def usage(self):
+        """{"entries": число закэшированных репозиториев, "bytes": оценка их размера}."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM repos").fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def iter_lru(self, batch=1000):
+        """Репозитории от давно не использованных к недавним: (last_used, (проект, репозиторий), байт)."""
+        position = (-1.0, "", "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT COALESCE(last_used, 0), project, repository, COALESCE(bytes, 0) FROM repos "
+                    "WHERE (COALESCE(last_used, 0), project, repository) > (?, ?, ?) "
+                    "ORDER BY COALESCE(last_used, 0), project, repository LIMIT ?", (*position, batch)
+                ).fetchall()
+            for last_used, project_name, repository_name, size in rows:
+                yield last_used, (project_name, repository_name), size
+            if len(rows) < batch:
+                return
+            position = rows[-1][:3]
+
+    def expire(self, cutoff):
+        """Удаляет репозитории, к которым не обращались с момента cutoff (time.time()). Возвращает их число."""
+        with self._lock:
+            keys = self._conn.execute(
+                "SELECT project, repository FROM repos WHERE COALESCE(last_used, 0) < ?", (cutoff,)
+            ).fetchall()
+        return self.evict(keys)
+
+    def evict(self, keys):
+        """Удаляет кэш и head-коммиты репозиториев keys — [(проект, репозиторий)]. Возвращает их число."""
+        keys = [tuple(key) for key in keys]
+        if not keys:
+            return 0
+        with self._write() as conn:
+            for table in ("repos", "files", "heads"):
+                conn.executemany(f"DELETE FROM {table} WHERE project = ? AND repository = ?", keys)
+            self.evictions += len(keys)
+        return len(keys)
+
+    def stats(self):
+        """Счётчики попаданий, промахов и вытеснений за время жизни объекта (как TokenMemo.stats)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    # --- head-коммиты ---
+
+    def heads(self, project_name):
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT repository, commit_id FROM heads WHERE project = ?", (project_name,)
+            ).fetchall())
+
+    def set_head(self, project_name, repository_name, commit_id):
+        with self._write() as conn:
+            if commit_id:
+                conn.execute(
+                    "INSERT OR REPLACE INTO heads(project, repository, commit_id) VALUES (?, ?, ?)",
+                    (project_name, repository_name, commit_id)
+                )
+            else:
+                conn.execute(
+                    "DELETE FROM heads WHERE project = ? AND repository = ?", (project_name, repository_name)
+                )
+
+    # --- проверка и восстановление ---
+
+    def check(self, repair=False, orphan_age=CACHE_ORPHAN_AGE):
+        """
+        Проверяет БД: целостность файла SQLite (PRAGMA integrity_check), брошенные поколения
+        (записи файлов старше orphan_age секунд, не ставшие текущими, — остаются после падения
+        процесса посреди записи) и репозитории, агрегаты которых не сходятся с записями файлов.
+        repair=True исправляет найденное: повреждённый файл убирается в сторону и БД создаётся
+        заново, брошенные поколения и несогласованные репозитории удаляются.
+        Возвращает {"integrity": [...], "orphans": число записей, "inconsistent": [(проект, репозиторий)]}.
+        """
+        problems = {"integrity": [], "orphans": 0, "inconsistent": []}
+        try:
+            with self._read() as conn:
+                integrity = [row[0] for row in conn.execute("PRAGMA integrity_check").fetchall()]
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.DatabaseError as e:
+            integrity = [str(e)]
+        if integrity != ["ok"]:
+            problems["integrity"] = integrity
+            if repair:
+                with self._lock:
+                    self._conn.close()
+                    self._quarantine("; ".join(integrity[:3]))
+                    self._conn = self._connect()
+            return problems
+
+        cutoff = time.time_ns() - int(orphan_age * 1e9)
+        with self._read() as conn:
+            orphans = conn.execute("""
+            SELECT f.project, f.repository, f.generation, COUNT(*) FROM files f
+            LEFT JOIN repos r ON r.project = f.project AND r.repository = f.repository AND r.generation = f.generation
+            WHERE r.generation IS NULL AND f.generation < ?
+            GROUP BY f.project, f.repository, f.generation
+            """, (cutoff,)).fetchall()
+            inconsistent = conn.execute("""
+            SELECT r.project, r.repository FROM repos r
+            LEFT JOIN (
+                SELECT project, repository, generation, COUNT(*) AS files, SUM(tokens) AS tokens FROM files
+                GROUP BY project, repository, generation
+            ) f ON f.project = r.project AND f.repository = r.repository AND f.generation = r.generation
+            WHERE r.files != COALESCE(f.files, 0) OR r.tokens != COALESCE(f.tokens, 0)
+            """).fetchall()
+        problems["orphans"] = sum(row[3] for row in orphans)
+        problems["inconsistent"] = [tuple(row) for row in inconsistent]
+        if repair:
+            for project_name, repository_name, generation, _ in orphans:
+                self.drop_generation(project_name, repository_name, generation)
+            for project_name, repository_name in problems["inconsistent"]:
+                self._drop_corrupt(project_name, repository_name, "агрегаты не сходятся с записями файлов")
+        return problems
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _record_to_row(record):
+    extra = {key: value for key, value in record.items() if key not in _FILE_COLUMNS and key != "hash"}
+    return (
+        record["path"],
+        record.get("object_id") or record.get("hash"),
+        record.get("tokens", 0),
+        record.get("lines", 0),
+        record.get("comments", 0),
+        json.dumps(extra, ensure_ascii=False) if extra else None,
+    )
+
+
+def _row_to_record(row):
+    path, object_id, tokens, lines, comments, extra = row
+    record = {"path": path, "object_id": object_id, "hash": object_id,
+              "tokens": tokens, "lines": lines, "comments": comments}
+    if extra:
+        record.update(json.loads(extra))
+    return record
+
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def get_cache_db():
+    """
+    Возвращает общую для процесса БД кэша (cache.db в CACHE_DIR).
+    При открытии в неё переносятся JSON-файлы кэша прежнего формата (migrate_json_cache;
+    под межпроцессной блокировкой, чтобы файл не перенёс одновременно другой процесс).
+    """
+    global _db
+    with _db_lock:
+        db_path = os.path.join(CACHE_DIR, CACHE_DB_FILENAME)
+        if _db is None or _db.db_path != db_path:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            _db = CacheDB(db_path)
+            with file_lock(db_path):
+                migrate_json_cache(_db)
+        return _db
+
+
+def migrate_json_cache(db):
+    """
+    Переносит JSON-кэш прежнего формата ({проект}_{репозиторий}.json и {проект}_summary.json)
+    в БД и удаляет перенесённые файлы. Файл репозитория переносится сразу, только если в имени
+    один "_" и проект с репозиторием определяются однозначно; остальные остаются на месте
+    до первого обращения к известной паре (проект, репозиторий) — см. migrate_legacy_repo.
+    Недописанные или повреждённые JSON-файлы убираются в сторону (*.corrupt-<время>).
+    Возвращает число перенесённых файлов.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    names = [name for name in os.listdir(CACHE_DIR) if name.endswith(".json")]
+    migrated = 0
+    for name in names:
+        stem = name[:-len(".json")]
+        if not name.endswith("_summary.json") and stem.count("_") != 1:
+            db.legacy_files.add(name)
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        data = _read_legacy_json(path)
+        if data is None:
+            continue
+        if "files" in data:
+            if stem.count("_") != 1:
+                db.legacy_files.add(name)  # Репозиторий с именем на "_summary"
+                continue
+            project_name, repository_name = stem.split("_", 1)
+            if not _import_legacy_repo(db, path, project_name, repository_name, data):
+                continue
+        elif name.endswith("_summary.json"):
+            project_name = name[:-len("_summary.json")]
+            for repository_name, commit_id in (data.get("heads") or {}).items():
+                db.set_head(project_name, repository_name, commit_id)
+            _remove_legacy(path)
+        else:
+            continue
+        migrated += 1
+    if migrated:
+        log(f"📦 JSON-кэш перенесён в {db.db_path}: {migrated} файлов")
+    if db.legacy_files:
+        log(f"📦 JSON-файлов кэша с неоднозначным именем: {len(db.legacy_files)}; "
+            f"они будут перенесены при первом обращении к репозиторию")
+    return migrated
+
+
+def migrate_legacy_repo(db, project_name, repository_name):
+    """
+    Переносит в БД JSON-файл прежнего формата репозитория, если он ожидает переноса
+    (имя неоднозначно, см. migrate_json_cache). Возвращает True, если файл перенесён.
+    """
+    name = f"{project_name}_{repository_name}.json"
+    if name not in db.legacy_files:
+        return False
+    path = os.path.join(os.path.dirname(db.db_path), name)
+    with file_lock(db.db_path):
+        data = _read_legacy_json(path)
+        migrated = data is not None and _import_legacy_repo(db, path, project_name, repository_name, data)
+    db.legacy_files.discard(name)
+    if migrated:
+        log(f"📦 JSON-кэш {name} перенесён в {db.db_path}")
+    return migrated
+
+
+def _read_legacy_json(path):
+    """Содержимое JSON-файла кэша прежнего формата или None (файла нет, он повреждён или не словарь)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None  # Уже перенесён другим процессом
+    except ValueError as e:
+        quarantine(path, f"не удалось перенести кэш: {e}")
+        return None
+    except OSError as e:
+        log(f"⚠ Не удалось перенести кэш {path}: {e}", level="ERROR")
         return None
+    return data if isinstance(data, dict) else None
+
+
+def _import_legacy_repo(db, path, project_name, repository_name, data):
+    """Записывает данные репозитория из JSON прежнего формата в БД и удаляет файл."""
+    if not repository_name or "files" not in data:
+        return False
+    generation = time.time_ns()
+    files = [f for f in data.get("files") or [] if isinstance(f, dict) and "path" in f]
+    db.insert_files(project_name, repository_name, generation, files, 0)
+    db.commit_generation(project_name, repository_name, generation, data.get("total_tokens"),
+                         data.get("commit_id"))
+    _remove_legacy(path)
+    return True
+
+
+def _remove_legacy(path):
     try:
-        with open(cache_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        log(f"⚠ Ошибка загрузки кэша {cache_file}: {e}", level="ERROR")
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _repo_db(project_name, repository_name):
+    """БД кэша для обращения к репозиторию: его JSON-файл прежнего формата, если он ждёт переноса, переносится."""
+    db = get_cache_db()
+    if db.legacy_files:
+        migrate_legacy_repo(db, project_name, repository_name)
+    return db
+
+
+def load_cache(project_name, repository_name=None):
+    """
+    Загружает данные из кэша в прежнем формате:
+    для репозитория — {"total_tokens", "commit_id", "files"}, для проекта — {"heads"}.
+    """
+    if not repository_name:
+        return {"heads": get_cache_db().heads(project_name)}
+    found = _repo_db(project_name, repository_name).load_repo(project_name, repository_name)
+    if found is None:
         return None
+    info, files = found
+    return {
+        "total_tokens": info["total_tokens"],
+        "commit_id": info["commit_id"],
+        "files": files,
+    }
 
 def save_cache(data, project_name, repository_name=None):
-    """Сохраняет данные в кэш (json)."""
-    cache_file = get_cache_path(project_name, repository_name)
-    try:
-        with open(cache_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        log(f"✅ Кэш сохранён: {cache_file}")
-    except Exception as e:
-        log(f"⚠ Ошибка сохранения кэша {cache_file}: {e}", level="ERROR")
+    """Сохраняет данные в прежнем формате (см. load_cache) в кэш."""
+    if not repository_name:
+        for name, commit_id in (data.get("heads") or {}).items():
+            save_project_head(project_name, name, commit_id)
+        return
+    save_repo_data_to_cache(project_name, repository_name, data.get("total_tokens"), data.get("files") or [],
+                            commit_id=data.get("commit_id"))
 
-def is_repo_changed(project_name, repository_name, latest_commit=None):
+def is_repo_changed(project_name, repository_name, latest_commit=None, items=None):
     """
-    Проверяем, изменился ли репозиторий, глядя только на файлы.
+    Проверяем, изменился ли репозиторий, сравнивая objectId файлов из кэша
+    с текущими objectId в Azure DevOps (get_items(recursion_level="full")).
     Параметр latest_commit добавлен для совместимости, но здесь не используется.
-    Если в кэше есть список файлов и у каждого есть "hash",
-    мы сверяем его с текущим хешем.
-    Если хотя бы один файл не совпал — считаем, что репозиторий изменился.
+    items — уже полученный список [{"path", "object_id"}, ...]; если не передан, запрашивается.
+    Репозиторий считается изменённым, если у какого-либо файла из белого списка
+    изменился objectId, файл появился или был удалён.
 
     Если кэша нет — считаем, что репо новое или изменилось.
     """
-    cached_data = load_cache(project_name, repository_name)
-    if not cached_data:
+    cached_ids = _repo_db(project_name, repository_name).object_ids(project_name, repository_name)
+    if cached_ids is None:
         return True  # Нет кэша → новое/изменённое
+    if not all(cached_ids.values()):
+        return True  # Данных недостаточно, нужно пересчитать
 
-    cached_files = cached_data.get("files", [])
-    for file_info in cached_files:
-        if "path" not in file_info or "hash" not in file_info:
-            return True  # Данных недостаточно, нужно пересчитать
+    if items is None:
+        from core.azure.repos import get_repo_items
+        items = get_repo_items(project_name, repository_name)
+    if not items:
+        return True  # Список файлов недоступен — перестраховываемся
 
-        current_hash = get_file_hash(file_info["path"])
-        if file_info["hash"] != current_hash:
-            return True  # Файл изменился
+    from core.utils.token_counter import is_whitelisted
+    current_ids = {item["path"]: item["object_id"] for item in items if is_whitelisted(item["path"])}
 
+    changed = [path for path, object_id in current_ids.items() if cached_ids.get(path) != object_id]
+    removed = [path for path in cached_ids if path not in current_ids]
+    if changed or removed:
+        log(f"🔄 {repository_name}: изменено/добавлено {len(changed)}, удалено {len(removed)} файлов")
+        return True
     return False
 
-def save_repo_data_to_cache(project_name, repository_name, total_tokens, files_data):
+def save_repo_data_to_cache(project_name, repository_name, total_tokens, files_data, commit_id=None):
     """
     Сохраняет данные о репозитории в кэш.
     :param project_name: Название проекта
     :param repository_name: Название репозитория
-    :param total_tokens: Общее число токенов
-    :param files_data: Список словарей вида [{"path": "...", "tokens": N}, ...]
-                       Желательно при сохранении заполнить "hash" у каждого файла,
-                       чтобы потом корректно определять изменения.
-    """
-    data = {
-        "total_tokens": total_tokens,
-        "files": files_data
-    }
-    # Дополняем "hash" для каждого файла
-    for f in data["files"]:
-        if "path" in f:
-            f["hash"] = get_file_hash(f["path"])
+    :param total_tokens: Общее число токенов (None — посчитать по files_data)
+    :param commit_id: head-коммит, на котором выполнен анализ; дублируется в head-коммиты проекта
+    :param files_data: Список (или любой итерируемый поток) словарей вида
+                       [{"path": "...", "object_id": "...", "tokens": N}, ...]
+                       В "hash" каждого файла сохраняется его objectId из Azure DevOps,
+                       по нему потом определяются изменения.
+    """
+    writer = RepoCacheWriter(project_name, repository_name)
+    try:
+        for f in files_data:
+            writer.add(f)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close(total_tokens, commit_id)
+
+def update_repo_files(project_name, repository_name, upserts=(), deleted=(), commit_id=None):
+    """
+    Точечно обновляет кэш репозитория: записывает новые и изменённые файлы, удаляет удалённые,
+    пересчитывает агрегаты и запоминает commit_id. Остальные файлы не переписываются.
+    Возвращает False, если кэша репозитория ещё нет.
+    """
+    updated = _repo_db(project_name, repository_name).update_files(project_name, repository_name, upserts, deleted, commit_id)
+    if updated:
+        log(f"✅ Кэш {repository_name} обновлён: записано {len(upserts)}, удалено {len(deleted)} файлов")
+        if commit_id:
+            save_project_head(project_name, repository_name, commit_id)
+    return updated
+
+class RepoCacheWriter:
+    """
+    Потоковая запись кэша репозитория: записи файлов пишутся в БД пакетами по мере add(),
+    в новое поколение рядом с прежним. По close() новое поколение становится текущим,
+    по abort() удаляется — прежний кэш при этом не затрагивается.
+    """
+    def __init__(self, project_name, repository_name):
+        self.project_name = project_name
+        self.repository_name = repository_name
+        self.db = get_cache_db()
+        self.generation = time.time_ns()
+        self.total_tokens = 0
+        self.count = 0
+        self._pending = []
+
+    def add(self, file_info):
+        """Добавляет запись файла; в "hash" сохраняется его objectId."""
+        if "path" not in file_info:
+            return
+        file_info["hash"] = file_info.get("object_id") or file_info.get("hash")
+        self._pending.append(file_info)
+        self.total_tokens += file_info.get("tokens", 0)
+        if len(self._pending) >= CACHE_WRITE_BATCH:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self.db.insert_files(self.project_name, self.repository_name, self.generation, self._pending, self.count)
+            self.count += len(self._pending)
+            self._pending = []
+
+    def close(self, total_tokens=None, commit_id=None):
+        """
+        Делает записанное текущим кэшем репозитория; commit_id запоминается в head-коммитах проекта.
+        total_tokens=None — сумма токенов добавленных файлов.
+        """
+        if total_tokens is None:
+            total_tokens = self.total_tokens
+        try:
+            self._flush()
+            self.db.commit_generation(self.project_name, self.repository_name, self.generation, total_tokens,
+                                      commit_id)
+            log(f"✅ Кэш сохранён: {self.project_name}/{self.repository_name} ({self.count} файлов)")
+        except Exception as e:
+            log(f"⚠ Ошибка сохранения кэша {self.project_name}/{self.repository_name}: {e}", level="ERROR")
+            self.abort()
+            return
+        if commit_id:
+            save_project_head(self.project_name, self.repository_name, commit_id)
+
+    def abort(self):
+        """Отбрасывает недописанный кэш; прежний кэш остаётся как был."""
+        self._pending = []
+        self.db.drop_generation(self.project_name, self.repository_name, self.generation)
+
+def load_project_heads(project_name):
+    """
+    Возвращает {имя репозитория: commit_id} — head-коммиты, на которых репозитории
+    проекта анализировались в последний раз.
+    """
+    return get_cache_db().heads(project_name)
 
-    save_cache(data, project_name, repository_name)
+def save_project_head(project_name, repository_name, commit_id):
+    """
+    Запоминает head-коммит репозитория проекта.
+    None удаляет запись.
+    """
+    get_cache_db().set_head(project_name, repository_name, commit_id)
 
 def load_repo_data_from_cache(project_name, repository_name):
     """
     Загружает данные репозитория из кэша.
-    Возвращает dict, содержащий "total_tokens" и "files",
+    Возвращает dict, содержащий "total_tokens", "commit_id" и "files",
     или None, если кэша нет.
     """
-    cached_data = load_cache(project_name, repository_name)
-    if not cached_data:
-        return None
-    return cached_data
+    return load_cache(project_name, repository_name)
 
-def get_file_hash(file_path):
+def load_repo_totals(project_name, repository_name):
     """
-    Генерирует хеш файла для проверки изменений.
-    NB: Эта функция не знает о project_name/repository_name,
-        просто читает локальный файл.
+    Агрегаты репозитория из кэша без чтения файлов:
+    {"commit_id", "total_tokens", "files", "tokens", "lines", "comments"} или None.
     """
-    from hashlib import sha256
-    try:
-        with open(file_path, "rb") as f:
-            return sha256(f.read()).hexdigest()
-    except Exception:
-        return None  # Если файл отсутствует или ошибка чтения
+    info = _repo_db(project_name, repository_name).repo_info(project_name, repository_name)
+    if info is None:
+        return None
+    info.pop("generation")
+    info.pop("updated")
+    return info
+
+def load_project_totals(project_name):
+    """{репозиторий: агрегаты (см. load_repo_totals)} по всем закэшированным репозиториям проекта."""
+    return get_cache_db().project_totals(project_name)
 
 def clear_cache_for_repo(project_name, repository_name):
-    """Удаляет кэш для одного репозитория (файл {project_name}_{repository_name}.json)."""
+    """Удаляет кэш для одного репозитория (и JSON-файл прежнего формата, если он остался)."""
+    removed = _repo_db(project_name, repository_name).delete_repo(project_name, repository_name)
     cache_file = get_cache_path(project_name, repository_name)
     if os.path.exists(cache_file):
         os.remove(cache_file)
+        removed = True
+    if removed:
         log(f"🗑️ Кэш удалён для репозитория: {repository_name}")
+    if repository_name in load_project_heads(project_name):
+        save_project_head(project_name, repository_name, None)
 
 def clear_project_summary_cache(project_name):
     """
-    Удаляет все файлы кэша для данного проекта (включая сводный).
-    Т.е. любой файл, начинающийся с "{project_name}_" в папке cache.
+    Удаляет весь кэш проекта: репозитории, файлы и head-коммиты в БД,
+    а также JSON-файлы прежнего формата, начинающиеся с "{project_name}_" в папке cache.
     Пример: "ST.CPM_Infrastructure.json", "ST.CPM_summary.json", ...
     """
-    if not os.path.exists(CACHE_DIR):
-        return
+    removed_any = get_cache_db().delete_project(project_name) > 0
 
-    cache_files = os.listdir(CACHE_DIR)
     pattern = f"{project_name}_"
-    removed_any = False
-
-    for filename in cache_files:
-        if filename.startswith(pattern):
+    for filename in os.listdir(CACHE_DIR):
+        if filename.startswith(pattern) and filename.endswith(".json"):
             full_path = os.path.join(CACHE_DIR, filename)
             if os.path.isfile(full_path):
                 os.remove(full_path)
@@ -138,3 +896,53 @@ def clear_project_summary_cache(project_name):
         log(f"⚠ Не найдено файлов кэша для проекта: {project_name}")
     else:
         log(f"✅ Кэш проекта {project_name} успешно очищен!")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Кэш анализа репозиториев (cache.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Перенести JSON-кэш прежнего формата в cache.db")
+    totals = commands.add_parser("totals", help="Агрегаты по репозиториям проекта")
+    totals.add_argument("project")
+    check = commands.add_parser("check", help="Проверить целостность cache.db")
+    check.add_argument("--repair", action="store_true",
+                       help="Исправить: пересоздать повреждённую БД, удалить брошенные и несогласованные записи")
+    commands.add_parser("stats", help="Объём кэша и счётчики по областям")
+    prune = commands.add_parser("prune", help="Удалить устаревшие записи и вытеснить лишние сверх бюджета")
+    prune.add_argument("--max-bytes", help="Бюджет объёма, например 500M или 2G (по умолчанию CACHE_MAX_BYTES)")
+    prune.add_argument("--ttl-days", type=float,
+                       help="Срок жизни записей всех областей в днях (по умолчанию CACHE_TTL_*_DAYS)")
+    prune.add_argument("--vacuum", action="store_true", help="Сжать файлы БД после удаления")
+
+    args = parser.parse_args(argv)
+    if args.command in ("stats", "prune"):
+        from core.utils import cache_manager
+        if args.command == "prune":
+            result = cache_manager.prune(
+                None if args.max_bytes is None else cache_manager.parse_size(args.max_bytes),
+                None if args.ttl_days is None else dict.fromkeys(cache_manager.CACHE_TTL_DAYS, args.ttl_days),
+                vacuum=args.vacuum,
+            )
+            print(f"🧹 Удалено по сроку: {sum(result['expired'].values())}, "
+                  f"вытеснено: {sum(result['evicted'].values())}\n")
+        cache_manager.print_cache_stats(cache_manager.cache_stats())
+    elif args.command == "migrate":
+        print(f"📦 Перенесено файлов: {migrate_json_cache(get_cache_db())}")
+    elif args.command == "check":
+        problems = get_cache_db().check(repair=args.repair)
+        if problems["integrity"]:
+            print("❌ Файл БД повреждён: " + "; ".join(problems["integrity"][:5]))
+        print(f"Брошенных записей файлов: {problems['orphans']}")
+        for project_name, repository_name in problems["inconsistent"]:
+            print(f"⚠ Агрегаты не сходятся: {project_name}/{repository_name}")
+        healthy = not problems["integrity"] and not problems["orphans"] and not problems["inconsistent"]
+        print("✅ Кэш в порядке" if healthy else "🩹 Исправлено" if args.repair
+              else "Запустите с --repair, чтобы исправить")
+        return 0 if healthy or args.repair else 1
+    else:
+        for repository_name, t in sorted(load_project_totals(args.project).items()):
+            print(f"{repository_name:<40} файлов {t['files']:>7} строк {t['lines']:>9} токенов {t['total_tokens']:>10}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# core/utils/cache_manager.py
+"""
+Менеджер кэша: держит папку кэша в пределах бюджета по объёму и срока жизни записей.
+
+Области кэша:
+  repos — кэш репозиториев (cache.db, core.utils.cache);
+  memo  — мемо токенов (token_memo.db, core.utils.token_memo);
+  ai    — ответы OpenAI (ai_responses.db, core.utils.ai_cache).
+Каждая область отдаёт свой объём (usage), записи от давно не использованных к недавним (iter_lru)
+и умеет удалять их (expire, evict). prune сначала удаляет записи, к которым не обращались дольше
+срока жизни области, затем, если общий объём больше бюджета, вытесняет самые давно не использованные
+записи всех областей вместе (LRU), пока объём не опустится до CACHE_PRUNE_TARGET от бюджета.
+Объём — оценка по данным записей; место на диске SQLite освобождает после VACUUM (prune --vacuum).
+
+После пакетного анализа prune выполняется автоматически, а в сводке запуска печатаются попадания,
+промахи и вытеснения по областям. Вручную: python -m core.utils.cache stats | prune.
+"""
+import heapq
+import os
+import sqlite3
+import time
+from core.logging.logger import log
+from core.logging.metrics import format_bytes
+from core.utils import cache
+from core.utils.ai_cache import get_ai_cache
+from core.utils.token_memo import get_token_memo
+
+AREA_TITLES = {"repos": "репозитории", "memo": "мемо токенов", "ai": "ответы OpenAI"}
+
+
+def parse_size(value):
+    """Размер из строки: "500M", "2G", "1048576" (байт). 0 или пустая строка — без ограничения."""
+    value = str(value or "0").strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
+
+# Бюджет объёма всех областей кэша (0 — без ограничения)
+CACHE_MAX_BYTES = parse_size(os.getenv("CACHE_MAX_BYTES", "0"))
+
+# До какой доли бюджета освобождается место при превышении (запас, чтобы не вытеснять на каждом запуске)
+CACHE_PRUNE_TARGET = float(os.getenv("CACHE_PRUNE_TARGET", "0.9"))
+
+# Срок жизни записей в днях с последнего обращения, по областям (0 — бессрочно)
+CACHE_TTL_DAYS = {
+    "repos": float(os.getenv("CACHE_TTL_REPOS_DAYS", "30")),
+    "memo": float(os.getenv("CACHE_TTL_MEMO_DAYS", "180")),
+    "ai": float(os.getenv("CACHE_TTL_AI_DAYS", "30")),
+}
+
+
+def get_areas():
+    """{имя области: хранилище} для текущей папки кэша."""
+    return {"repos": cache.get_cache_db(), "memo": get_token_memo(), "ai": get_ai_cache()}
+
+
+def counters():
+    """{область: {"hits", "misses", "evictions"}} — счётчики хранилищ за время жизни процесса."""
+    return {
+        name: {key: value for key, value in area.stats().items() if key != "hit_ratio"}
+        for name, area in get_areas().items()
+    }
+
+
+def counters_since(before):
+    """Прирост счётчиков с момента снимка before = counters() (например, за один запуск)."""
+    return {
+        name: {key: value - before.get(name, {}).get(key, 0) for key, value in current.items()}
+        for name, current in counters().items()
+    }
+
+
+def format_counters(delta):
+    """Строки сводки запуска по счётчикам counters_since()."""
+    lines = []
+    for name, c in delta.items():
+        lookups = c["hits"] + c["misses"]
+        ratio = f" ({c['hits'] / lookups:.0%})" if lookups else ""
+        lines.append(f"  {AREA_TITLES.get(name, name):<16} попаданий {c['hits']:>7}{ratio:<7} "
+                     f"промахов {c['misses']:>7} вытеснено {c['evictions']:>7}")
+    return "\n".join(lines)
+
+
+def cache_stats():
+    """
+    Объём кэша: {"areas": {область: {"entries", "bytes", "hits", "misses", "evictions"}},
+    "bytes": оценка всего, "disk_bytes": размер папки кэша на диске, "max_bytes": бюджет}.
+    """
+    areas = {}
+    for name, area in get_areas().items():
+        areas[name] = dict(area.usage())
+        areas[name].update({key: value for key, value in area.stats().items() if key != "hit_ratio"})
+    return {
+        "areas": areas,
+        "bytes": sum(area["bytes"] for area in areas.values()),
+        "disk_bytes": _directory_size(cache.CACHE_DIR),
+        "max_bytes": CACHE_MAX_BYTES,
+    }
+
+
+def prune(max_bytes=None, ttl_days=None, vacuum=False):
+    """
+    Удаляет записи старше срока жизни и вытесняет давно не использованные сверх бюджета.
+    max_bytes — бюджет (по умолчанию CACHE_MAX_BYTES, 0 — без ограничения);
+    ttl_days — {область: дней} поверх CACHE_TTL_DAYS.
+    vacuum=True — после удаления сжать файлы БД, чтобы вернуть место на диске.
+    Возвращает {"expired": {область: n}, "evicted": {область: n}, "bytes_before", "bytes_after"}.
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    ttl = dict(CACHE_TTL_DAYS, **(ttl_days or {}))
+    areas = get_areas()
+    now = time.time()
+
+    usage = {name: area.usage()["bytes"] for name, area in areas.items()}
+    result = {"expired": {}, "evicted": {}, "bytes_before": sum(usage.values())}
+    for name, area in areas.items():
+        if ttl.get(name):
+            result["expired"][name] = area.expire(now - ttl[name] * 86400)
+
+    usage = {name: area.usage()["bytes"] for name, area in areas.items()}
+    total = sum(usage.values())
+    if max_bytes and total > max_bytes:
+        target = int(max_bytes * CACHE_PRUNE_TARGET)
+        victims = {name: [] for name in areas}
+        # Общий LRU: слияние упорядоченных по last_used потоков записей всех областей
+        streams = [_tagged_lru(name, area) for name, area in areas.items()]
+        for _, name, key, size in heapq.merge(*streams):
+            if total <= target:
+                break
+            victims[name].append(key)
+            total -= size
+        for name, keys in victims.items():
+            result["evicted"][name] = areas[name].evict(keys)
+        log(f"🧹 Кэш больше бюджета {format_bytes(max_bytes)}: вытеснено записей "
+            + ", ".join(f"{AREA_TITLES[name]} {n}" for name, n in result["evicted"].items()))
+
+    if vacuum:
+        for area in areas.values():
+            _vacuum(area.db_path)
+    result["bytes_after"] = sum(area.usage()["bytes"] for area in areas.values())
+    expired = sum(result["expired"].values())
+    if expired:
+        log(f"🧹 Удалено записей кэша с истёкшим сроком: {expired}")
+    return result
+
+
+def _tagged_lru(name, area):
+    """Поток iter_lru() области с её именем: (last_used, область, ключ, байт)."""
+    for last_used, key, size in area.iter_lru():
+        yield last_used, name, key, size
+
+
+def _vacuum(db_path):
+    """VACUUM отдельным соединением: переписывает файл БД без освободившихся страниц."""
+    conn = sqlite3.connect(db_path, timeout=cache.CACHE_LOCK_TIMEOUT)
+    try:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Файл удалён другим процессом
+    return total
+
+
+def print_cache_stats(stats):
+    """Печатает результат cache_stats()."""
+    for name, area in stats["areas"].items():
+        print(f"{AREA_TITLES.get(name, name):<16} записей {area['entries']:>9} {format_bytes(area['bytes']):>12}"
+              f"   попаданий {area['hits']}, промахов {area['misses']}, вытеснено {area['evictions']}")
+    budget = format_bytes(stats["max_bytes"]) if stats["max_bytes"] else "без ограничения"
+    print(f"\nВсего: {format_bytes(stats['bytes'])} (бюджет {budget}), на диске {format_bytes(stats['disk_bytes'])}")
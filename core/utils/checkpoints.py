@@ -0,0 +1,274 @@
+# core/utils/checkpoints.py
+"""
+Контрольные точки пакетного анализа: после падения или Ctrl-C запуск с тем же run_id
+(main.py --resume <run_id>) пропускает уже проанализированные репозитории,
+а незаконченные продолжает с точностью до файла.
+
+Хранится в SQLite (checkpoints.db в папке кэша):
+  runs  — запуски (проект, тип анализа, статус, время начала и последнего обновления);
+  repos — завершённые репозитории запуска и их результаты (без списка файлов);
+  files — записи файлов незаконченных репозиториев; при глубоком анализе — ещё и путь
+          к уже полученному ИИ‑отчёту, чтобы повторно не платить за запрос к OpenAI.
+Когда репозиторий завершён, его файловые записи удаляются.
+
+Список и очистка запусков: python -m core.utils.checkpoints list | clean.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from core.logging.logger import log
+from core.reports.report_formatter import summarize_repository
+from core.utils import cache
+
+CHECKPOINT_FILENAME = "checkpoints.db"
+
+# Незавершённые запуски старше этого срока считаются брошенными (clean без параметров)
+CHECKPOINT_STALE_DAYS = int(os.getenv("CHECKPOINT_STALE_DAYS", "7"))
+
+# Сколько записей файлов копится перед записью в БД (записи с ИИ‑отчётом пишутся сразу)
+CHECKPOINT_BATCH_SIZE = int(os.getenv("CHECKPOINT_BATCH_SIZE", "200"))
+
+
+class CheckpointStore:
+    """
+    Хранилище контрольных точек. Одно соединение на процесс, доступ из потоков — под блокировкой;
+    SQLite в режиме WAL, поэтому БД можно читать из другого процесса (list) во время анализа.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS runs(
+            run_id TEXT PRIMARY KEY,
+            project TEXT,
+            mode TEXT,
+            status TEXT,
+            started REAL,
+            updated REAL
+        );
+        CREATE TABLE IF NOT EXISTS repos(
+            run_id TEXT,
+            repository TEXT,
+            result TEXT,
+            finished REAL,
+            PRIMARY KEY(run_id, repository)
+        );
+        CREATE TABLE IF NOT EXISTS files(
+            run_id TEXT,
+            repository TEXT,
+            path TEXT,
+            record TEXT,
+            ai_report TEXT,
+            PRIMARY KEY(run_id, repository, path)
+        );
+        """)
+        self._conn.commit()
+
+    def begin_run(self, run_id, project_name, analysis_mode):
+        """
+        Регистрирует запуск или продолжает существующий.
+        Возвращает True, если запуск с таким run_id уже был (продолжение).
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT project, mode FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO runs(run_id, project, mode, status, started, updated) VALUES (?, ?, ?, 'running', ?, ?)",
+                    (run_id, project_name, analysis_mode, now, now)
+                )
+            else:
+                if row != (project_name, analysis_mode):
+                    raise ValueError(f"Запуск {run_id} относится к проекту {row[0]} ({row[1]}), "
+                                     f"а не к {project_name} ({analysis_mode})")
+                self._conn.execute("UPDATE runs SET status = 'running', updated = ? WHERE run_id = ?", (now, run_id))
+            self._conn.commit()
+        return row is not None
+
+    def finish_run(self, run_id):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET status = 'completed', updated = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.commit()
+
+    def completed_repositories(self, run_id):
+        """{имя репозитория: результат} для репозиториев, завершённых в запуске."""
+        with self._lock:
+            rows = self._conn.execute("SELECT repository, result FROM repos WHERE run_id = ?", (run_id,)).fetchall()
+        return {repository: json.loads(result) for repository, result in rows}
+
+    def mark_repository_done(self, run_id, result):
+        """
+        Запоминает результат завершённого репозитория (без списка файлов — итоги в result["totals"])
+        и удаляет его файловые записи.
+        """
+        repository_name = result["repository"]
+        stored = {key: value for key, value in result.items() if key != "files"}
+        stored["totals"] = summarize_repository(result)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO repos(run_id, repository, result, finished) VALUES (?, ?, ?, ?)",
+                (run_id, repository_name, json.dumps(stored, ensure_ascii=False), now)
+            )
+            self._conn.execute("DELETE FROM files WHERE run_id = ? AND repository = ?", (run_id, repository_name))
+            self._conn.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (now, run_id))
+            self._conn.commit()
+
+    def load_files(self, run_id, repository_name):
+        """{path: {"record": запись файла, "ai_report": путь или None}} незаконченного репозитория."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, record, ai_report FROM files WHERE run_id = ? AND repository = ?",
+                (run_id, repository_name)
+            ).fetchall()
+        return {path: {"record": json.loads(record), "ai_report": ai_report} for path, record, ai_report in rows}
+
+    def save_files(self, run_id, repository_name, entries):
+        """Сохраняет записи файлов: entries — [(запись файла, путь ИИ‑отчёта или None), ...]."""
+        if not entries:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files(run_id, repository, path, record, ai_report) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, repository_name, record["path"], json.dumps(record, ensure_ascii=False), ai_report)
+                 for record, ai_report in entries]
+            )
+            self._conn.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.commit()
+
+    def list_runs(self):
+        """Запуски от новых к старым: run_id, проект, тип, статус, время, число завершённых репозиториев и файлов."""
+        with self._lock:
+            rows = self._conn.execute("""
+            SELECT r.run_id, r.project, r.mode, r.status, r.started, r.updated,
+                   (SELECT COUNT(*) FROM repos WHERE repos.run_id = r.run_id),
+                   (SELECT COUNT(*) FROM files WHERE files.run_id = r.run_id)
+            FROM runs r ORDER BY r.started DESC
+            """).fetchall()
+        keys = ("run_id", "project", "mode", "status", "started", "updated", "repositories", "files")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def delete_run(self, run_id):
+        with self._lock:
+            for table in ("files", "repos", "runs"):
+                self._conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+            self._conn.commit()
+
+    def prune(self, max_age_days=CHECKPOINT_STALE_DAYS, completed=True):
+        """
+        Удаляет запуски, не обновлявшиеся дольше max_age_days дней, и (completed=True) все завершённые.
+        Возвращает список удалённых run_id.
+        """
+        cutoff = time.time() - max_age_days * 86400
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id FROM runs WHERE updated < ? OR (? AND status = 'completed')", (cutoff, completed)
+            ).fetchall()
+        removed = [run_id for (run_id,) in rows]
+        for run_id in removed:
+            self.delete_run(run_id)
+        if removed:
+            log(f"🧹 Удалено контрольных точек запусков: {len(removed)}")
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RepoCheckpoint:
+    """
+    Контрольная точка одного репозитория в запуске: записи файлов, посчитанные до прерывания,
+    и уже полученные ИИ‑отчёты. Новые записи копятся и пишутся пакетами (flush).
+    """
+    def __init__(self, store, run_id, repository_name):
+        self.store = store
+        self.run_id = run_id
+        self.repository_name = repository_name
+        self.files = store.load_files(run_id, repository_name)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def records(self):
+        """Записи файлов из контрольной точки (для повторного использования по objectId)."""
+        return [entry["record"] for entry in self.files.values()]
+
+    def ai_report(self, record):
+        """Путь к ИИ‑отчёту файла, если он уже получен для того же содержимого (objectId), иначе None."""
+        entry = self.files.get(record["path"])
+        if not entry or not entry["ai_report"] or not os.path.exists(entry["ai_report"]):
+            return None
+        if entry["record"].get("object_id") != record.get("object_id"):
+            return None
+        return entry["ai_report"]
+
+    def add(self, record, ai_report=None):
+        """Запоминает запись файла; запись с ИИ‑отчётом сохраняется сразу."""
+        with self._lock:
+            self._pending.append((dict(record), ai_report))
+            full = ai_report is not None or len(self._pending) >= CHECKPOINT_BATCH_SIZE
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        self.store.save_files(self.run_id, self.repository_name, pending)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store():
+    """Возвращает общее для процесса хранилище контрольных точек (checkpoints.db в папке кэша)."""
+    global _store
+    with _store_lock:
+        db_path = os.path.join(cache.CACHE_DIR, CHECKPOINT_FILENAME)
+        if _store is None or _store.db_path != db_path:
+            os.makedirs(cache.CACHE_DIR, exist_ok=True)
+            _store = CheckpointStore(db_path)
+        return _store
+
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Контрольные точки пакетного анализа")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="Список запусков")
+
+    clean = commands.add_parser("clean", help="Удалить завершённые и брошенные запуски")
+    clean.add_argument("--days", type=int, default=CHECKPOINT_STALE_DAYS,
+                       help=f"Незавершённые запуски без обновлений дольше N дней (по умолчанию {CHECKPOINT_STALE_DAYS})")
+    clean.add_argument("--keep-completed", action="store_true", help="Не удалять завершённые запуски")
+    clean.add_argument("--run", help="Удалить только указанный запуск")
+
+    args = parser.parse_args(argv)
+    store = get_checkpoint_store()
+    if args.command == "list":
+        runs = store.list_runs()
+        for run in runs:
+            print(f"{run['run_id']}  {run['project']:<30} {run['mode']:<5} {run['status']:<10} "
+                  f"начат {_format_time(run['started'])}, обновлён {_format_time(run['updated'])}, "
+                  f"репозиториев {run['repositories']}, файлов в работе {run['files']}")
+        print(f"\nЗапусков: {len(runs)}")
+    elif args.run:
+        store.delete_run(args.run)
+        print(f"🧹 Запуск {args.run} удалён")
+    else:
+        removed = store.prune(args.days, completed=not args.keep_completed)
+        print(f"🧹 Удалено запусков: {len(removed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import json
+import os
+from datetime import datetime, timezone
+import numpy as np
+from core.logging.logger import log
+from core.utils import cache
+from core.utils.atomic_io import atomic_write, file_lock, quarantine
+
+COMMITS_SUBDIR = "commits"
+
+
+def _store_paths(project_name, repository_name):
+    """Возвращает пути (таблица коммитов .npz, файл водяного знака .meta.json)."""
+    commits_dir = os.path.join(cache.CACHE_DIR, COMMITS_SUBDIR)
+    os.makedirs(commits_dir, exist_ok=True)
+    base = os.path.join(commits_dir, f"{project_name}_{repository_name}")
+    return base + ".npz", base + ".meta.json"
+
+
+class CommitTable:
+    """
+    Компактная колоночная таблица коммитов.
+    Авторы закодированы словарём (authors[i] — имя автора с идентификатором i),
+    остальные поля — типизированные массивы numpy одинаковой длины:
+      commit_ids — sha1 по 20 байт (uint8, форма n×20), author_ids — int32, timestamps — int64 (секунды UTC),
+      adds / edits / deletes — int32.
+    Миллион коммитов занимает около 44 МБ.
+    """
+    def __init__(self, authors, commit_ids, author_ids, timestamps, adds, edits, deletes):
+        self.authors = list(authors)
+        self.commit_ids = commit_ids
+        self.author_ids = author_ids
+        self.timestamps = timestamps
+        self.adds = adds
+        self.edits = edits
+        self.deletes = deletes
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def empty(cls):
+        return cls([], np.empty((0, 20), dtype=np.uint8), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64),
+                   np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+
+    @classmethod
+    def from_records(cls, records):
+        """Строит таблицу из записей commit_to_record() (в любом порядке)."""
+        records = list(records)
+        authors = []
+        author_index = {}
+        author_ids = np.empty(len(records), dtype=np.int32)
+        for i, record in enumerate(records):
+            author = record.get("author") or ""
+            if author not in author_index:
+                author_index[author] = len(authors)
+                authors.append(author)
+            author_ids[i] = author_index[author]
+
+        return cls(
+            authors,
+            np.frombuffer(b"".join(bytes.fromhex(r["commit_id"]) for r in records), dtype=np.uint8).reshape(-1, 20),
+            author_ids,
+            np.array([_to_timestamp(r.get("date")) for r in records], dtype=np.int64),
+            np.array([r.get("adds", 0) for r in records], dtype=np.int32),
+            np.array([r.get("edits", 0) for r in records], dtype=np.int32),
+            np.array([r.get("deletes", 0) for r in records], dtype=np.int32),
+        )
+
+    @classmethod
+    def concat(cls, tables):
+        """Объединяет таблицы, перекодируя идентификаторы авторов в общий словарь."""
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls.empty()
+        authors = []
+        author_index = {}
+        remapped = []
+        for table in tables:
+            mapping = np.empty(len(table.authors), dtype=np.int32)
+            for i, author in enumerate(table.authors):
+                if author not in author_index:
+                    author_index[author] = len(authors)
+                    authors.append(author)
+                mapping[i] = author_index[author]
+            remapped.append(mapping[table.author_ids])
+        return cls(
+            authors,
+            np.concatenate([t.commit_ids for t in tables]),
+            np.concatenate(remapped),
+            np.concatenate([t.timestamps for t in tables]),
+            np.concatenate([t.adds for t in tables]),
+            np.concatenate([t.edits for t in tables]),
+            np.concatenate([t.deletes for t in tables]),
+        )
+
+    def save(self, path):
+        """Сохраняет таблицу в .npz (через временный файл, чтобы не оставить половину записи)."""
+        with atomic_write(path, "wb") as f:
+            np.savez(
+                f,
+                authors=np.array(self.authors, dtype=str),
+                commit_ids=self.commit_ids,
+                author_ids=self.author_ids,
+                timestamps=self.timestamps,
+                adds=self.adds,
+                edits=self.edits,
+                deletes=self.deletes,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["authors"].tolist(),
+                data["commit_ids"],
+                data["author_ids"],
+                data["timestamps"],
+                data["adds"],
+                data["edits"],
+                data["deletes"],
+            )
+
+    def iter_records(self):
+        """Итерирует записи в формате commit_to_record() (для совместимости)."""
+        for i in range(len(self)):
+            yield {
+                "commit_id": self.commit_ids[i].tobytes().hex(),
+                "author": self.authors[self.author_ids[i]] or None,
+                "email": None,
+                "date": datetime.fromtimestamp(int(self.timestamps[i]), tz=timezone.utc).isoformat(),
+                "adds": int(self.adds[i]),
+                "edits": int(self.edits[i]),
+                "deletes": int(self.deletes[i]),
+            }
+
+
+def _to_timestamp(date):
+    """ISO-дата → секунды UTC (0, если даты нет)."""
+    if not date:
+        return 0
+    return int(datetime.fromisoformat(date).timestamp())
+
+
+def commit_to_record(commit):
+    """
+    Превращает GitCommitRef из SDK в компактную запись для локального хранилища.
+    """
+    author = commit.author
+    # Порядок выдачи и водяной знак строятся по дате коммиттера
+    signature = commit.committer or author
+    change_counts = commit.change_counts or {}
+    return {
+        "commit_id": commit.commit_id,
+        "author": author.name if author else None,
+        "email": author.email if author else None,
+        "date": signature.date.isoformat() if signature and signature.date else None,
+        "adds": change_counts.get("Add", 0),
+        "edits": change_counts.get("Edit", 0),
+        "deletes": change_counts.get("Delete", 0),
+    }
+
+
+def load_watermark(project_name, repository_name):
+    """
+    Возвращает водяной знак синхронизации {"commit_id", "date", "count"}
+    (самый новый сохранённый коммит) или None, если коммиты ещё не загружались.
+    """
+    _, meta_path = _store_paths(project_name, repository_name)
+    return _read_watermark(meta_path)
+
+
+def _read_watermark(meta_path):
+    """Повреждённый водяной знак убирается в сторону: следующая синхронизация будет полной."""
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log(f"⚠ Ошибка чтения водяного знака коммитов {meta_path}: {e}", level="ERROR")
+        quarantine(meta_path, str(e))
+        return None
+
+
+def load_commit_table(project_name, repository_name):
+    """
+    Загружает колоночную таблицу коммитов репозитория.
+    Хранилище старого формата (.jsonl) при первом обращении конвертируется.
+    """
+    table_path, _ = _store_paths(project_name, repository_name)
+    if os.path.exists(_legacy_path(table_path)):
+        with file_lock(table_path):
+            _convert_legacy_store(table_path, repository_name)
+    return _read_table(table_path)
+
+
+def _legacy_path(table_path):
+    return table_path[:-len(".npz")] + ".jsonl"
+
+
+def _convert_legacy_store(table_path, repository_name):
+    """Переводит .jsonl в .npz; вызывается под file_lock(table_path)."""
+    legacy_path = _legacy_path(table_path)
+    if not os.path.exists(legacy_path):
+        return  # Уже конвертировано другим процессом
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    CommitTable.from_records(records).save(table_path)
+    os.remove(legacy_path)
+    log(f"🔁 Хранилище коммитов {repository_name} переведено в колоночный формат ({len(records)} коммитов)")
+
+
+def _read_table(table_path):
+    """
+    Читает таблицу коммитов. Повреждённая таблица убирается в сторону вместе с водяным знаком,
+    чтобы следующая синхронизация загрузила коммиты заново.
+    """
+    if not os.path.exists(table_path):
+        return CommitTable.empty()
+    try:
+        return CommitTable.load(table_path)
+    except Exception as e:
+        log(f"⚠ Ошибка загрузки таблицы коммитов {table_path}: {e}", level="ERROR")
+        quarantine(table_path, str(e))
+        quarantine(table_path[:-len(".npz")] + ".meta.json")
+        return CommitTable.empty()
+
+
+def load_project_commit_table(project_name):
+    """
+    Объединяет таблицы коммитов всех репозиториев проекта (для аналитики по проекту).
+    """
+    commits_dir = os.path.join(cache.CACHE_DIR, COMMITS_SUBDIR)
+    if not os.path.isdir(commits_dir):
+        return CommitTable.empty()
+    prefix = f"{project_name}_"
+    repository_names = dict.fromkeys(
+        filename[len(prefix):].rsplit(".", 1)[0]
+        for filename in sorted(os.listdir(commits_dir))
+        if filename.startswith(prefix) and filename.endswith((".npz", ".jsonl"))
+    )
+    return CommitTable.concat(
+        [load_commit_table(project_name, repository_name) for repository_name in repository_names]
+    )
+
+
+def append_commits(project_name, repository_name, records):
+    """
+    Дописывает новые коммиты в хранилище и сдвигает водяной знак.
+    records — записи от новых к старым (в том порядке, в каком их отдаёт Azure DevOps);
+    в таблицу они попадают в хронологическом порядке. Уже сохранённые коммиты пропускаются,
+    поэтому одновременная синхронизация одного репозитория из нескольких процессов
+    (чтение-изменение-запись под межпроцессной блокировкой) не создаёт дублей.
+    """
+    if not records:
+        return
+    table_path, meta_path = _store_paths(project_name, repository_name)
+    with file_lock(table_path):
+        _convert_legacy_store(table_path, repository_name)
+        stored = _read_table(table_path)
+        new_table = CommitTable.from_records(reversed(records))
+        known = np.isin(new_table.commit_ids.view("V20").ravel(), stored.commit_ids.view("V20").ravel())
+        if known.all():
+            return
+        if known.any():
+            new_table = CommitTable.from_records(
+                record for record, seen in zip(reversed(records), known) if not seen
+            )
+        table = CommitTable.concat([stored, new_table])
+        table.save(table_path)
+
+        newest = records[0]
+        watermark = {
+            "commit_id": newest["commit_id"],
+            "date": newest["date"],
+            "count": len(table),
+        }
+        with atomic_write(meta_path) as f:
+            json.dump(watermark, f, ensure_ascii=False)
+    log(f"💾 Сохранено {len(new_table)} новых коммитов {repository_name}, всего {watermark['count']}")
+
+
+def iter_commits(project_name, repository_name):
+    """
+    Итерирует сохранённые коммиты репозитория от старых к новым.
+    """
+    return load_commit_table(project_name, repository_name).iter_records()
+
+
+def clear_commit_store(project_name, repository_name):
+    """Удаляет сохранённые коммиты и водяной знак репозитория (следующая синхронизация будет полной)."""
+    table_path, meta_path = _store_paths(project_name, repository_name)
+    with file_lock(table_path):
+        for path in (table_path, meta_path, _legacy_path(table_path)):
+            if os.path.exists(path):
+                os.remove(path)
+    log(f"🗑️ Хранилище коммитов очищено для репозитория: {repository_name}")
@@ -0,0 +1,43 @@
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def ordered_bounded_map(func, items, max_workers, window=None, executor=None):
+    """
+    Выполняет func(item) для элементов items на пуле потоков и отдаёт результаты
+    в исходном порядке.
+    Одновременно в работе не больше window задач (по умолчанию 2 * max_workers),
+    поэтому память ограничена, а потребитель обрабатывает готовые результаты,
+    пока следующие ещё загружаются.
+    executor — общий пул, на котором выполнять задачи (он не закрывается);
+    по умолчанию создаётся собственный пул на max_workers потоков.
+    Задача выполняется в копии контекста вызывающего кода (contextvars), поэтому спаны метрик
+    попадают в запуск и репозиторий, в рамках которых она поставлена.
+    """
+    max_workers = max(1, int(max_workers))
+    window = window or max_workers * 2
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=max_workers) as own_executor:
+            yield from _ordered_map(func, items, window, own_executor)
+    else:
+        yield from _ordered_map(func, items, window, executor)
+
+
+def _ordered_map(func, items, window, executor):
+    items = iter(items)
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(contextvars.copy_context().run, func, item))
+        if len(pending) >= window:
+            break
+
+    while pending:
+        result = pending.popleft().result()
+        next_item = next(items, _SENTINEL)
+        if next_item is not _SENTINEL:
+            pending.append(executor.submit(contextvars.copy_context().run, func, next_item))
+        yield result
+
+
+_SENTINEL = object()
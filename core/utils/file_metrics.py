@@ -0,0 +1,276 @@
+import json
+import os
+import struct
+from array import array
+import numpy as np
+from core.utils import cache
+from core.utils.atomic_io import atomic_write
+
+METRICS_SUBDIR = "metrics"
+
+FILE_METRICS_MAGIC = b"FMETRIC1"
+
+# Выравнивание столбцов в файле (байт), чтобы их можно было читать из mmap без копирования
+_ALIGN = 64
+
+_NO_OBJECT_ID = bytes(20)
+
+
+class FileMetrics:
+    """
+    Компактная колоночная таблица метрик файлов репозитория — замена списку словарей files_data.
+    Пути разбиты на папку и имя: папки закодированы словарём (folders[i] — папка с идентификатором i,
+    folder_ids — int32, -1 — путь без "/"), имена файлов склеены в один буфер UTF-8 (names_blob + names_offsets).
+    Роли файлов — словарь roles и role_ids (int16, -1 — роли нет).
+    objectId — sha1 по 20 байт (uint8, форма n×20; нулевая строка — objectId нет); если встречаются
+    не sha1-идентификаторы, они хранятся строками (object_ids_blob + object_ids_offsets).
+    tokens / lines / comments — int32.
+    Миллион файлов занимает около 70 МБ вместо сотен мегабайт в словарях.
+
+    Таблица итерируется записями {"path", "object_id", "hash", "tokens", "lines", "comments"[, "role"]},
+    которые создаются на лету, поэтому её без изменений принимают generate_report,
+    format_repository_report и format_project_summary. save/load — двоичный колоночный файл,
+    который читается через mmap без загрузки в память.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.folders = _decode_strings(columns["folders_blob"], columns["folders_offsets"])
+        self.roles = _decode_strings(columns["roles_blob"], columns["roles_offsets"])
+
+    def __len__(self):
+        return len(self.columns["tokens"])
+
+    def __iter__(self):
+        c = self.columns
+        names = memoryview(c["names_blob"])
+        name_offsets = c["names_offsets"].tolist()
+        object_ids = self._object_ids()
+        for i, (folder_id, role_id, tokens, lines, comments) in enumerate(zip(
+                c["folder_ids"].tolist(), c["role_ids"].tolist(),
+                c["tokens"].tolist(), c["lines"].tolist(), c["comments"].tolist())):
+            name = names[name_offsets[i]:name_offsets[i + 1]].tobytes().decode("utf-8")
+            object_id = object_ids(i)
+            record = {"path": name if folder_id < 0 else f"{self.folders[folder_id]}/{name}",
+                      "object_id": object_id, "hash": object_id,
+                      "tokens": tokens, "lines": lines, "comments": comments}
+            if role_id >= 0:
+                record["role"] = self.roles[role_id]
+            yield record
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        c = self.columns
+        name = bytes(c["names_blob"][c["names_offsets"][i]:c["names_offsets"][i + 1]]).decode("utf-8")
+        folder_id = int(c["folder_ids"][i])
+        object_id = self._object_ids()(i)
+        record = {"path": name if folder_id < 0 else f"{self.folders[folder_id]}/{name}",
+                  "object_id": object_id, "hash": object_id,
+                  "tokens": int(c["tokens"][i]), "lines": int(c["lines"][i]), "comments": int(c["comments"][i])}
+        if c["role_ids"][i] >= 0:
+            record["role"] = self.roles[c["role_ids"][i]]
+        return record
+
+    def _object_ids(self):
+        """Функция i → objectId i-го файла (или None)."""
+        c = self.columns
+        if "object_ids" in c:
+            packed = c["object_ids"]
+
+            def packed_id(i):
+                raw = packed[i].tobytes()
+                return None if raw == _NO_OBJECT_ID else raw.hex()
+            return packed_id
+        blob = memoryview(c["object_ids_blob"])
+        offsets = c["object_ids_offsets"]
+
+        def string_id(i):
+            return blob[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8") or None
+        return string_id
+
+    def totals(self):
+        """Итоги без перебора записей: {"files", "lines", "comments", "tokens"}."""
+        c = self.columns
+        return {
+            "files": len(self),
+            "lines": int(c["lines"].sum(dtype=np.int64)),
+            "comments": int(c["comments"].sum(dtype=np.int64)),
+            "tokens": int(c["tokens"].sum(dtype=np.int64)),
+        }
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    @classmethod
+    def from_records(cls, records):
+        """Строит таблицу из записей файлов (список или поток словарей)."""
+        if isinstance(records, cls):
+            return records
+        builder = FileMetricsBuilder()
+        for record in records:
+            builder.add(record)
+        return builder.build()
+
+    def save(self, path):
+        """
+        Сохраняет таблицу в двоичный колоночный файл (через временный файл):
+        FILE_METRICS_MAGIC, длина заголовка (uint32 LE), заголовок JSON
+        {"columns": {имя: {"dtype", "shape", "offset"}}}, затем столбцы, выровненные по _ALIGN байт.
+        """
+        layout = {}
+        offset = 0
+        for name, column in self.columns.items():
+            layout[name] = {"dtype": column.dtype.str, "shape": list(column.shape), "offset": offset}
+            offset = _aligned(offset + column.nbytes)
+        header = json.dumps({"columns": layout}).encode("utf-8")
+        data_start = _aligned(len(FILE_METRICS_MAGIC) + 4 + len(header))
+        with atomic_write(path, "wb") as f:
+            f.write(FILE_METRICS_MAGIC + struct.pack("<I", len(header)) + header)
+            for name, column in self.columns.items():
+                f.seek(data_start + layout[name]["offset"])
+                f.write(np.ascontiguousarray(column).tobytes())
+            f.truncate(data_start + offset)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Загружает таблицу из файла save(). mmap=True — столбцы отображаются в память без копирования
+        (страницы читаются с диска по мере обращения); иначе файл читается целиком.
+        """
+        data = np.memmap(path, dtype=np.uint8, mode="r") if mmap else np.fromfile(path, dtype=np.uint8)
+        if data[:len(FILE_METRICS_MAGIC)].tobytes() != FILE_METRICS_MAGIC:
+            raise ValueError(f"{path} не является файлом метрик файлов")
+        (header_length,) = struct.unpack("<I", data[len(FILE_METRICS_MAGIC):len(FILE_METRICS_MAGIC) + 4].tobytes())
+        header_start = len(FILE_METRICS_MAGIC) + 4
+        header = json.loads(data[header_start:header_start + header_length].tobytes())
+        data_start = _aligned(header_start + header_length)
+        columns = {}
+        for name, spec in header["columns"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            start = data_start + spec["offset"]
+            columns[name] = data[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+        return cls(columns)
+
+
+class FileMetricsBuilder:
+    """
+    Потоковое построение FileMetrics: записи добавляются по одной в типизированные буферы (array),
+    словари от записей не хранятся.
+    """
+    def __init__(self):
+        self._folders = {}
+        self._roles = {}
+        self._folder_ids = array("i")
+        self._role_ids = array("h")
+        self._names = bytearray()
+        self._name_offsets = array("q", [0])
+        self._object_ids = bytearray()  # по 20 байт на файл, пока все objectId — sha1
+        self._object_id_offsets = None  # смещения, если objectId хранятся строками
+        self._tokens = array("i")
+        self._lines = array("i")
+        self._comments = array("i")
+
+    def add(self, record):
+        path = record["path"]
+        slash = path.rfind("/")
+        if slash < 0:
+            self._folder_ids.append(-1)
+        else:
+            self._folder_ids.append(self._folders.setdefault(path[:slash], len(self._folders)))
+        self._names += path[slash + 1:].encode("utf-8")
+        self._name_offsets.append(len(self._names))
+
+        role = record.get("role")
+        self._role_ids.append(-1 if role is None else self._roles.setdefault(role, len(self._roles)))
+
+        self._add_object_id(record.get("object_id") or record.get("hash"))
+        self._tokens.append(record.get("tokens", 0))
+        self._lines.append(record.get("lines", 0))
+        self._comments.append(record.get("comments", 0))
+
+    def _add_object_id(self, object_id):
+        if self._object_id_offsets is None:
+            if object_id is None:
+                self._object_ids += _NO_OBJECT_ID
+                return
+            if len(object_id) == 40:
+                try:
+                    self._object_ids += bytes.fromhex(object_id)
+                    return
+                except ValueError:
+                    pass
+            self._switch_to_string_ids()
+        self._object_ids += (object_id or "").encode("utf-8")
+        self._object_id_offsets.append(len(self._object_ids))
+
+    def _switch_to_string_ids(self):
+        """Переводит уже добавленные objectId из упакованного вида в строки."""
+        packed, self._object_ids = self._object_ids, bytearray()
+        self._object_id_offsets = array("q", [0])
+        for start in range(0, len(packed), 20):
+            raw = bytes(packed[start:start + 20])
+            if raw != _NO_OBJECT_ID:
+                self._object_ids += raw.hex().encode("ascii")
+            self._object_id_offsets.append(len(self._object_ids))
+
+    def build(self):
+        folders_blob, folders_offsets = _encode_strings(self._folders)
+        roles_blob, roles_offsets = _encode_strings(self._roles)
+        columns = {
+            "folders_blob": folders_blob,
+            "folders_offsets": folders_offsets,
+            "folder_ids": np.frombuffer(self._folder_ids, dtype=np.int32).copy(),
+            "names_blob": np.frombuffer(bytes(self._names), dtype=np.uint8),
+            "names_offsets": np.frombuffer(self._name_offsets, dtype=np.int64).copy(),
+            "roles_blob": roles_blob,
+            "roles_offsets": roles_offsets,
+            "role_ids": np.frombuffer(self._role_ids, dtype=np.int16).copy(),
+            "tokens": np.frombuffer(self._tokens, dtype=np.int32).copy(),
+            "lines": np.frombuffer(self._lines, dtype=np.int32).copy(),
+            "comments": np.frombuffer(self._comments, dtype=np.int32).copy(),
+        }
+        if self._object_id_offsets is None:
+            columns["object_ids"] = np.frombuffer(bytes(self._object_ids), dtype=np.uint8).reshape(-1, 20)
+        else:
+            columns["object_ids_blob"] = np.frombuffer(bytes(self._object_ids), dtype=np.uint8)
+            columns["object_ids_offsets"] = np.frombuffer(self._object_id_offsets, dtype=np.int64).copy()
+        return FileMetrics(columns)
+
+
+def _encode_strings(strings):
+    """Список строк (или словарь строка → индекс в порядке добавления) → (буфер UTF-8, смещения)."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded)))
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_strings(blob, offsets):
+    raw = blob.tobytes()
+    offsets = offsets.tolist()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def metrics_path(project_name, repository_name):
+    """Путь к файлу метрик файлов репозитория в папке кэша."""
+    metrics_dir = os.path.join(cache.CACHE_DIR, METRICS_SUBDIR)
+    os.makedirs(metrics_dir, exist_ok=True)
+    return os.path.join(metrics_dir, f"{project_name}_{repository_name}.fmetrics")
+
+
+def spill_file_metrics(project_name, repository_name, files):
+    """
+    Сохраняет метрики файлов репозитория на диск и возвращает таблицу, отображённую из файла (mmap):
+    до сводного отчёта они не занимают память процесса. files — FileMetrics или список записей.
+    """
+    path = metrics_path(project_name, repository_name)
+    FileMetrics.from_records(files).save(path)
+    return FileMetrics.load(path)
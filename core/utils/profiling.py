@@ -0,0 +1,127 @@
+# core/utils/profiling.py
+"""
+Режим профилирования запуска анализа (main.py --profile).
+
+Пишет рядом с отчётами проекта (reports/<проект>/profiles/):
+  profile_<время>.pstats  — данные cProfile (snakeviz, python -m pstats);
+  profile_<время>.txt     — топ функций по суммарному времени;
+  memory_<время>.txt      — топ мест выделения памяти (tracemalloc, по --profile-memory);
+  profile_<время>.folded  — свёрнутые стеки для flame graph (по --profile-folded;
+                            формат flamegraph.pl / speedscope).
+cProfile видит только основной поток; загрузки на пуле потоков попадают в свёрнутые стеки.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from core.logging.logger import log
+
+PROFILE_TOP = 30
+SAMPLE_INTERVAL = 0.005
+
+
+def get_profile_dir(project_name):
+    """Папка профилей рядом с отчётами проекта."""
+    profile_dir = os.path.join("reports", project_name, "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    return profile_dir
+
+
+class StackSampler:
+    """
+    Сэмплирующий профайлер: фоновый поток раз в interval секунд снимает стеки всех потоков
+    и считает одинаковые стеки. Результат — свёрнутые стеки "корень;...;лист количество".
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile_run(output_dir, memory=False, folded=False, top=PROFILE_TOP):
+    """
+    Профилирует блок через cProfile; при memory=True дополнительно tracemalloc,
+    при folded=True — сэмплирование стеков для flame graph.
+    Возвращает (через as) словарь путей созданных файлов; он заполняется по выходу из блока.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    paths = {}
+
+    sampler = StackSampler() if folded else None
+    if memory:
+        tracemalloc.start()
+    if sampler:
+        sampler.start()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield paths
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+
+        paths["pstats"] = os.path.join(output_dir, f"profile_{stamp}.pstats")
+        profiler.dump_stats(paths["pstats"])
+
+        summary = io.StringIO()
+        summary.write(f"Время выполнения: {elapsed:.2f} с\n\n")
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(top)
+        paths["summary"] = os.path.join(output_dir, f"profile_{stamp}.txt")
+        with open(paths["summary"], "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+
+        if sampler:
+            sampler.stop()
+            paths["folded"] = os.path.join(output_dir, f"profile_{stamp}.folded")
+            sampler.write(paths["folded"])
+
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            paths["memory"] = os.path.join(output_dir, f"memory_{stamp}.txt")
+            with open(paths["memory"], "w", encoding="utf-8") as f:
+                f.write(f"Память: сейчас {current / 1024 / 1024:.1f} МБ, пик {peak / 1024 / 1024:.1f} МБ\n\n")
+                f.write(f"Топ-{top} мест выделения памяти:\n")
+                for stat in snapshot.statistics("lineno")[:top]:
+                    f.write(f"{stat}\n")
+
+        for kind, path in paths.items():
+            log(f"🧪 Профиль ({kind}) сохранён: {os.path.abspath(path)}")
+            print(f"🧪 Профиль ({kind}) сохранён: {os.path.abspath(path)}", flush=True)
@@ -1,8 +1,16 @@
+import io
+import tempfile
+import time
+import zipfile
+from functools import lru_cache
 import tiktoken
 from tqdm import tqdm
 import os
-from core.azure.repos import get_repo_files, get_file_content
+from core.azure.repos import get_repo_items, get_file_content, download_repo_archive, download_repo_archive_to_file
 from core.logging.logger import log
+from core.logging.metrics import record as record_span, span, timed
+from core.utils.concurrency import ordered_bounded_map
+from core.utils.token_memo import get_token_memo, git_blob_id, memo_key
 from dotenv import load_dotenv  # Для загрузки переменных из .env
 
 # Загрузка переменных окружения из .env
@@ -11,52 +19,487 @@ load_dotenv()
 # Получение белого списка из переменной окружения
 WHITE_EXTENSIONS = set(os.getenv("WHITE_EXTENSIONS", "").split(","))
 
-def count_tokens_in_repo(project_name, repository_name):
+# Способ загрузки содержимого: "archive" (один zip на репозиторий) или "files" (запрос на каждый файл)
+FETCH_MODE = os.getenv("FETCH_MODE", "archive")
+
+# Сколько файлов одновременно загружается в пофайловом режиме
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+
+# С какого числа изменённых файлов выгоднее скачать архив целиком, чем файлы по одному
+ARCHIVE_MIN_FILES = int(os.getenv("ARCHIVE_MIN_FILES", "200"))
+
+# Пакетный подсчёт токенов: размер пакета и число потоков tiktoken
+TOKENIZE_BATCH_SIZE = int(os.getenv("TOKENIZE_BATCH_SIZE", "64"))
+TOKENIZER_THREADS = int(os.getenv("TOKENIZER_THREADS", "8"))
+
+# Меньшие пакеты считаются в текущем потоке: пул потоков encode_ordinary_batch создаётся на каждый вызов
+# и для нескольких текстов обходится дороже самого подсчёта
+TOKENIZE_PARALLEL_MIN = int(os.getenv("TOKENIZE_PARALLEL_MIN", "8"))
+
+@timed("count_tokens")
+def count_tokens_in_repo(project_name, repository_name, fetch_mode=None, concurrency=None, cached_files=None):
     """
     Считает токены, строки кода и комментарии в файлах (у которых расширения в WHITE_EXTENSIONS).
+    fetch_mode: "archive" — весь репозиторий одним zip-архивом, "files" — по одному запросу на файл.
+    По умолчанию берётся из FETCH_MODE; если архив недоступен, используется пофайловая загрузка.
+    concurrency: сколько файлов загружать одновременно в пофайловом режиме (по умолчанию FETCH_CONCURRENCY).
+    Порядок files_data совпадает с порядком файлов в репозитории независимо от concurrency.
+    cached_files: files_data из кэша репозитория. Файлы, у которых objectId не изменился,
+    берутся из него без загрузки; архив качается, только если изменилось не меньше
+    ARCHIVE_MIN_FILES файлов, иначе изменённые файлы загружаются по одному.
+    Метрики уже встречавшихся блобов берутся из мемо токенов (см. core.utils.token_memo):
+    в пофайловом режиме такие файлы даже не скачиваются.
+    Возвращает (files_data, total_tokens).
+    files_data -> [{"path": ..., "object_id": ..., "tokens": int, "lines": int, "comments": int}, ...]
+    """
+    plan = plan_repo_fetch(project_name, repository_name, fetch_mode, cached_files)
+    if plan is None:
+        return [], 0
+    fetch_repo_files(project_name, repository_name, plan, concurrency)
+    return count_fetched_files(repository_name, plan)
+
+def iter_repo_files(project_name, repository_name, fetch_mode=None, concurrency=None, cached_files=None,
+                    on_content=None):
+    """
+    Потоковый вариант count_tokens_in_repo: отдаёт записи файлов по одной
+    ({"path", "object_id", "tokens", "lines", "comments"}), не накапливая их.
+    Записи идут в порядке листинга репозитория (как в count_tokens_in_repo): неизменившиеся файлы
+    из cached_files — на своих местах среди посчитанных. Архив пишется во временный файл, а содержимое файла живёт только пока считаются
+    его метрики, поэтому память не зависит от размера репозитория.
+    on_content(record, content) — вызывается для каждого посчитанного файла, пока его
+    содержимое ещё в памяти (например, для ИИ-анализа). В этом режиме содержимое нужно
+    каждому файлу, поэтому cached_files и мемо не позволяют пропускать загрузку.
+    """
+    if on_content is not None:
+        cached_files = None
+    plan = plan_repo_fetch(project_name, repository_name, fetch_mode, cached_files)
+    if plan is None:
+        return
+    # Загрузка ленивая, поэтому замеряется весь перебор, а не только fetch_repo_files.
+    # span() здесь не подходит: он меняет контекст вызывающего кода между yield.
+    started = time.time()
+    clock = time.perf_counter()
+    try:
+        fetch_repo_files(project_name, repository_name, plan, concurrency, spool=True,
+                         need_content=on_content is not None)
+        ordered = "archive" not in plan
+        records = iter_fetched_files(repository_name, plan, on_content)
+        if plan["whitelisted"] is None:
+            yield from records
+        else:
+            yield from _iter_in_order(plan["whitelisted"], plan["reused"], records, ordered)
+    finally:
+        record_span("count_tokens", time.perf_counter() - clock, repository=repository_name, started=started)
+
+def plan_repo_fetch(project_name, repository_name, fetch_mode=None, cached_files=None):
+    """
+    Первый шаг подсчёта: решает, что и как загружать.
+    При наличии cached_files (или в пофайловом режиме) запрашивает листинг и отбирает
+    неизменившиеся файлы. Возвращает план — словарь:
+      fetch_mode, whitelisted (None, если листинг не запрашивался), reused {path: запись},
+      pending (файлы к загрузке или None — весь репозиторий), use_archive.
+    Возвращает None, если листинг получить не удалось.
+    """
+    fetch_mode = fetch_mode or FETCH_MODE
+    log(f"📊 Начало подсчёта токенов, строк и комментариев в {repository_name} (белый список, режим: {fetch_mode}).")
+
+    whitelisted = None
+    reused = {}
+    if cached_files or fetch_mode != "archive":
+        whitelisted = _list_whitelisted(project_name, repository_name)
+        if whitelisted is None:
+            return None
+        reused = _reuse_unchanged(whitelisted, cached_files or [])
+        if reused:
+            log(f"♻ {repository_name}: {len(reused)} из {len(whitelisted)} файлов не изменились, берём из кэша")
+
+    pending = whitelisted if whitelisted is None else [item for item in whitelisted if item["path"] not in reused]
+    return {
+        "fetch_mode": fetch_mode,
+        "whitelisted": whitelisted,
+        "reused": reused,
+        "pending": pending,
+        "use_archive": fetch_mode == "archive" and (pending is None or len(pending) >= ARCHIVE_MIN_FILES),
+    }
+
+def fetch_repo_files(project_name, repository_name, plan, concurrency=None, materialize=False, spool=False,
+                     need_content=False):
+    """
+    Второй шаг: загружает содержимое по плану.
+    В режиме архива кладёт в plan["archive"] байты zip (spool=True — временный файл); если архив недоступен,
+    переключается на пофайловую загрузку: plan["fetched"] — итератор (path, object_id, content|None),
+    plan["known"] — метрики блобов, найденных в мемо (такие файлы не скачиваются, если не need_content).
+    materialize=True загружает файлы сразу (список вместо ленивого итератора); вместе со spool=True
+    содержимое загруженных файлов пишется во временный файл на диске (_SpooledFetch), а в памяти
+    остаются только пути.
+    Возвращает plan.
+    """
+    if plan["use_archive"]:
+        if spool:
+            archive = download_repo_archive_to_file(project_name, repository_name)
+        else:
+            archive = download_repo_archive(project_name, repository_name)
+        if archive is not None:
+            plan["archive"] = archive
+            return plan
+        log(f"⚠ Архив {repository_name} недоступен, переключаемся на пофайловую загрузку", level="WARNING")
+        plan["use_archive"] = False
+
+    if plan["pending"] is None:
+        whitelisted = _list_whitelisted(project_name, repository_name)
+        plan["whitelisted"] = plan["pending"] = whitelisted or []
+
+    fetched, known = _fetch_items(project_name, repository_name, plan["pending"], concurrency, need_content)
+    if materialize:
+        fetched = _SpooledFetch(fetched) if spool else list(fetched)
+    plan["fetched"] = fetched
+    plan["known"] = known
+    return plan
+
+def count_fetched_files(repository_name, plan, on_record=None):
+    """
+    Третий шаг: декодирует загруженное и считает метрики, объединяя их с файлами из кэша
+    в порядке листинга. Байты архива из плана освобождаются.
+    on_record(record) вызывается для каждого посчитанного файла (например, контрольная точка запуска).
     Возвращает (files_data, total_tokens).
-    files_data -> [{"path": ..., "tokens": int, "lines": int, "comments": int}, ...]
     """
-    total_tokens = 0
     files_data = []
-    log(f"📊 Начало подсчёта токенов, строк и комментариев в {repository_name} (белый список).")
+    for record in iter_fetched_files(repository_name, plan):
+        files_data.append(record)
+        if on_record:
+            on_record(record)
+    if plan["whitelisted"] is None:
+        return files_data, sum(record["tokens"] for record in files_data)
+    return _merge_in_order(plan["whitelisted"], plan["reused"], files_data)
+
+def iter_fetched_files(repository_name, plan, on_content=None):
+    """
+    Декодирует загруженное по плану и отдаёт записи посчитанных файлов по мере подсчёта
+    (файлы из кэша plan["reused"] не включаются). Архив из плана освобождается (файл закрывается).
+    """
+    memo = get_token_memo()
+    archive = plan.pop("archive", None)
+    if archive is not None:
+        try:
+            entries = iter_archive_entries(archive, repository_name)
+            if entries is None:
+                return
+            if plan["whitelisted"] is not None:
+                pending_paths = {item["path"] for item in plan["pending"]}
+                entries = (entry for entry in entries if entry[0] in pending_paths)
+            yield from _iter_files_data(entries, memo, repository_name, on_content=on_content)
+        finally:
+            if hasattr(archive, "close"):
+                archive.close()
+    else:
+        fetched = plan.pop("fetched", [])
+        try:
+            yield from _iter_files_data(
+                tqdm(fetched, total=len(plan["pending"]), desc="Обработка файлов"),
+                memo, repository_name, plan.get("known"), on_content
+            )
+        finally:
+            if hasattr(fetched, "close"):
+                fetched.close()
+
+class _SpooledFetch:
+    """
+    Загруженные файлы на диске: содержимое пишется во временный файл по мере загрузки,
+    в памяти остаются только пути, objectId и длины. Итерация отдаёт (path, object_id, content|None),
+    читая содержимое по одному файлу. Временный файл удаляется при close().
+    """
+    def __init__(self, fetched):
+        self._file = tempfile.TemporaryFile()
+        self._index = []
+        try:
+            for path, object_id, content in fetched:
+                if content is None:
+                    self._index.append((path, object_id, -1))
+                    continue
+                data = content.encode("utf-8")
+                self._file.write(data)
+                self._index.append((path, object_id, len(data)))
+        except BaseException:
+            self._file.close()
+            raise
+        self.nbytes = self._file.tell()
 
-    files = get_repo_files(project_name, repository_name)
-    if not files:
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        self._file.seek(0)
+        for path, object_id, length in self._index:
+            yield path, object_id, None if length < 0 else self._file.read(length).decode("utf-8")
+
+    def close(self):
+        self._file.close()
+
+def _list_whitelisted(project_name, repository_name):
+    """Листинг репозитория, отфильтрованный по белому списку, или None при ошибке."""
+    items = get_repo_items(project_name, repository_name)
+    if not items:
         log(f"⚠ Не удалось получить файлы для {repository_name}", level="WARNING")
-        return [], 0
+        return None
+    return [item for item in items if is_whitelisted(item["path"])]
+
+def count_tokens_for_items(project_name, repository_name, items, concurrency=None):
+    """
+    Считает метрики для заданного списка файлов [{"path", "object_id"}, ...], загружая их по одному.
+    Файлы, чьи блобы уже есть в мемо токенов, не скачиваются.
+    Возвращает (files_data, total_tokens) в порядке items; пустые файлы пропускаются.
+    """
+    fetched_files, known = _fetch_items(project_name, repository_name, items, concurrency)
+    return _collect_files_data(
+        tqdm(fetched_files, total=len(items), desc="Обработка файлов"), get_token_memo(), repository_name, known
+    )
+
+def _fetch_items(project_name, repository_name, items, concurrency=None, need_content=False):
+    """
+    Загружает файлы items на пуле потоков, пропуская блобы, уже известные мемо
+    (если need_content — загружаются все файлы).
+    Возвращает (итератор (path, object_id, content|None) в порядке items, known из мемо).
+    """
+    memo = get_token_memo()
+    known = {} if need_content else memo.get_many(
+        memo_key(item["object_id"], item["path"]) for item in items if item.get("object_id")
+    )
+
+    def fetch(item):
+        file_path, object_id = item["path"], item.get("object_id")
+        if object_id and memo_key(object_id, file_path) in known:
+            return file_path, object_id, None
+        return file_path, object_id, get_file_content(project_name, repository_name, file_path)
+
+    # Загрузка идёт на пуле потоков, а подсчёт метрик — у потребителя,
+    # пока следующие файлы ещё скачиваются.
+    return ordered_bounded_map(fetch, items, concurrency or FETCH_CONCURRENCY), known
 
-    for file_path in tqdm(files, desc="Обработка файлов"):
-        _, ext = os.path.splitext(file_path.lower())
-        if ext not in WHITE_EXTENSIONS:
+def _reuse_unchanged(whitelisted, cached_files):
+    """
+    Возвращает {path: запись из кэша} для файлов, objectId которых совпадает с закэшированным.
+    """
+    cached_by_path = {f["path"]: f for f in cached_files if "path" in f}
+    reused = {}
+    for item in whitelisted:
+        cached = cached_by_path.get(item["path"])
+        if not cached or not item.get("object_id"):
             continue
+        if (cached.get("object_id") or cached.get("hash")) == item["object_id"]:
+            record = dict(cached)
+            record["object_id"] = item["object_id"]
+            reused[item["path"]] = record
+    return reused
 
-        content = get_file_content(project_name, repository_name, file_path)
-        if not content.strip():
+def _merge_in_order(whitelisted, reused, files_data):
+    """
+    Объединяет записи из кэша и заново посчитанные в порядке листинга репозитория.
+    Возвращает (files_data, total_tokens).
+    """
+    counted = {record["path"]: record for record in files_data}
+    merged = []
+    for item in whitelisted:
+        record = reused.get(item["path"]) or counted.get(item["path"])
+        if record is not None:
+            merged.append(record)
+    return merged, sum(record.get("tokens", 0) for record in merged)
+
+def _iter_in_order(whitelisted, reused, records, ordered):
+    """
+    Потоковый вариант _merge_in_order: отдаёт записи из кэша и посчитанные (records) в порядке листинга.
+    ordered=True — records идут в порядке листинга (пофайловая загрузка), и файлы перед пришедшим,
+    которых нет, уже не придут (пустые). Иначе (архив) записи, пришедшие раньше своей очереди,
+    ждут в буфере — только метрики, без содержимого.
+    """
+    position = {item["path"]: index for index, item in enumerate(whitelisted)}
+    waiting = {}
+    next_index = 0
+    for record in records:
+        index = position.get(record["path"])
+        if index is None:
+            yield record
             continue
+        waiting[index] = record
+        while next_index < len(whitelisted):
+            ready = reused.get(whitelisted[next_index]["path"]) or waiting.pop(next_index, None)
+            if ready is not None:
+                yield ready
+            elif not ordered or next_index > index:
+                break
+            next_index += 1
+    for index in range(next_index, len(whitelisted)):
+        ready = reused.get(whitelisted[index]["path"]) or waiting.pop(index, None)
+        if ready is not None:
+            yield ready
+
+def iter_archive_files(project_name, repository_name):
+    """
+    Скачивает репозиторий одним zip-архивом и возвращает итератор (path, object_id, content)
+    по файлам из белого списка (см. iter_archive_entries).
+    Возвращает None, если архив получить или открыть не удалось.
+    """
+    archive = download_repo_archive(project_name, repository_name)
+    if archive is None:
+        return None
+    return iter_archive_entries(archive, repository_name)
+
+def iter_archive_entries(archive, repository_name):
+    """
+    Разбирает zip-архив репозитория (байты или открытый файл) и возвращает итератор (path, object_id, content)
+    по файлам из белого списка. object_id считается по байтам файла так же, как в git.
+    Файлы читаются из архива по одному.
+    Возвращает None, если архив повреждён.
+    """
+    try:
+        zip_file = zipfile.ZipFile(io.BytesIO(archive) if isinstance(archive, bytes) else archive)
+    except zipfile.BadZipFile as e:
+        log(f"❌ Повреждённый архив репозитория {repository_name}: {e}", level="ERROR")
+        return None
+
+    def iter_entries():
+        with zip_file:
+            for entry in tqdm(zip_file.infolist(), desc="Обработка файлов"):
+                if entry.is_dir():
+                    continue
+                # Пути в архиве относительные; приводим к виду путей Azure ("/src/x.cs")
+                file_path = "/" + entry.filename.lstrip("/")
+                if not is_whitelisted(file_path):
+                    continue
+                with span("decode", repository=repository_name) as s:
+                    data = zip_file.read(entry)
+                    s.bytes = len(data)
+                    entry_data = (file_path, git_blob_id(data), data.decode("utf-8", errors="ignore"))
+                yield entry_data
+
+    return iter_entries()
 
-        # Подсчитываем токены
+def is_whitelisted(file_path):
+    """Проверяет, входит ли расширение файла в WHITE_EXTENSIONS."""
+    _, ext = os.path.splitext(file_path.lower())
+    return ext in WHITE_EXTENSIONS
+
+def build_file_record(file_path, content, tokens_count=None):
+    """
+    Считает метрики одного файла: токены, строки и комментарии.
+    tokens_count можно передать заранее (например, из пакетного подсчёта).
+    Возвращает словарь для files_data или None, если файл пуст.
+    """
+    if not content.strip():
+        return None
+
+    _, ext = os.path.splitext(file_path.lower())
+
+    # Подсчитываем токены
+    if tokens_count is None:
         tokens_count = count_tokens_in_text(content)
 
-        # Подсчитываем строки (простой способ)
-        lines_count = content.count('\n') + 1
+    # Подсчитываем строки (простой способ)
+    lines_count = content.count('\n') + 1
 
-        # Подсчитываем комментарии (наивная реализация)
-        comments_count = count_comments_naive(content, ext)
+    # Подсчитываем комментарии (наивная реализация)
+    comments_count = count_comments_naive(content, ext)
 
-        files_data.append({
-            "path": file_path,
-            "tokens": tokens_count,
-            "lines": lines_count,
-            "comments": comments_count,
-        })
-        total_tokens += tokens_count
+    return {
+        "path": file_path,
+        "tokens": tokens_count,
+        "lines": lines_count,
+        "comments": comments_count,
+    }
 
-    return files_data, total_tokens
+def _collect_files_data(fetched_files, memo, repository_name, known=None):
+    """
+    Прогоняет итератор (path, object_id, content) через подсчёт метрик.
+    Возвращает (files_data, total_tokens).
+    """
+    files_data = list(_iter_files_data(fetched_files, memo, repository_name, known))
+    return files_data, sum(record["tokens"] for record in files_data)
+
+def _iter_files_data(fetched_files, memo, repository_name, known=None, on_content=None):
+    """
+    Потоково считает метрики для итератора (path, object_id, content) и отдаёт записи файлов.
+    content=None означает, что файл не скачивался, и его метрики есть в known.
+    Если known не передан, мемо опрашивается по каждому пакету.
+    Токены новых файлов считаются пакетами по TOKENIZE_BATCH_SIZE и сохраняются в мемо;
+    в памяти одновременно держится содержимое не больше одного пакета.
+    on_content(record, content) вызывается для каждого файла с содержимым, пока оно ещё в памяти.
+    """
+    processed = 0
+    memo_hits = 0
+    for batch in _iter_batches(fetched_files, TOKENIZE_BATCH_SIZE):
+        keys = [memo_key(object_id, file_path) if object_id else None for file_path, object_id, _ in batch]
+        cached = known if known is not None else memo.get_many(key for key in keys if key)
+
+        to_count = [
+            (key, file_path, object_id, content)
+            for key, (file_path, object_id, content) in zip(keys, batch)
+            if key not in cached and content and content.strip()
+        ]
+        with span("tokenize", repository=repository_name):
+            tokens_counts = count_tokens_in_texts([content for _, _, _, content in to_count])
+        counted = {}
+        new_entries = {}
+        with span("comments", repository=repository_name):
+            for (key, file_path, object_id, content), tokens_count in zip(to_count, tokens_counts):
+                record = build_file_record(file_path, content, tokens_count)
+                counted[file_path] = record
+                if key:
+                    new_entries[key] = record
+        memo.put_many(new_entries)
+
+        for key, (file_path, object_id, content) in zip(keys, batch):
+            if key in cached:
+                record = {"path": file_path, **cached[key]}
+                memo_hits += 1
+            else:
+                record = counted.get(file_path)
+                if record is None:
+                    continue
+            record["object_id"] = object_id
+            if on_content is not None and content and content.strip():
+                on_content(record, content)
+            processed += 1
+            yield record
+        del batch, to_count
+
+    if processed:
+        log(f"🧠 Мемо токенов для {repository_name}: попаданий {memo_hits} из {processed} "
+            f"({memo_hits / processed:.0%})")
+
+def _iter_batches(items, batch_size):
+    """Разбивает итератор на списки длиной не больше batch_size."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@lru_cache(maxsize=None)
+def get_encoder(model_encoding="cl100k_base"):
+    """Возвращает кодировщик tiktoken; создаётся один раз на кодировку."""
+    return tiktoken.get_encoding(model_encoding)
+
+def count_tokens_in_texts(texts, model_encoding="cl100k_base", num_threads=None):
+    """
+    Считает токены сразу для списка текстов через пакетный многопоточный encode tiktoken
+    (пакеты меньше TOKENIZE_PARALLEL_MIN — в текущем потоке).
+    Спецтокены вроде <|endoftext|> считаются обычным текстом.
+    Возвращает список количеств токенов в том же порядке.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    encoding = get_encoder(model_encoding)
+    if len(texts) < TOKENIZE_PARALLEL_MIN:
+        return [len(encoding.encode_ordinary(text)) for text in texts]
+    encoded = encoding.encode_ordinary_batch(texts, num_threads=num_threads or TOKENIZER_THREADS)
+    return [len(tokens) for tokens in encoded]
 
 def count_tokens_in_text(text, model_encoding="cl100k_base"):
-    encoding = tiktoken.get_encoding(model_encoding)
-    return len(encoding.encode(text))
+    """Токены одного текста (как count_tokens_in_texts, но без пула потоков)."""
+    return len(get_encoder(model_encoding).encode_ordinary(text))
 
 def count_comments_naive(content, ext):
     """
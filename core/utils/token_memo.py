@@ -0,0 +1,207 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from core.logging.logger import log
+from core.utils import cache
+
+# Максимальное число записей в мемо; при превышении вытесняются давно не использованные
+TOKEN_MEMO_MAX_ENTRIES = int(os.getenv("TOKEN_MEMO_MAX_ENTRIES", "500000"))
+
+MEMO_FILENAME = "token_memo.db"
+
+# Оценка байт на запись мемо сверх ключа (числа и служебные данные SQLite)
+MEMO_ROW_OVERHEAD = 40
+
+
+def git_blob_id(data):
+    """
+    Считает objectId git-блоба (sha1 от "blob <size>\\0" + содержимое) —
+    тот же идентификатор, что Azure DevOps отдаёт в objectId элементов репозитория.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    header = f"blob {len(data)}\0".encode("ascii")
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def memo_key(object_id, file_path, model_encoding="cl100k_base"):
+    """
+    Ключ мемо: objectId блоба + расширение (от него зависит подсчёт комментариев) + кодировка.
+    """
+    _, ext = os.path.splitext(file_path.lower())
+    return f"{object_id}:{ext}:{model_encoding}"
+
+
+class TokenMemo:
+    """
+    Постоянное хранилище метрик файлов (tokens, lines, comments), общее для всех
+    репозиториев и запусков. Ключ — memo_key() от objectId содержимого.
+    Хранится в SQLite (WAL), поэтому безопасно используется из нескольких потоков и процессов.
+    При превышении max_entries вытесняются записи, к которым дольше всего не обращались (LRU).
+    Число записей отслеживается по вставкам (с запасом: замена записи тоже считается), а точный
+    COUNT(*) выполняется, только когда оценка превысила лимит. Время обращения (last_used)
+    обновляется не чаще раза в cache.CACHE_TOUCH_INTERVAL секунд на запись.
+    Общий бюджет кэша и срок жизни записей соблюдает core.utils.cache_manager
+    (usage, iter_lru, expire, evict).
+    """
+    def __init__(self, db_path, max_entries=TOKEN_MEMO_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS memo(
+            key TEXT PRIMARY KEY,
+            tokens INTEGER,
+            lines INTEGER,
+            comments INTEGER,
+            last_used REAL
+        )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memo_last_used ON memo(last_used)")
+        self._conn.commit()
+        (self._entries,) = self._conn.execute("SELECT COUNT(*) FROM memo").fetchone()
+
+    def get_many(self, keys):
+        """
+        Возвращает {key: {"tokens", "lines", "comments"}} для найденных ключей
+        и отмечает как недавно использованные те, к которым давно не обращались.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        stale_before = now - cache.CACHE_TOUCH_INTERVAL
+        stale = []
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, tokens, lines, comments, last_used FROM memo WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, tokens, lines, comments, last_used in rows:
+                    found[key] = {"tokens": tokens, "lines": lines, "comments": comments}
+                    if last_used is None or last_used < stale_before:
+                        stale.append(key)
+            if stale:
+                for start in range(0, len(stale), 500):
+                    chunk = stale[start:start + 500]
+                    self._conn.execute(
+                        f"UPDATE memo SET last_used = ? WHERE key IN ({','.join('?' * len(chunk))})", [now] + chunk
+                    )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, records):
+        """
+        Сохраняет метрики: records — {key: {"tokens", "lines", "comments"}}.
+        """
+        if not records:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO memo(key, tokens, lines, comments, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(key, r["tokens"], r["lines"], r["comments"], now) for key, r in records.items()]
+            )
+            self._conn.commit()
+            self._entries += len(records)
+            if self._entries > self.max_entries:
+                self._evict_locked()
+
+    def _evict_locked(self):
+        """Вытесняет самые давно использованные записи, если мемо переполнено."""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM memo").fetchone()
+        self._entries = count
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+        # Освобождаем с запасом 10%, чтобы не вытеснять на каждой записи
+        to_remove = overflow + self.max_entries // 10
+        self._conn.execute(
+            "DELETE FROM memo WHERE key IN (SELECT key FROM memo ORDER BY last_used LIMIT ?)", (to_remove,)
+        )
+        self._conn.commit()
+        self._entries = max(0, count - to_remove)
+        self.evictions += to_remove
+        log(f"🧹 Мемо токенов: вытеснено {to_remove} записей (лимит {self.max_entries})")
+
+    def usage(self):
+        """{"entries": число записей, "bytes": оценка их размера}."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(LENGTH(key)), 0) + COUNT(*) * {MEMO_ROW_OVERHEAD} FROM memo"
+            ).fetchone()
+            self._entries = entries
+        return {"entries": entries, "bytes": size}
+
+    def iter_lru(self, batch=1000):
+        """Записи от давно не использованных к недавним: (last_used, key, байт)."""
+        position = (-1.0, "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT last_used, key, LENGTH(key) + {MEMO_ROW_OVERHEAD} FROM memo "
+                    "WHERE (last_used, key) > (?, ?) ORDER BY last_used, key LIMIT ?", (*position, batch)
+                ).fetchall()
+            yield from rows
+            if len(rows) < batch:
+                return
+            position = rows[-1][:2]
+
+    def expire(self, cutoff):
+        """Удаляет записи, к которым не обращались с момента cutoff (time.time()). Возвращает их число."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM memo WHERE last_used < ?", (cutoff,)).rowcount
+            self._conn.commit()
+            self._entries = max(0, self._entries - removed)
+            self.evictions += removed
+        return removed
+
+    def evict(self, keys):
+        """Удаляет записи с ключами keys. Возвращает их число."""
+        keys = list(keys)
+        with self._lock:
+            self._conn.executemany("DELETE FROM memo WHERE key = ?", [(key,) for key in keys])
+            self._conn.commit()
+            self._entries = max(0, self._entries - len(keys))
+            self.evictions += len(keys)
+        return len(keys)
+
+    def stats(self):
+        """Возвращает счётчики попаданий, промахов и вытеснений за время жизни объекта."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def get_token_memo():
+    """Возвращает общее для процесса мемо токенов (файл token_memo.db в папке кэша)."""
+    global _memo
+    with _memo_lock:
+        db_path = os.path.join(cache.CACHE_DIR, MEMO_FILENAME)
+        if _memo is None or _memo.db_path != db_path:
+            os.makedirs(cache.CACHE_DIR, exist_ok=True)
+            _memo = TokenMemo(db_path)
+        return _memo
@@ -1,9 +1,15 @@
 # main.py
+import argparse
+import sys
+from contextlib import nullcontext
 from core.utils.common import select_project, select_repositories
 from core.analyze.repository_analysis import analyze_repository
 from core.analyze.batch_analysis import analyze_all_repositories
+from core.analyze.jobs import load_job_spec, validate_job_spec, run_job
 from core.logging.logger import log
 from core.utils.cache import clear_project_summary_cache, clear_cache_for_repo
+from core.azure.repo_commits import get_last_commit
+from core.utils.profiling import profile_run, get_profile_dir, PROFILE_TOP
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -28,10 +34,48 @@ def choose_analysis_mode() -> str:
         else:
             print("Неверный выбор, попробуйте снова.")
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Анализ репозиториев Azure DevOps")
+    headless = parser.add_argument_group("запуск без вопросов (для планировщика и CI)")
+    headless.add_argument("--job", metavar="FILE",
+                          help="Файл задания JSON/YAML: проекты, фильтры репозиториев, тип анализа (см. core/analyze/jobs.py)")
+    headless.add_argument("--project", action="append", metavar="NAME",
+                          help="Проект (или glob-шаблон) для анализа без вопросов; можно указать несколько раз")
+    headless.add_argument("--include", action="append", metavar="PATTERN",
+                          help="Вместе с --project: анализировать только репозитории под шаблон")
+    headless.add_argument("--exclude", action="append", metavar="PATTERN",
+                          help="Вместе с --project: пропустить репозитории под шаблон")
+    headless.add_argument("--mode", choices=["fast", "deep"], default="fast",
+                          help="Вместе с --project: тип анализа (по умолчанию fast)")
+    headless.add_argument("--clear-cache", action="store_true",
+                          help="Вместе с --project: очистить кэш проекта перед анализом")
+    headless.add_argument("--output", metavar="FILE", help="Вместе с --project: записать итоги в JSON")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Сколько репозиториев анализировать одновременно (по умолчанию ANALYSIS_WORKERS из окружения)")
+    parser.add_argument("--executor", choices=["pool", "pipeline"], default=None,
+                        help="pool — репозитории целиком на пуле потоков, pipeline — конвейер этапов "
+                             "(по умолчанию ANALYSIS_EXECUTOR из окружения)")
+    parser.add_argument("--resume", metavar="RUN_ID", default=None,
+                        help="Продолжить прерванный анализ всех репозиториев с тем же идентификатором запуска "
+                             "(список запусков: python -m core.utils.checkpoints list)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Профилировать анализ (cProfile); результаты — в reports/<проект>/profiles")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Вместе с --profile: топ мест выделения памяти (tracemalloc)")
+    parser.add_argument("--profile-folded", action="store_true",
+                        help="Вместе с --profile: свёрнутые стеки для flame graph")
+    parser.add_argument("--profile-top", type=int, default=PROFILE_TOP,
+                        help=f"Сколько строк выводить в отчётах профиля (по умолчанию {PROFILE_TOP})")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     log("🚀 Запуск приложения...")
     print("🚀 Запуск приложения...", flush=True)
 
+    if args.job or args.project:
+        return run_headless(args)
+
     # 1. Выбор проекта
     project_name = select_project()
     if not project_name:
@@ -51,7 +95,68 @@ def main():
     analysis_mode = choose_analysis_mode()
     print(f"\nВыбран тип анализа: {'Глубокий ИИ анализ' if analysis_mode == 'deep' else 'Быстрый анализ'}\n", flush=True)
 
-    # 4. Запуск анализа
+    # 4. Запуск анализа (при --profile — под профайлером)
+    if args.profile:
+        profiler = profile_run(get_profile_dir(project_name), memory=args.profile_memory,
+                               folded=args.profile_folded, top=args.profile_top)
+    else:
+        profiler = nullcontext()
+
+    run_analysis(project_name, repositories, single_repository, analysis_mode, profiler, args.workers, args.executor,
+                 args.resume)
+
+    print(f"🎉 Анализ завершён для {project_name}", flush=True)
+    log(f"🎉 Анализ завершён для {project_name}")
+
+def run_headless(args):
+    """
+    Запуск без вопросов: задание из файла --job или из параметров --project.
+    Возвращает код выхода: 0 — все проекты обработаны, 1 — были ошибки.
+    """
+    try:
+        if args.job:
+            job = load_job_spec(args.job)
+        else:
+            spec = {
+                "mode": args.mode,
+                "clear_cache": args.clear_cache,
+                "projects": [
+                    {"name": name, "include": args.include or [], "exclude": args.exclude or []}
+                    for name in args.project
+                ],
+            }
+            if args.workers:
+                spec["workers"] = args.workers
+            if args.executor:
+                spec["executor"] = args.executor
+            if args.output:
+                spec["output"] = args.output
+            job = validate_job_spec(spec)
+    except (OSError, ValueError) as e:
+        log(f"❌ Ошибка в задании: {e}", level="ERROR")
+        print(f"❌ Ошибка в задании: {e}", flush=True)
+        return 2
+
+    if args.profile:
+        profiler = profile_run(get_profile_dir("jobs"), memory=args.profile_memory,
+                               folded=args.profile_folded, top=args.profile_top)
+    else:
+        profiler = nullcontext()
+    with profiler:
+        outcome = run_job(job, args.resume)
+
+    for project in outcome["projects"]:
+        print(f"{'✅' if project['status'] == 'ok' else '⚠'} {project['project']}: {project['status']}, "
+              f"репозиториев {len(project['repositories'])}", flush=True)
+    return 0 if all(project["status"] == "ok" for project in outcome["projects"]) else 1
+
+def run_analysis(project_name, repositories, single_repository, analysis_mode, profiler, workers=None,
+                 executor=None, run_id=None):
+    """
+    Запускает анализ всех выбранных репозиториев или одного репозитория.
+    Сам анализ (без вопросов пользователю) выполняется внутри контекста profiler.
+    run_id — продолжить прерванный запуск анализа всех репозиториев.
+    """
     # 4a. Если выбраны ВСЕ репозитории:
     if repositories:
         print(f"\nОчистить кэш проекта {project_name}?")
@@ -65,7 +170,9 @@ def main():
             print(f"🗑️ Кэш очищен для проекта: {project_name}\n")
 
         print(f"[DEBUG] Старт анализа, выбран проект: {project_name}, Кол-во репозиториев: {len(repositories)}", flush=True)
-        analyze_all_repositories(project_name, repositories, analysis_mode)
+        with profiler:
+            analyze_all_repositories(project_name, repositories, analysis_mode, workers, executor=executor,
+                                     run_id=run_id)
 
     # 4b. Если выбран ОДИН репозиторий:
     else:
@@ -82,10 +189,10 @@ def main():
 
         print(f"[DEBUG] Старт анализа одного репозитория: {repo_name}", flush=True)
         # При одиночном анализе также передаём тип анализа
-        analyze_repository(project_name, single_repository, repo_changed=True, analysis_mode=analysis_mode)
-
-    print(f"🎉 Анализ завершён для {project_name}", flush=True)
-    log(f"🎉 Анализ завершён для {project_name}")
+        with profiler:
+            head_commit = get_last_commit(project_name, single_repository)
+            analyze_repository(project_name, single_repository, repo_changed=True, analysis_mode=analysis_mode,
+                               head_commit=head_commit)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
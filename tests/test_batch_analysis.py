@@ -0,0 +1,174 @@
+# tests/test_batch_analysis.py
+from types import SimpleNamespace
+
+import pytest
+
+from core.analyze import batch_analysis
+
+@pytest.fixture
+def calls(monkeypatch, tmp_path):
+    """
+    Патчим зависимости batch_analysis и запоминаем, с какими параметрами вызывался анализ.
+    Контрольные точки и кэш пишутся во временную папку, манифесты запусков — во временную папку отчётов.
+    """
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("core.reports.generate.REPORTS_DIR", str(tmp_path / "reports"))
+    monkeypatch.setattr("core.reports.artifacts.REPORTS_DIR", str(tmp_path / "reports"))
+    recorded = {"analyzed": [], "checked": []}
+
+    def fake_is_repo_changed(project_name, repository_name):
+        recorded["checked"].append(repository_name)
+        return True
+
+    def fake_analyze_repository(project_name, repository, repo_changed, analysis_mode, head_commit=None,
+                                checkpoint=None):
+        recorded["analyzed"].append((repository.name, repo_changed, head_commit))
+        return {"repository": repository.name, "tokens": 1, "files": [], "report_path": None}
+
+    monkeypatch.setattr(batch_analysis, "get_head_commits", lambda project, repos: {"A": "h1", "B": "h2-new"})
+    monkeypatch.setattr(batch_analysis, "load_project_heads", lambda project: {"A": "h1", "B": "h2-old"})
+    monkeypatch.setattr(batch_analysis, "is_repo_changed", fake_is_repo_changed)
+    monkeypatch.setattr(batch_analysis, "analyze_repository", fake_analyze_repository)
+    monkeypatch.setattr(batch_analysis, "generate_summary", lambda project, results: None)
+    monkeypatch.setattr(batch_analysis, "get_connection_stats", lambda: {"http_connections": 0, "http_requests": 0, "reused": 0})
+    return recorded
+
+def test_unchanged_head_skips_file_level_check(calls):
+    """
+    Репозиторий с тем же head-коммитом считается неизменённым без вызова is_repo_changed,
+    а для остальных выполняется обычная проверка.
+    """
+    repositories = [SimpleNamespace(name="A"), SimpleNamespace(name="B")]
+
+    batch_analysis.analyze_all_repositories("TestProject", repositories, "fast")
+
+    assert calls["checked"] == ["B"], "Для A проверка по файлам не нужна"
+    assert calls["analyzed"] == [("A", False, "h1"), ("B", True, "h2-new")]
+
+def test_moved_head_with_cached_commit_goes_straight_to_diff(calls, monkeypatch):
+    """
+    Если head сдвинулся, а в кэше есть проанализированный коммит, список файлов не запрашивается:
+    репозиторий сразу считается изменённым и анализируется по diff.
+    """
+    monkeypatch.setattr(batch_analysis, "load_repo_totals", lambda project, name: {"commit_id": "h2-old"})
+
+    batch_analysis.analyze_all_repositories("TestProject", [SimpleNamespace(name="B")], "fast")
+
+    assert calls["checked"] == []
+    assert calls["analyzed"] == [("B", True, "h2-new")]
+
+def test_parallel_run_keeps_order_and_isolates_errors(calls, monkeypatch, capsys):
+    """
+    При параллельном анализе блоки вывода идут в исходном порядке и не перемешиваются,
+    а ошибка одного репозитория не мешает остальным и сводному отчёту.
+    """
+    import threading
+    import time
+
+    started = []
+    summary = {}
+
+    def fake_analyze_repository(project_name, repository, repo_changed, analysis_mode, head_commit=None,
+                                checkpoint=None):
+        started.append(threading.current_thread().name)
+        if repository.name == "B":
+            raise RuntimeError("boom")
+        # Первый репозиторий самый медленный: остальные завершатся раньше
+        time.sleep(0.2 if repository.name == "A" else 0.01)
+        return {"repository": repository.name, "tokens": 1, "files": [], "report_path": None}
+
+    monkeypatch.setattr(batch_analysis, "get_head_commits", lambda project, repos: {})
+    monkeypatch.setattr(batch_analysis.scheduling, "estimate_costs",
+                        lambda project, repos, unchanged: {"A": 4, "B": 3, "C": 2, "D": 1})
+    monkeypatch.setattr(batch_analysis, "analyze_repository", fake_analyze_repository)
+    monkeypatch.setattr(batch_analysis, "generate_summary",
+                        lambda project, results: summary.setdefault("repos", [r["repository"] for r in results]))
+
+    repositories = [SimpleNamespace(name=name) for name in ("A", "B", "C", "D")]
+    batch_analysis.analyze_all_repositories("TestProject", repositories, "fast", workers=4)
+
+    assert summary["repos"] == ["A", "C", "D"]
+    assert len(set(started)) > 1, "Репозитории должны анализироваться на нескольких потоках"
+
+    out = capsys.readouterr().out
+    positions = [out.index(f"🔍 Идёт анализ {name}...") for name in ("A", "B", "C", "D")]
+    assert positions == sorted(positions)
+    assert "❌ Анализ B завершился с ошибкой: boom" in out
+    # Строки одного репозитория идут подряд
+    a_block = out[positions[0]:positions[1]]
+    assert "💠 Анализ A завершён" in a_block
+
+
+def test_parallel_run_starts_longest_first(calls, monkeypatch, capsys):
+    """
+    Репозитории запускаются по убыванию оценки, а сводный отчёт сохраняет исходный порядок.
+    """
+    summary = {}
+    monkeypatch.setattr(batch_analysis, "get_head_commits", lambda project, repos: {})
+    monkeypatch.setattr(batch_analysis.scheduling, "estimate_costs",
+                        lambda project, repos, unchanged: {"A": 1, "B": 100, "C": 10})
+    monkeypatch.setattr(batch_analysis, "generate_summary",
+                        lambda project, results: summary.setdefault("repos", [r["repository"] for r in results]))
+
+    repositories = [SimpleNamespace(name=name) for name in ("A", "B", "C")]
+    batch_analysis.analyze_all_repositories("TestProject", repositories, "fast", workers=2, policy="lpt")
+
+    out = capsys.readouterr().out
+    positions = [out.index(f"🔍 Идёт анализ {name}...") for name in ("B", "C", "A")]
+    assert positions == sorted(positions)
+    assert summary["repos"] == ["A", "B", "C"]
+
+
+def test_pipeline_run_compares_plan_with_actual_durations(calls, monkeypatch):
+    """
+    Конвейерный запуск передаёт в сверку плана с фактом время работы этапов над каждым репозиторием.
+    """
+    accuracy = {}
+    monkeypatch.setattr(batch_analysis.scheduling, "estimate_costs",
+                        lambda project, repos, unchanged: {"A": 1, "B": 3})
+    monkeypatch.setattr(batch_analysis.scheduling, "log_plan_accuracy",
+                        lambda names, estimates, actual, workers, wall_time: accuracy.update(actual))
+
+    def fake_run_pipeline(jobs, pipeline=None):
+        for job in jobs:
+            job.update(tokens=1, files=[], report_path="r.md", report_artifact=None, report_reused=False,
+                       elapsed={"A": 0.5, "B": 1.5}[job["repository"].name])
+            yield job
+
+    monkeypatch.setattr(batch_analysis.pipeline, "run_pipeline", fake_run_pipeline)
+
+    repositories = [SimpleNamespace(name=name) for name in ("A", "B")]
+    batch_analysis.analyze_all_repositories("TestProject", repositories, "fast", workers=2, executor="pipeline")
+
+    assert accuracy == {"A": 0.5, "B": 1.5}
+
+
+def test_resumed_run_skips_finished_repositories(calls, monkeypatch):
+    """
+    Повторный запуск с тем же run_id анализирует только репозитории, не завершённые в прерванном.
+    """
+    summary = {}
+    failing = {"B"}
+
+    def fake_analyze_repository(project_name, repository, repo_changed, analysis_mode, head_commit=None,
+                                checkpoint=None):
+        calls["analyzed"].append(repository.name)
+        if repository.name in failing:
+            raise RuntimeError("обрыв")
+        return {"repository": repository.name, "tokens": 5, "files": [{"path": "/a.py", "tokens": 5}],
+                "report_path": None}
+
+    monkeypatch.setattr(batch_analysis, "analyze_repository", fake_analyze_repository)
+    monkeypatch.setattr(batch_analysis, "generate_summary",
+                        lambda project, results: summary.update(repos={r["repository"]: r for r in results}))
+
+    repositories = [SimpleNamespace(name=name) for name in ("A", "B")]
+    batch_analysis.analyze_all_repositories("TestProject", repositories, "fast", run_id="run-1")
+
+    calls["analyzed"].clear()
+    failing.clear()
+    batch_analysis.analyze_all_repositories("TestProject", repositories, "fast", run_id="run-1")
+
+    assert calls["analyzed"] == ["B"], "Завершённый репозиторий A не должен анализироваться повторно"
+    assert list(summary["repos"]) == ["A", "B"]
+    assert summary["repos"]["A"]["totals"]["tokens"] == 5
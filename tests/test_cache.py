@@ -5,7 +5,16 @@ from core.utils.cache import (
     CACHE_DIR,
     get_cache_path,
     clear_cache_for_repo,
-    clear_project_summary_cache
+    clear_project_summary_cache,
+    is_repo_changed,
+    save_repo_data_to_cache,
+    load_repo_data_from_cache,
+    load_repo_totals,
+    load_project_heads,
+    update_repo_files,
+    migrate_json_cache,
+    get_cache_db,
+    RepoCacheWriter
 )
 
 @pytest.fixture
@@ -66,3 +75,177 @@ def test_clear_project_summary_cache(fake_cache_dir):
 
     # Проверяем, что файл удалён
     assert not os.path.exists(cache_file), "Сводный файл кэша проекта не был удалён!"
+
+def test_is_repo_changed_by_object_id(fake_cache_dir, monkeypatch):
+    """
+    Тест: репозиторий считается неизменённым, пока objectId файлов совпадают с кэшем,
+    и изменённым, если objectId файла поменялся или файл удалён.
+    """
+    monkeypatch.setattr("core.utils.token_counter.WHITE_EXTENSIONS", {".py"})
+    project_name = "TestProject"
+    repo_name = "TestRepo"
+    files_data = [
+        {"path": "/main.py", "object_id": "aaa", "tokens": 10},
+        {"path": "/utils.py", "object_id": "bbb", "tokens": 5},
+    ]
+    save_repo_data_to_cache(project_name, repo_name, 15, files_data)
+
+    items = [
+        {"path": "/main.py", "object_id": "aaa"},
+        {"path": "/utils.py", "object_id": "bbb"},
+        {"path": "/logo.png", "object_id": "ccc"},  # не в белом списке — не влияет
+    ]
+    assert not is_repo_changed(project_name, repo_name, items=items)
+
+    items[1] = {"path": "/utils.py", "object_id": "changed"}
+    assert is_repo_changed(project_name, repo_name, items=items)
+
+    assert is_repo_changed(project_name, repo_name, items=items[:1]), "Удалённый файл должен считаться изменением"
+
+def test_repo_cache_writer_streams_records(fake_cache_dir):
+    """
+    Потоковая запись: кэш собирается из записей по одной и после close() читается из cache.db
+    вместе с commit_id; до close() прежний кэш не затрагивается, временных файлов не остаётся.
+    """
+    project_name = "TestProject"
+    repo_name = "TestRepo"
+    save_repo_data_to_cache(project_name, repo_name, 1, [{"path": "/old.py", "object_id": "o", "tokens": 1}])
+
+    writer = RepoCacheWriter(project_name, repo_name)
+    writer.add({"path": "/a.py", "object_id": "a1", "tokens": 3})
+    writer.add({"path": "/b.py", "object_id": "b1", "tokens": 4})
+    assert load_repo_data_from_cache(project_name, repo_name)["total_tokens"] == 1
+    writer.close(commit_id="c1")
+
+    data = load_repo_data_from_cache(project_name, repo_name)
+    assert data["total_tokens"] == 7
+    assert data["commit_id"] == "c1"
+    assert [(f["path"], f["hash"]) for f in data["files"]] == [("/a.py", "a1"), ("/b.py", "b1")]
+    assert not [name for name in os.listdir(fake_cache_dir) if name.endswith(".tmp")], "Временный файл должен исчезнуть"
+
+def test_repo_cache_writer_abort_keeps_old_cache(fake_cache_dir):
+    """
+    Прерванная запись (ошибка в потоке файлов) оставляет прежний кэш.
+    """
+    project_name = "TestProject"
+    repo_name = "TestRepo"
+    save_repo_data_to_cache(project_name, repo_name, 5, [{"path": "/a.py", "object_id": "a1", "tokens": 5}])
+
+    def broken_stream():
+        yield {"path": "/b.py", "object_id": "b1", "tokens": 2}
+        raise RuntimeError("обрыв загрузки")
+
+    with pytest.raises(RuntimeError):
+        save_repo_data_to_cache(project_name, repo_name, None, broken_stream())
+
+    data = load_repo_data_from_cache(project_name, repo_name)
+    assert data["total_tokens"] == 5
+    assert not [name for name in os.listdir(fake_cache_dir) if name.endswith(".tmp")]
+
+def test_update_repo_files_upserts_and_aggregates(fake_cache_dir):
+    """
+    Точечное обновление: изменённый файл перезаписывается на своём месте, новый добавляется в конец,
+    удалённый стирается, агрегаты репозитория пересчитываются без чтения файлов.
+    """
+    project_name = "TestProject"
+    repo_name = "TestRepo"
+    save_repo_data_to_cache(project_name, repo_name, None, [
+        {"path": "/a.py", "object_id": "a1", "tokens": 10, "lines": 5, "comments": 1, "role": "Код"},
+        {"path": "/b.py", "object_id": "b1", "tokens": 20, "lines": 8, "comments": 0},
+        {"path": "/c.py", "object_id": "c1", "tokens": 30, "lines": 9, "comments": 2},
+    ], commit_id="old")
+
+    assert update_repo_files(project_name, repo_name,
+                             [{"path": "/a.py", "object_id": "a2", "tokens": 11, "lines": 6, "comments": 1},
+                              {"path": "/d.py", "object_id": "d1", "tokens": 40, "lines": 10, "comments": 3}],
+                             ["/b.py"], commit_id="new")
+
+    data = load_repo_data_from_cache(project_name, repo_name)
+    assert [(f["path"], f["hash"]) for f in data["files"]] == [("/a.py", "a2"), ("/c.py", "c1"), ("/d.py", "d1")]
+    assert load_repo_totals(project_name, repo_name) == {
+        "commit_id": "new", "total_tokens": 81, "files": 3, "tokens": 81, "lines": 25, "comments": 6,
+    }
+    assert load_project_heads(project_name) == {repo_name: "new"}
+    assert not update_repo_files(project_name, "Missing", [], [])
+
+    # Обновление без коммита сохранённый коммит не стирает
+    assert update_repo_files(project_name, repo_name, [], ["/d.py"])
+    assert load_repo_totals(project_name, repo_name)["commit_id"] == "new"
+
+def test_extra_fields_round_trip(fake_cache_dir):
+    save_repo_data_to_cache("TestProject", "TestRepo", 5, [{"path": "/a.py", "tokens": 5, "role": "Код"}])
+    record = load_repo_data_from_cache("TestProject", "TestRepo")["files"][0]
+    assert record["role"] == "Код" and record["tokens"] == 5
+
+def test_migrate_json_cache(fake_cache_dir, monkeypatch):
+    """
+    JSON-кэш прежнего формата переносится в БД (проект с "_" в имени определяется по сводному файлу),
+    а перенесённые файлы удаляются.
+    """
+    import json
+    from core.utils import cache
+
+    files = [{"path": "/main.py", "hash": "aaa", "tokens": 7, "lines": 3, "comments": 1}]
+    (fake_cache_dir / "My_Project_Repo_One.json").write_text(
+        json.dumps({"total_tokens": 7, "commit_id": "c1", "files": files}), encoding="utf-8")
+    (fake_cache_dir / "My_Project_summary.json").write_text(
+        json.dumps({"heads": {"Repo_One": "c1"}}), encoding="utf-8")
+    monkeypatch.setattr(cache, "_db", None)
+
+    data = load_repo_data_from_cache("My_Project", "Repo_One")
+
+    assert data["commit_id"] == "c1" and data["total_tokens"] == 7
+    assert data["files"][0]["object_id"] == "aaa"
+    assert load_project_heads("My_Project") == {"Repo_One": "c1"}
+    assert not [name for name in os.listdir(fake_cache_dir) if name.endswith(".json")]
+    assert migrate_json_cache(get_cache_db()) == 0
+
+
+def test_ambiguous_json_cache_waits_for_known_repository(fake_cache_dir, monkeypatch):
+    """
+    Файл с несколькими "_" в имени не переносится наугад: он остаётся на месте и переносится
+    при первом обращении к репозиторию; файл с однозначным именем переносится сразу.
+    """
+    import json
+    from core.utils import cache
+
+    def write(name, tokens):
+        (fake_cache_dir / name).write_text(json.dumps(
+            {"total_tokens": tokens, "commit_id": "c1", "files": [{"path": "/a.py", "tokens": tokens}]}),
+            encoding="utf-8")
+
+    write("Team_Api_Gateway.json", 3)
+    write("Team_Web.json", 5)
+    monkeypatch.setattr(cache, "_db", None)
+
+    assert migrate_json_cache(get_cache_db()) == 0, "Однозначный файл уже перенесён при открытии БД"
+    assert load_repo_totals("Team", "Web")["total_tokens"] == 5
+    assert (fake_cache_dir / "Team_Api_Gateway.json").exists()
+    assert load_project_heads("Team") == {}, "Под угаданным проектом ничего не записано"
+
+    data = load_repo_data_from_cache("Team_Api", "Gateway")
+
+    assert data["total_tokens"] == 3
+    assert not (fake_cache_dir / "Team_Api_Gateway.json").exists()
+    assert load_repo_totals("Team", "Api_Gateway") is None
+
+def test_recent_read_does_not_touch_last_used(fake_cache_dir):
+    """Чтение кэша обновляет repos.last_used, только если к репозиторию давно не обращались."""
+    from core.utils import cache
+
+    save_repo_data_to_cache("TestProject", "TestRepo", 5, [{"path": "/a.py", "object_id": "a1", "tokens": 5}])
+    db = get_cache_db()
+    statements = []
+    db._conn.set_trace_callback(statements.append)
+    try:
+        assert load_repo_data_from_cache("TestProject", "TestRepo") is not None
+        assert not [sql for sql in statements if "last_used" in sql and sql.startswith("UPDATE")]
+
+        with db._lock:
+            db._conn.execute("UPDATE repos SET last_used = last_used - ?", (2 * cache.CACHE_TOUCH_INTERVAL,))
+            db._conn.commit()
+        statements.clear()
+        assert load_repo_data_from_cache("TestProject", "TestRepo") is not None
+        assert [sql for sql in statements if "last_used" in sql and sql.startswith("UPDATE")]
+    finally:
+        db._conn.set_trace_callback(None)
@@ -0,0 +1,95 @@
+# tests/test_cache_manager.py
+import time
+
+import pytest
+
+from core.utils import cache, cache_manager
+from core.utils.ai_cache import get_ai_cache, response_key
+from core.utils.token_memo import get_token_memo
+
+@pytest.fixture(autouse=True)
+def fake_cache_dir(tmp_path, monkeypatch):
+    """Перенаправляем папку кэша во временную."""
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+def save_repo(name, files=10):
+    cache.save_repo_data_to_cache("P", name, None,
+                                  [{"path": f"/{i}.py", "object_id": f"{name}{i}", "tokens": 1} for i in range(files)],
+                                  commit_id=f"head-{name}")
+
+def age(area, table, seconds, where=""):
+    """Сдвигает last_used записей области в прошлое."""
+    with area._lock:
+        area._conn.execute(f"UPDATE {table} SET last_used = last_used - ? {where}", (seconds,))
+        if area._conn.in_transaction:
+            area._conn.commit()
+
+def test_parse_size():
+    assert cache_manager.parse_size("2K") == 2048
+    assert cache_manager.parse_size("1.5MB") == 1536 * 1024
+    assert cache_manager.parse_size("") == 0
+
+def test_ttl_expires_entries_of_every_area():
+    """Записи, к которым не обращались дольше срока жизни области, удаляются, свежие остаются."""
+    save_repo("Old")
+    save_repo("Fresh")
+    memo, ai = get_token_memo(), get_ai_cache()
+    memo.put_many({"old": {"tokens": 1, "lines": 1, "comments": 0}})
+    ai.put(response_key("m", "old"), "m", "ответ")
+    day = 86400
+    age(cache.get_cache_db(), "repos", 10 * day, "WHERE repository = 'Old'")
+    age(memo, "memo", 10 * day)
+    age(ai, "responses", 10 * day)
+
+    result = cache_manager.prune(max_bytes=0, ttl_days={"repos": 5, "memo": 5, "ai": 5})
+
+    assert result["expired"] == {"repos": 1, "memo": 1, "ai": 1}
+    assert cache.load_repo_totals("P", "Old") is None
+    assert cache.load_repo_totals("P", "Fresh") is not None
+    assert "Old" not in cache.load_project_heads("P"), "Head вытесненного репозитория тоже удаляется"
+    assert ai.get(response_key("m", "old")) is None
+
+def test_budget_evicts_least_recently_used_across_areas():
+    """
+    При превышении бюджета вытесняются самые давно не использованные записи всех областей,
+    пока объём не станет меньше бюджета; недавно прочитанные остаются.
+    """
+    for name in ("A", "B", "C"):
+        save_repo(name, files=50)
+        time.sleep(0.01)
+    ai = get_ai_cache()
+    ai.put(response_key("m", "p"), "m", "x" * 5000)
+    age(ai, "responses", 3 * cache.CACHE_TOUCH_INTERVAL)
+    age(cache.get_cache_db(), "repos", 2 * cache.CACHE_TOUCH_INTERVAL)
+    assert cache.load_repo_data_from_cache("P", "A") is not None  # A теперь использован недавно
+
+    # Бюджет вмещает только два репозитория из трёх
+    budget = int(cache_manager.cache_stats()["areas"]["repos"]["bytes"] * 0.9)
+    result = cache_manager.prune(max_bytes=budget, ttl_days={"repos": 0, "memo": 0, "ai": 0})
+
+    assert result["evicted"] == {"repos": 1, "memo": 0, "ai": 1}, "Самая старая запись — ответ OpenAI, затем B"
+    assert result["bytes_after"] <= budget * cache_manager.CACHE_PRUNE_TARGET
+    assert cache.load_repo_totals("P", "B") is None
+    assert cache.load_repo_totals("P", "A") is not None and cache.load_repo_totals("P", "C") is not None
+
+def test_counters_since_reports_run_delta():
+    """Счётчики за запуск — прирост с момента снимка; хиты и промахи кэша репозиториев учитываются."""
+    save_repo("A")
+    before = cache_manager.counters()
+
+    cache.load_repo_data_from_cache("P", "A")
+    cache.load_repo_data_from_cache("P", "missing")
+    get_ai_cache().get("nothing")
+
+    delta = cache_manager.counters_since(before)
+    assert delta["repos"] == {"hits": 1, "misses": 1, "evictions": 0}
+    assert delta["ai"]["misses"] == 1
+    assert "репозитории" in cache_manager.format_counters(delta)
+
+def test_cli_stats_and_prune(capsys):
+    save_repo("A")
+    cache.main(["prune", "--max-bytes", "1", "--vacuum"])
+    out = capsys.readouterr().out
+    assert "вытеснено: 1" in out
+    assert cache.load_repo_totals("P", "A") is None
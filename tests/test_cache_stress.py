@@ -0,0 +1,123 @@
+# tests/test_cache_stress.py
+"""
+Нагрузочный тест кэша: несколько процессов одновременно пишут и читают одну папку кэша.
+"""
+import multiprocessing
+
+from core.utils import cache
+
+WRITERS = 6
+ROUNDS = 8
+REPOSITORIES = ("R0", "R1", "R2")
+
+
+def make_files(writer, round_number):
+    """Набор файлов одной записи: у всех файлов метка писателя, размер набора меняется от записи к записи."""
+    tag = f"w{writer}-{round_number}"
+    count = 20 + (writer * 7 + round_number * 13) % 40
+    return [{"path": f"/src/f{i}.py", "object_id": f"{tag}-{i}", "tokens": i + 1, "lines": 2, "comments": 0,
+             "writer": tag} for i in range(count)]
+
+
+def writer_process(cache_dir, writer, errors):
+    """Перезаписывает кэш репозиториев, точечно обновляет его, читает и дописывает коммиты."""
+    from core.utils import commit_store
+    cache.CACHE_DIR = cache_dir
+    try:
+        for round_number in range(ROUNDS):
+            repository_name = REPOSITORIES[(writer + round_number) % len(REPOSITORIES)]
+            cache.save_repo_data_to_cache("P", repository_name, None, make_files(writer, round_number),
+                                          commit_id=f"c{writer}-{round_number}")
+            cache.update_repo_files("P", repository_name,
+                                    [{"path": f"/extra/w{writer}.py", "object_id": "x", "tokens": 5}],
+                                    ["/src/f0.py"])
+
+            # Читатель никогда не видит смесь двух записей: все файлы, кроме точечно
+            # обновлённых, принадлежат одной записи
+            data = cache.load_repo_data_from_cache("P", REPOSITORIES[round_number % len(REPOSITORIES)])
+            if data is not None:
+                tags = {f["writer"] for f in data["files"] if "writer" in f}
+                assert len(tags) <= 1, f"Смешаны записи {sorted(tags)}"
+
+            commit_store.append_commits("P", "R0", [
+                {"commit_id": f"{writer:02x}{round_number:02x}" * 10, "author": f"dev{writer}",
+                 "date": f"2024-01-01T00:{writer:02d}:{round_number:02d}+00:00"},
+                {"commit_id": "ff" * 20, "author": "shared", "date": "2023-12-31T00:00:00+00:00"},
+            ])
+    except BaseException as e:
+        errors.put(f"{writer}: {e!r}")
+
+
+def test_many_writer_processes_keep_cache_consistent(tmp_path, monkeypatch):
+    """
+    Процессы одновременно перезаписывают, обновляют и читают кэш одних и тех же репозиториев
+    и дописывают коммиты в одно хранилище. Ни один не падает, кэш согласован,
+    коммиты не теряются и не дублируются.
+    """
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    context = multiprocessing.get_context("spawn")
+    errors = context.Queue()
+    processes = [context.Process(target=writer_process, args=(str(tmp_path), writer, errors))
+                 for writer in range(WRITERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=180)
+
+    failures = []
+    while not errors.empty():
+        failures.append(errors.get())
+    assert not failures
+    assert all(process.exitcode == 0 for process in processes)
+
+    db = cache.get_cache_db()
+    assert db.check() == {"integrity": [], "orphans": 0, "inconsistent": []}
+    with db._read() as conn:
+        assert conn.execute(
+            "SELECT COUNT(*) FROM files f JOIN repos r ON r.project = f.project AND r.repository = f.repository "
+            "WHERE f.generation != r.generation"
+        ).fetchone()[0] == 0, "Записи прежних поколений должны быть удалены"
+    for repository_name in REPOSITORIES:
+        data = cache.load_repo_data_from_cache("P", repository_name)
+        totals = cache.load_repo_totals("P", repository_name)
+        assert totals["files"] == len(data["files"])
+        assert totals["tokens"] == sum(f["tokens"] for f in data["files"])
+
+    from core.utils import commit_store
+    table = commit_store.load_commit_table("P", "R0")
+    assert len(table) == WRITERS * ROUNDS + 1
+    assert commit_store.load_watermark("P", "R0")["count"] == len(table)
+
+
+def test_corrupt_database_file_is_recreated(tmp_path, monkeypatch):
+    """Файл cache.db, который не является БД SQLite, убирается в сторону и кэш создаётся заново."""
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    (tmp_path / cache.CACHE_DB_FILENAME).write_bytes(b"not a database" * 100)
+
+    cache.save_repo_data_to_cache("P", "R", None, [{"path": "/a.py", "object_id": "1", "tokens": 3}])
+
+    assert cache.load_repo_totals("P", "R")["tokens"] == 3
+    assert any(path.name.startswith("cache.db.corrupt-") for path in tmp_path.iterdir())
+
+
+def test_inconsistent_entry_is_dropped_and_repaired(tmp_path, monkeypatch):
+    """
+    Кэш репозитория, записи которого не сходятся с агрегатами, считается промахом и удаляется;
+    check --repair удаляет брошенные поколения упавших писателей.
+    """
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    files = [{"path": f"/{i}.py", "object_id": str(i), "tokens": 1} for i in range(3)]
+    cache.save_repo_data_to_cache("P", "R", None, files)
+    db = cache.get_cache_db()
+    with db._write() as conn:
+        conn.execute("DELETE FROM files WHERE path = '/1.py'")
+    writer = cache.RepoCacheWriter("P", "Crashed")
+    writer.add({"path": "/x.py", "object_id": "x", "tokens": 1})
+    writer._flush()
+
+    assert db.check(orphan_age=0)["inconsistent"] == [("P", "R")]
+    assert cache.load_repo_data_from_cache("P", "R") is None
+    assert cache.is_repo_changed("P", "R")
+
+    assert db.check(repair=True, orphan_age=0)["orphans"] == 1
+    assert db.check(orphan_age=0) == {"integrity": [], "orphans": 0, "inconsistent": []}
@@ -0,0 +1,75 @@
+# tests/test_checkpoints.py
+import os
+import time
+
+import pytest
+
+from core.utils import checkpoints
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Хранилище контрольных точек во временной папке кэша."""
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path))
+    return checkpoints.get_checkpoint_store()
+
+
+def test_begin_run_resumes_same_project(store):
+    assert store.begin_run("run-1", "TestProject", "fast") is False
+    assert store.begin_run("run-1", "TestProject", "fast") is True
+    with pytest.raises(ValueError):
+        store.begin_run("run-1", "OtherProject", "fast")
+
+
+def test_repository_done_replaces_file_checkpoints(store):
+    """
+    Файлы незаконченного репозитория сохраняются, а после завершения остаётся только результат с итогами.
+    """
+    store.begin_run("run-1", "TestProject", "deep")
+    checkpoint = checkpoints.RepoCheckpoint(store, "run-1", "Repo")
+    checkpoint.add({"path": "/a.py", "object_id": "a1", "tokens": 3, "lines": 2, "comments": 0})
+    checkpoint.flush()
+
+    assert list(checkpoints.RepoCheckpoint(store, "run-1", "Repo").files) == ["/a.py"]
+
+    store.mark_repository_done("run-1", {
+        "repository": "Repo", "tokens": 3, "report_path": "/r.txt",
+        "files": [{"path": "/a.py", "tokens": 3, "lines": 2, "comments": 0}],
+    })
+    done = store.completed_repositories("run-1")
+    assert done["Repo"]["totals"] == {"files": 1, "lines": 2, "comments": 0, "tokens": 3}
+    assert "files" not in done["Repo"]
+    assert store.load_files("run-1", "Repo") == {}
+
+
+def test_ai_report_reused_only_for_same_content(store, tmp_path):
+    report = tmp_path / "ai.txt"
+    report.write_text("анализ", encoding="utf-8")
+    store.begin_run("run-1", "TestProject", "deep")
+    checkpoints.RepoCheckpoint(store, "run-1", "Repo").add({"path": "/a.py", "object_id": "a1"}, str(report))
+
+    checkpoint = checkpoints.RepoCheckpoint(store, "run-1", "Repo")
+    assert checkpoint.ai_report({"path": "/a.py", "object_id": "a1"}) == str(report)
+    assert checkpoint.ai_report({"path": "/a.py", "object_id": "a2"}) is None
+    os.remove(report)
+    assert checkpoint.ai_report({"path": "/a.py", "object_id": "a1"}) is None
+
+
+def test_prune_removes_completed_and_stale_runs(store):
+    for run_id in ("done", "stale", "active"):
+        store.begin_run(run_id, "TestProject", "fast")
+    store.finish_run("done")
+    store._conn.execute("UPDATE runs SET updated = ? WHERE run_id = 'stale'", (time.time() - 10 * 86400,))
+    store._conn.commit()
+
+    assert sorted(store.prune(max_age_days=7)) == ["done", "stale"]
+    assert [run["run_id"] for run in store.list_runs()] == ["active"]
+
+
+def test_cli_list_and_clean(store, capsys):
+    store.begin_run("run-1", "TestProject", "fast")
+    checkpoints.main(["list"])
+    assert "run-1" in capsys.readouterr().out
+
+    checkpoints.main(["clean", "--run", "run-1"])
+    assert store.list_runs() == []
@@ -0,0 +1,52 @@
+# tests/test_commit_analysis.py
+import numpy as np
+
+from core.analyze.commit_analysis import (
+    WEEK_SECONDS,
+    active_contributors_over_time,
+    analyze_commit_table,
+    bus_factor,
+    churn_percentiles,
+    commits_per_author_per_week
+)
+from core.utils.commit_store import CommitTable
+
+def make_table(author_ids, weeks, churn):
+    """Таблица коммитов: авторы, номера недель и churn на коммит (всё в adds)."""
+    n = len(author_ids)
+    return CommitTable(
+        ["Anna", "Boris", "Vera"],
+        np.zeros((n, 20), dtype=np.uint8),
+        np.array(author_ids, dtype=np.int32),
+        np.array(weeks, dtype=np.int64) * WEEK_SECONDS,
+        np.array(churn, dtype=np.int32),
+        np.zeros(n, dtype=np.int32),
+        np.zeros(n, dtype=np.int32),
+    )
+
+def test_commits_per_author_per_week():
+    """Коммиты группируются по парам (автор, неделя)."""
+    table = make_table([0, 0, 1, 0], [10, 10, 10, 12], [1, 1, 1, 1])
+    cells = commits_per_author_per_week(table)
+    assert list(zip(cells["author_ids"], cells["weeks"], cells["counts"])) == [(0, 10, 2), (0, 12, 1), (1, 10, 1)]
+
+def test_active_contributors_over_time():
+    """Число активных авторов по неделям, включая недели без коммитов."""
+    table = make_table([0, 0, 1, 2], [10, 10, 10, 12], [1, 1, 1, 1])
+    weeks, counts = active_contributors_over_time(table)
+    assert list(weeks) == [10, 11, 12]
+    assert list(counts) == [2, 0, 1]
+
+def test_bus_factor_and_churn():
+    """Bus factor по коммитам и по churn, перцентили churn."""
+    table = make_table([0, 0, 0, 1, 2], [1, 1, 1, 1, 1], [1, 1, 1, 10, 10])
+    assert bus_factor(table) == 1, "Anna сделала 60% коммитов"
+    assert bus_factor(table, by="churn") == 2, "У Boris и Vera по 43% churn — одного автора мало"
+    assert churn_percentiles(table, (50,)) == {50: 1.0}
+
+def test_analyze_commit_table():
+    """Сводка содержит общее число коммитов и топ авторов."""
+    table = make_table([0, 1, 1], [1, 1, 2], [1, 2, 3])
+    result = analyze_commit_table(table)
+    assert result["total_commits"] == 3
+    assert result["top_authors"][0] == ("Boris", 2)
@@ -0,0 +1,75 @@
+# tests/test_commit_store.py
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from core.utils.commit_store import (
+    CommitTable,
+    append_commits,
+    commit_to_record,
+    iter_commits,
+    load_commit_table,
+    load_watermark
+)
+
+@pytest.fixture(autouse=True)
+def fake_cache_dir(tmp_path, monkeypatch):
+    """Перенаправляем папку кэша во временную."""
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+def make_record(commit_id, day):
+    return {"commit_id": commit_id * 20, "author": "dev", "email": None,
+            "date": f"2024-01-{day:02d}T00:00:00+00:00", "adds": 1, "edits": 0, "deletes": 0}
+
+def test_commit_to_record():
+    """Запись строится из GitCommitRef и содержит счётчики изменений."""
+    date = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    commit = SimpleNamespace(
+        commit_id="abc",
+        author=SimpleNamespace(name="Ivan", email="ivan@example.com", date=date),
+        committer=SimpleNamespace(name="Ivan", email="ivan@example.com", date=date),
+        change_counts={"Add": 2, "Edit": 3},
+    )
+    record = commit_to_record(commit)
+    assert record["author"] == "Ivan"
+    assert record["date"] == date.isoformat()
+    assert (record["adds"], record["edits"], record["deletes"]) == (2, 3, 0)
+
+def test_append_moves_watermark_and_keeps_chronology():
+    """
+    Новые коммиты дописываются в хронологическом порядке, водяной знак указывает на самый новый.
+    """
+    assert load_watermark("P", "R") is None
+
+    append_commits("P", "R", [make_record("c2", 2), make_record("c1", 1)])
+    append_commits("P", "R", [make_record("c3", 3)])
+
+    assert [c["commit_id"] for c in iter_commits("P", "R")] == ["c1" * 20, "c2" * 20, "c3" * 20]
+    watermark = load_watermark("P", "R")
+    assert watermark["commit_id"] == "c3" * 20
+    assert watermark["count"] == 3
+
+def test_legacy_jsonl_store_is_converted(fake_cache_dir):
+    """Хранилище в старом формате .jsonl при чтении конвертируется в колоночную таблицу."""
+    import json
+    commits_dir = fake_cache_dir / "commits"
+    commits_dir.mkdir()
+    with open(commits_dir / "P_R.jsonl", "w", encoding="utf-8") as f:
+        for day in (1, 2):
+            f.write(json.dumps(make_record(f"0{day}", day)) + "\n")
+
+    table = load_commit_table("P", "R")
+
+    assert len(table) == 2
+    assert (commits_dir / "P_R.npz").exists()
+    assert not (commits_dir / "P_R.jsonl").exists()
+
+def test_concat_remaps_authors():
+    """При объединении таблиц одинаковые авторы получают общий идентификатор."""
+    first = CommitTable.from_records([dict(make_record("aa", 1), author="Anna")])
+    second = CommitTable.from_records([dict(make_record("bb", 2), author="Boris"),
+                                       dict(make_record("cc", 3), author="Anna")])
+    table = CommitTable.concat([first, second])
+    assert [table.authors[i] for i in table.author_ids] == ["Anna", "Boris", "Anna"]
@@ -0,0 +1,46 @@
+# tests/test_concurrency.py
+import random
+import threading
+import time
+
+from core.utils.concurrency import ordered_bounded_map
+
+def test_results_keep_input_order():
+    """
+    Результаты возвращаются в порядке входных элементов, даже если задачи завершаются вразнобой.
+    """
+    def slow_square(x):
+        time.sleep(random.uniform(0, 0.005))
+        return x * x
+
+    assert list(ordered_bounded_map(slow_square, range(50), max_workers=8)) == [x * x for x in range(50)]
+
+def test_in_flight_tasks_are_bounded():
+    """
+    Одновременно в работе не больше window задач.
+    """
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def task(x):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.002)
+        with lock:
+            state["running"] -= 1
+        return x
+
+    list(ordered_bounded_map(task, range(40), max_workers=4, window=4))
+    assert state["peak"] <= 4, "Количество одновременных задач превысило лимит"
+
+def test_shared_executor_is_not_shut_down():
+    """
+    С общим пулом задачи выполняются на нём, а сам пул остаётся рабочим для следующих вызовов.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="shared") as pool:
+        names = list(ordered_bounded_map(lambda x: threading.current_thread().name, range(4), 2, executor=pool))
+        assert all(name.startswith("shared") for name in names)
+        assert list(ordered_bounded_map(lambda x: x + 1, range(3), 2, executor=pool)) == [1, 2, 3]
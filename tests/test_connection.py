@@ -0,0 +1,120 @@
+# tests/test_connection.py
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from msrest import Configuration
+from msrest.service_client import ServiceClient
+
+from core.azure import connection
+
+
+class DummyClients:
+    def get_git_client(self):
+        return object()
+
+    def get_core_client(self):
+        return object()
+
+    def get_pooled_client(self):
+        """Клиент с настоящим конвейером msrest (как у клиентов azure-devops)."""
+        return SimpleNamespace(_client=ServiceClient(None, Configuration("http://127.0.0.1")))
+
+
+class DummySettings(dict):
+    def getint(self, key, fallback=None):
+        return fallback
+
+
+class DummyConnection:
+    def __init__(self, base_url, creds):
+        self.base_url = base_url
+        self.clients = DummyClients()
+
+
+@pytest.fixture(autouse=True)
+def fake_connection(monkeypatch):
+    """
+    Подменяем Connection и чтение settings.ini, чтобы не ходить в Azure.
+    """
+    monkeypatch.setattr(connection, "Connection", DummyConnection)
+    monkeypatch.setattr(
+        connection, "_load_settings",
+        lambda: DummySettings(ORG_URL="https://dev.azure.com/test", ACCESS_TOKEN="token")
+    )
+    connection.reset_connections()
+    yield
+    connection.reset_connections()
+
+
+def test_clients_are_reused():
+    """
+    Повторные запросы клиента возвращают тот же объект, а статистика считает переиспользования.
+    """
+    first = connection.get_git_client()
+    second = connection.get_git_client()
+
+    assert first is second, "git-клиент должен переиспользоваться"
+    stats = connection.get_connection_stats()
+    assert (stats["connections"], stats["clients"]) == (1, 1), "Должны быть созданы одно соединение и один клиент"
+
+
+def test_connection_shared_between_clients():
+    """
+    git- и core-клиенты строятся поверх одного соединения.
+    """
+    connection.get_git_client()
+    connection.get_core_client()
+
+    assert connection.connect_to_azure() is connection.connect_to_azure()
+    assert connection.get_connection_stats()["clients"] == 2
+    assert connection.get_connection_stats()["connections"] == 1
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_sessions_of_all_threads_share_the_pool():
+    """
+    msrest создаёт отдельную сессию requests в каждом потоке; все они должны работать через общий
+    пул соединений, а статистика — показывать реальное переиспользование соединений.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        driver = connection._find_driver(connection._get_client("pooled"))
+        sessions = []
+
+        def worker():
+            session = driver.session
+            sessions.append(session)
+            for _ in range(3):
+                assert session.get(url).content == b"ok"
+
+        threads = [threading.Thread(target=worker) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        worker()  # поток, создавший клиента
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len({id(session) for session in sessions}) == 3, "У каждого потока своя сессия"
+    assert all(session.adapters["http://"] is connection._adapter for session in sessions)
+    stats = connection.get_connection_stats()
+    assert stats["http_requests"] == 9
+    assert stats["http_connections"] <= 3 and stats["reused"] >= 6
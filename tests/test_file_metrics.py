@@ -0,0 +1,68 @@
+# tests/test_file_metrics.py
+import pytest
+
+from core.reports import generate
+from core.reports.report_formatter import format_project_summary, format_repository_report, summarize_repository
+from core.utils.file_metrics import FileMetrics, spill_file_metrics
+
+RECORDS = [
+    {"path": "/src/app/main.py", "object_id": "ab" * 20, "tokens": 120, "lines": 40, "comments": 3},
+    {"path": "/src/app/util.py", "object_id": "cd" * 20, "tokens": 30, "lines": 10, "comments": 0},
+    {"path": "/README.md", "object_id": None, "tokens": 7, "lines": 2, "comments": 0, "role": "Документация"},
+    {"path": "/src/модуль.py", "object_id": "ef" * 20, "tokens": 1, "lines": 1, "comments": 1},
+]
+
+@pytest.fixture(autouse=True)
+def fake_dirs(tmp_path, monkeypatch):
+    """Перенаправляем папку кэша во временную, а отчёты пишем относительно неё."""
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def test_records_round_trip():
+    """Записи восстанавливаются из столбцов; папки закодированы словарём."""
+    table = FileMetrics.from_records(RECORDS)
+
+    assert len(table) == 4
+    restored = list(table)
+    assert [r["path"] for r in restored] == [r["path"] for r in RECORDS]
+    assert restored[0]["hash"] == "ab" * 20 and restored[2]["object_id"] is None
+    assert restored[2]["role"] == "Документация" and "role" not in restored[0]
+    assert table[-1] == restored[-1]
+    assert sorted(table.folders) == ["", "/src", "/src/app"]
+    assert table.totals() == {"files": 4, "lines": 53, "comments": 4, "tokens": 158}
+
+def test_non_sha1_object_ids_are_kept_as_strings():
+    """Если встречается objectId не в виде sha1, все идентификаторы хранятся строками без потерь."""
+    table = FileMetrics.from_records(RECORDS[:2] + [{"path": "x.py", "object_id": "a1", "tokens": 1}])
+    assert [r["object_id"] for r in table] == ["ab" * 20, "cd" * 20, "a1"]
+    assert list(table)[2]["path"] == "x.py"
+
+def test_save_and_memory_mapped_load(fake_dirs):
+    """Файл метрик читается через mmap и даёт те же записи; пустая таблица тоже сохраняется."""
+    table = FileMetrics.from_records(RECORDS)
+    loaded = spill_file_metrics("P", "R", RECORDS)
+
+    assert list(loaded) == list(table)
+    assert loaded.totals() == table.totals()
+    assert list(spill_file_metrics("P", "Empty", [])) == []
+
+    broken = fake_dirs / "broken.fmetrics"
+    broken.write_bytes(b"garbage" * 10)
+    with pytest.raises(ValueError):
+        FileMetrics.load(str(broken))
+
+def test_reports_accept_file_metrics():
+    """Отчёт репозитория и сводка по проекту одинаковы для списка записей и колоночной таблицы."""
+    table = FileMetrics.from_records(RECORDS)
+    as_list = list(table)
+
+    assert format_repository_report("P", "R", table) == format_repository_report("P", "R", as_list)
+    assert format_project_summary("P", [{"repository": "R", "files": table}]) == \
+        format_project_summary("P", [{"repository": "R", "files": as_list}])
+    assert summarize_repository({"files": table})["tokens"] == 158
+
+    with open(generate.generate_report("P", "R", table), encoding="utf-8") as f:
+        from_table = f.read()
+    with open(generate.generate_report("P", "R", as_list), encoding="utf-8") as f:
+        assert f.read() == from_table
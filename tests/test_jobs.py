@@ -0,0 +1,136 @@
+# tests/test_jobs.py
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from core.analyze import jobs
+
+
+def test_validate_job_spec_inherits_defaults():
+    job = jobs.validate_job_spec({
+        "mode": "deep",
+        "workers": 4,
+        "projects": ["A", {"name": "B", "include": "api-*", "workers": 8, "mode": "fast"}],
+    })
+
+    a, b = job["projects"]
+    assert (a["name"], a["mode"], a["workers"], a["include"]) == ("A", "deep", 4, [])
+    assert (b["name"], b["mode"], b["workers"], b["include"]) == ("B", "fast", 8, ["api-*"])
+    assert job["workers"] == 8, "Общий пул рассчитан на самый требовательный проект"
+
+
+@pytest.mark.parametrize("spec", [
+    [],
+    {"projects": []},
+    {"projects": ["A"], "unknown": 1},
+    {"projects": [{"include": ["x"]}]},
+    {"projects": ["A"], "mode": "slow"},
+    {"projects": ["A"], "workers": 0},
+    {"projects": [{"name": "A", "executor": "cluster"}]},
+])
+def test_validate_job_spec_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        jobs.validate_job_spec(spec)
+
+
+def test_load_job_spec_json_and_yaml(tmp_path):
+    json_path = tmp_path / "job.json"
+    json_path.write_text(json.dumps({"projects": ["A"]}), encoding="utf-8")
+    assert jobs.load_job_spec(str(json_path))["projects"][0]["name"] == "A"
+
+    pytest.importorskip("yaml")
+    yaml_path = tmp_path / "job.yaml"
+    yaml_path.write_text("mode: deep\nprojects:\n  - name: B\n    exclude: ['*-legacy']\n", encoding="utf-8")
+    project = jobs.load_job_spec(str(yaml_path))["projects"][0]
+    assert (project["name"], project["mode"], project["exclude"]) == ("B", "deep", ["*-legacy"])
+
+
+def test_select_names():
+    names = ["api-core", "api-legacy", "web", "tools"]
+    assert jobs.select_names(names, ["api-*", "web"], ["*-legacy"]) == ["api-core", "web"]
+    assert jobs.select_names(names, [], ["t*"]) == ["api-core", "api-legacy", "web"]
+
+
+def test_run_job_fans_out_on_shared_pool(monkeypatch, tmp_path):
+    """
+    Проекты из шаблона анализируются на одном пуле, фильтры применяются к репозиториям,
+    ошибка одного проекта не мешает остальным, итоги пишутся в JSON.
+    """
+    calls = []
+
+    def fake_analyze_all(project_name, repositories, analysis_mode, workers, policy=None, executor=None,
+                         run_id=None, worker_pool=None):
+        if project_name == "Broken":
+            raise RuntimeError("нет доступа")
+        calls.append((project_name, [r.name for r in repositories], run_id, worker_pool))
+        results = [{"repository": r.name, "tokens": 2, "files": [{"path": "/a.py", "tokens": 2, "lines": 3}],
+                    "report_path": f"/r/{r.name}.txt"} for r in repositories]
+        return {"run_id": run_id, "results": results, "summary_path": f"/s/{project_name}.txt"}
+
+    monkeypatch.setattr(jobs, "get_projects", lambda: ["Platform-A", "Platform-B", "Other"])
+    monkeypatch.setattr(jobs, "get_repositories",
+                        lambda project: [SimpleNamespace(name=n) for n in ("api", "api-legacy", "web")])
+    monkeypatch.setattr(jobs, "analyze_all_repositories", fake_analyze_all)
+
+    output = tmp_path / "out" / "job.json"
+    job = jobs.validate_job_spec({
+        "workers": 3,
+        "output": str(output),
+        "projects": [{"name": "Platform-*", "exclude": ["*-legacy"]}, "Broken"],
+    })
+    outcome = jobs.run_job(job, run_id="job-1")
+
+    assert sorted((name, repos, run_id) for name, repos, run_id, _ in calls) == [
+        ("Platform-A", ["api", "web"], "job-1:Platform-A"),
+        ("Platform-B", ["api", "web"], "job-1:Platform-B"),
+    ]
+    assert calls[0][3] is calls[1][3] and calls[0][3] is not None, "Пул потоков должен быть общим"
+    assert [p["status"] for p in outcome["projects"]] == ["ok", "ok", "failed"]
+
+    saved = json.loads(output.read_text(encoding="utf-8"))
+    assert saved["projects"][0]["repositories"][0] == {
+        "repository": "api", "cached": False, "report_path": "/r/api.txt",
+        "files": 1, "lines": 3, "comments": 0, "tokens": 2,
+    }
+
+
+def test_run_job_analyzes_projects_concurrently_with_separate_metrics(monkeypatch, tmp_path):
+    """
+    Проекты задания анализируются одновременно на общем пуле, а спаны каждого попадают
+    в его собственный запуск метрик, даже если имена репозиториев совпадают.
+    """
+    import threading
+    from core.analyze import batch_analysis
+    from core.logging import metrics
+
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr("core.reports.generate.REPORTS_DIR", str(tmp_path / "reports"))
+    monkeypatch.setattr("core.reports.artifacts.REPORTS_DIR", str(tmp_path / "reports"))
+    both_running = threading.Barrier(2, timeout=10)
+
+    def fake_analyze_repository(project_name, repository, repo_changed, analysis_mode, head_commit=None,
+                                checkpoint=None):
+        with metrics.span("analyze_repository", repository=repository.name) as s:
+            s.bytes = 10 if project_name == "A" else 20
+            both_running.wait()  # второй проект должен работать в это же время
+        return {"repository": repository.name, "tokens": 1, "files": [], "report_path": None}
+
+    rollups = {}
+    monkeypatch.setattr(jobs, "get_repositories", lambda project: [SimpleNamespace(name="api")])
+    monkeypatch.setattr(batch_analysis, "get_head_commits", lambda project, repos: {})
+    monkeypatch.setattr(batch_analysis, "load_project_heads", lambda project: {})
+    monkeypatch.setattr(batch_analysis, "is_repo_changed", lambda project, name: True)
+    monkeypatch.setattr(batch_analysis, "analyze_repository", fake_analyze_repository)
+    monkeypatch.setattr(batch_analysis, "generate_summary", lambda project, results: None)
+    monkeypatch.setattr(batch_analysis, "get_connection_stats",
+                        lambda: {"http_connections": 0, "http_requests": 0, "reused": 0})
+    monkeypatch.setattr(batch_analysis, "print_run_metrics",
+                        lambda run_id, counters=None: rollups.setdefault(run_id, metrics.repository_totals(run_id)))
+
+    outcome = jobs.run_job(jobs.validate_job_spec({"workers": 2, "projects": ["A", "B"]}),
+                           run_id="job-2")
+
+    assert [p["status"] for p in outcome["projects"]] == ["ok", "ok"]
+    assert rollups["job-2:A"]["api"]["bytes"] == 10
+    assert rollups["job-2:B"]["api"]["bytes"] == 20
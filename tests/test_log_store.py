@@ -0,0 +1,121 @@
+from core.logging import log_store
+
+
+def _conn(tmp_path):
+    return log_store.connect(str(tmp_path / "logs.db"))
+
+
+def test_schema_has_indexes_and_incremental_vacuum(tmp_path):
+    conn = _conn(tmp_path)
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(logs)")}
+    assert {"idx_logs_created", "idx_logs_level_created"} <= indexes
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    plan = " ".join(str(row) for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM logs WHERE level = 'ERROR' AND created >= '2025-01-01'"
+    ))
+    assert "idx_logs_level_created" in plan
+    conn.close()
+
+
+def test_large_messages_are_compressed_and_restored(tmp_path):
+    conn = _conn(tmp_path)
+    prompt = "📝 Полный промпт: " + "x = 1\n" * 2000
+    log_store.insert_records(conn, [
+        ("2025-03-01 10:00:00", "INFO", "short"),
+        ("2025-03-01 10:00:01", "INFO", prompt),
+    ], payload_threshold=1000)
+    conn.commit()
+
+    (stored,) = conn.execute("SELECT message FROM logs WHERE id = 2").fetchone()
+    assert len(stored) < 1000 and "сжато" in stored
+    size, data = conn.execute("SELECT size, data FROM payloads WHERE log_id = 2").fetchone()
+    assert size == len(prompt) and len(data) < size
+
+    records = log_store.query_logs(conn, contains="Полный промпт", full=True)
+    assert [r["message"] for r in records] == [prompt]
+    conn.close()
+
+
+def test_contains_searches_full_text_of_compressed_messages(tmp_path):
+    """Подстрока после начала сжатого сообщения (за пределами превью) тоже находится."""
+    conn = _conn(tmp_path)
+    response = "Ответ OpenAI: " + "y = 2\n" * 1000 + "needle-в-конце"
+    log_store.insert_records(conn, [
+        ("2025-03-01 10:00:00", "INFO", "short needle-в-конце"),
+        ("2025-03-01 10:00:01", "INFO", response),
+        ("2025-03-01 10:00:02", "INFO", "Ответ OpenAI: " + "z" * 3000),
+    ], payload_threshold=1000)
+    conn.commit()
+    assert response.index("needle-в-конце") > log_store.PAYLOAD_PREVIEW_CHARS
+
+    records = log_store.query_logs(conn, contains="needle-в-конце")
+    assert [r["id"] for r in records] == [2, 1]
+    assert [r["id"] for r in log_store.query_logs(conn, contains="сжато")] == [], \
+        "Служебная пометка превью не считается текстом сообщения"
+    conn.close()
+
+
+def test_query_filters_by_level_time_and_substring(tmp_path):
+    conn = _conn(tmp_path)
+    log_store.insert_records(conn, [
+        ("2025-03-01 09:00:00", "INFO", "start"),
+        ("2025-03-01 12:00:00", "ERROR", "OpenAI timeout"),
+        ("2025-03-02 08:00:00", "ERROR", "Azure 503"),
+        ("2025-03-03 08:00:00", "INFO", "done"),
+    ])
+    conn.commit()
+
+    assert [r["message"] for r in log_store.query_logs(conn, level="error")] == ["Azure 503", "OpenAI timeout"]
+    assert [r["message"] for r in log_store.query_logs(conn, since="2025-03-02", until="2025-03-02")] == ["Azure 503"]
+    assert [r["message"] for r in log_store.query_logs(conn, contains="OpenAI")] == ["OpenAI timeout"]
+    conn.close()
+
+
+def test_retention_removes_old_records_and_payloads(tmp_path):
+    conn = _conn(tmp_path)
+    log_store.insert_records(conn, [
+        ("2000-01-01 00:00:00", "INFO", "y" * 5000),
+        ("2999-01-01 00:00:00", "INFO", "future"),
+    ], payload_threshold=1000)
+    conn.commit()
+
+    assert log_store.apply_retention(conn, max_age_days=30, max_mb=0) == 1
+    assert [r["message"] for r in log_store.query_logs(conn)] == ["future"]
+    assert conn.execute("SELECT COUNT(*) FROM payloads").fetchone()[0] == 0
+    conn.close()
+
+
+def test_retention_is_off_by_default(tmp_path):
+    assert log_store.LOG_RETENTION_DAYS == 0 and log_store.LOG_MAX_MB == 0
+    conn = _conn(tmp_path)
+    log_store.insert_records(conn, [("2000-01-01 00:00:00", "INFO", "old")])
+    conn.commit()
+
+    assert log_store.apply_retention(conn) == 0
+    assert [r["message"] for r in log_store.query_logs(conn)] == ["old"]
+    conn.close()
+
+
+def test_retention_enforces_size_limit(tmp_path):
+    conn = _conn(tmp_path)
+    log_store.insert_records(conn, [("2999-01-01 00:00:00", "INFO", "z" * 1000)] * 3000, payload_threshold=0)
+    conn.commit()
+
+    removed = log_store.apply_retention(conn, max_age_days=0, max_mb=1)
+    assert removed > 0
+    assert log_store.db_size_bytes(conn) <= 1024 * 1024
+    conn.close()
+
+
+def test_cli_query(tmp_path, capsys):
+    db_path = str(tmp_path / "logs.db")
+    conn = log_store.connect(db_path)
+    log_store.insert_records(conn, [("2025-03-01 12:00:00", "ERROR", "boom")])
+    conn.commit()
+    conn.close()
+
+    log_store.main(["--db", db_path, "query", "--level", "ERROR"])
+    out = capsys.readouterr().out
+    assert "2025-03-01 12:00:00 [ERROR] boom" in out
+    assert "Найдено записей: 1" in out
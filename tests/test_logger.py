@@ -0,0 +1,49 @@
+import logging
+import sqlite3
+
+from core.logging.logger import BatchedSQLiteHandler
+
+
+def _make_logger(handler, name):
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"))
+    logger = logging.Logger(name)
+    logger.addHandler(handler)
+    return logger
+
+
+def _rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT level, message FROM logs ORDER BY id").fetchall()
+
+
+def test_batched_handler_writes_all_records_on_close(tmp_path):
+    db_path = str(tmp_path / "logs.db")
+    handler = BatchedSQLiteHandler(db_path, batch_size=7, flush_interval=60)
+    logger = _make_logger(handler, "test.batched.close")
+
+    for i in range(100):
+        logger.info(f"message {i}")
+    logger.error("boom")
+    handler.close()
+
+    rows = _rows(db_path)
+    assert len(rows) == 101
+    assert rows[0][1].endswith("message 0")
+    assert rows[-1][0] == "ERROR" and rows[-1][1].endswith("boom")
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_batched_handler_flush_waits_for_pending_records(tmp_path):
+    db_path = str(tmp_path / "logs.db")
+    handler = BatchedSQLiteHandler(db_path, batch_size=1000, flush_interval=60)
+    logger = _make_logger(handler, "test.batched.flush")
+
+    logger.warning("pending")
+    handler.flush()
+
+    rows = _rows(db_path)
+    assert len(rows) == 1
+    assert rows[0][0] == "WARNING" and rows[0][1].endswith("pending")
+    handler.close()
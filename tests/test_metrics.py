@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+from core.logging import metrics
+
+
+@pytest.fixture(autouse=True)
+def fresh_run():
+    metrics.flush()
+    metrics.start_run()
+    yield
+    metrics._pending.clear()
+
+
+def test_spans_roll_up_per_stage_and_repository(tmp_path):
+    with metrics.span("analyze_repository", repository="A"):
+        for size in (10, 20, 30):
+            with metrics.span("azure.get_item_content", api_call=True) as s:
+                s.bytes = size
+    with metrics.span("analyze_repository", repository="B"):
+        with metrics.span("tokenize"):
+            pass
+
+    stages = metrics.run_rollup()
+    assert stages["azure.get_item_content"]["count"] == 3
+    assert stages["azure.get_item_content"]["bytes"] == 60
+    assert stages["azure.get_item_content"]["api_calls"] == 3
+    assert stages["analyze_repository"]["api_calls"] == 0
+
+    assert set(metrics.run_rollup(repository="B")) == {"analyze_repository", "tokenize"}
+    totals = metrics.repository_totals()
+    assert totals["A"]["bytes"] == 60 and totals["A"]["api_calls"] == 3
+    assert totals["B"]["api_calls"] == 0
+
+    run_id = metrics.current_run_id()
+    db_path = str(tmp_path / "logs.db")
+    metrics.flush(db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM spans WHERE run_id = ?", (run_id,)).fetchone()[0] == 6
+    assert metrics.load_rollup(run_id, repository="A", db_path=db_path)["azure.get_item_content"]["bytes"] == 60
+
+
+def test_percentiles_use_nearest_rank():
+    rows = [("r", None, "fetch", 0, duration, 0, 0) for duration in range(1, 101)]
+    stage = metrics.rollup(rows)["fetch"]
+    assert stage["p50"] == 50
+    assert stage["p95"] == 95
+    assert stage["total"] == sum(range(1, 101))
+
+
+def test_timed_takes_repository_from_second_argument():
+    @metrics.timed("report")
+    def generate(project_name, repository_name, files_data):
+        return len(files_data)
+
+    assert generate("P", "Repo", [1, 2]) == 2
+    assert metrics.run_rollup(repository="Repo")["report"]["count"] == 1
+    assert "report" in metrics.format_rollup(metrics.run_rollup())
+
+
+def test_run_rollup_keeps_bounded_sample(monkeypatch):
+    """Счётчики за запуск точные, а для перцентилей хранится выборка ограниченного размера."""
+    monkeypatch.setattr(metrics, "SPAN_SAMPLE_SIZE", 50)
+    monkeypatch.setattr(metrics, "SPAN_REPOSITORY_SAMPLE_SIZE", 10)
+    for duration in range(1, 1001):
+        metrics.record("fetch", float(duration), repository="R", bytes_count=1)
+
+    stage = metrics.run_rollup()["fetch"]
+    assert stage["count"] == 1000 and stage["total"] == sum(range(1, 1001)) and stage["bytes"] == 1000
+    assert 1 <= stage["p50"] <= stage["p95"] <= 1000
+    run = metrics._runs[metrics.current_run_id()]
+    assert len(run.stages["fetch"].sample) == 50
+    assert len(run.repository_stages[("R", "fetch")].sample) == 10
+    assert metrics.run_rollup(repository="R")["fetch"]["count"] == 1000
+    assert metrics.repository_totals()["R"]["bytes"] == 1000
+
+
+def test_flush_goes_through_log_writer_thread(tmp_path, monkeypatch):
+    """Спаны пишет фоновый поток логов, а не поток, накопивший пачку."""
+    import threading
+    from core.logging.logger import BatchedSQLiteHandler
+
+    db_path = str(tmp_path / "logs.db")
+    handler = BatchedSQLiteHandler(db_path, batch_size=1000, flush_interval=60)
+    monkeypatch.setattr(metrics, "get_writer", lambda: handler)
+    writers = []
+    insert_spans = metrics._insert_spans
+    monkeypatch.setattr(metrics, "_insert_spans",
+                        lambda conn, rows: writers.append(threading.current_thread().name) or insert_spans(conn, rows))
+    monkeypatch.setattr(metrics, "SPAN_FLUSH_SIZE", 3)
+    try:
+        for _ in range(3):
+            metrics.record("tokenize", 0.1)
+        handler.flush()
+    finally:
+        handler.close()
+
+    assert writers == ["sqlite-log-writer"]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM spans").fetchone()[0] == 3
@@ -0,0 +1,169 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core.analyze import pipeline
+from core.analyze.pipeline import Pipeline, Stage
+
+
+def make_jobs(*names):
+    return [{"repository": SimpleNamespace(name=name)} for name in names]
+
+
+def test_stages_overlap_and_queues_stay_bounded():
+    active = {"fetch": 0, "count": 0}
+    overlap = threading.Event()
+    lock = threading.Lock()
+
+    def timed_stage(name):
+        def run(job):
+            with lock:
+                active[name] += 1
+                if all(active.values()):
+                    overlap.set()
+            time.sleep(0.02)
+            with lock:
+                active[name] -= 1
+            job.setdefault("seen", []).append(name)
+            return job
+        return run
+
+    p = Pipeline([Stage("fetch", timed_stage("fetch")), Stage("count", timed_stage("count"))], queue_size=1)
+    jobs = list(p.run(make_jobs(*"abcdefgh")))
+    names = [job["repository"].name for job in jobs]
+
+    assert sorted(names) == list("abcdefgh")
+    assert all(job["elapsed"] >= 0.04 for job in jobs), "Время работы обоих этапов копится в задании"
+    assert overlap.is_set(), "Этапы должны работать одновременно над разными репозиториями"
+    stats = p.stats()
+    assert stats["fetch"]["processed"] == stats["count"]["processed"] == 8
+    assert stats["count"]["queue_max"] <= 1
+    assert stats["fetch"]["throughput"] > 0
+
+
+def test_failed_job_skips_remaining_stages():
+    def explode(job):
+        if job["repository"].name == "bad":
+            raise RuntimeError("boom")
+        return job
+
+    def mark(job):
+        job["marked"] = True
+        return job
+
+    p = Pipeline([Stage("first", explode, workers=2), Stage("second", mark)])
+    jobs = {job["repository"].name: job for job in p.run(make_jobs("good", "bad", "other"))}
+
+    assert jobs["bad"]["error"] == "first: boom" and "marked" not in jobs["bad"]
+    assert jobs["good"]["marked"] and jobs["other"]["marked"]
+    assert p.stats()["first"]["failed"] == 1
+
+
+def test_repository_pipeline_end_to_end(monkeypatch):
+    saved = {}
+    monkeypatch.setattr(pipeline, "load_repo_data_from_cache",
+                        lambda project, name: {"files": [{"path": "/c.py", "tokens": 3}], "total_tokens": 3,
+                                               "commit_id": "old"} if name == "Cached" else None)
+    monkeypatch.setattr(pipeline, "plan_repo_fetch", lambda project, name, cached_files=None: {"name": name})
+    monkeypatch.setattr(pipeline, "fetch_repo_files",
+                        lambda project, name, plan, materialize=False, spool=False: plan.update(fetched=True) or plan)
+    monkeypatch.setattr(pipeline, "count_fetched_files",
+                        lambda name, plan, on_record=None: ([{"path": f"/{name}.py", "tokens": 5}], 5))
+    monkeypatch.setattr(pipeline, "save_repo_data_to_cache",
+                        lambda project, name, tokens, files, commit_id=None: saved.setdefault(name, commit_id))
+    monkeypatch.setattr(pipeline, "save_project_head",
+                        lambda project, name, commit_id: saved.setdefault(f"head:{name}", commit_id))
+    monkeypatch.setattr(pipeline, "generate_report", lambda project, name, files: f"/reports/{name}.txt")
+
+    jobs = [
+        pipeline.make_job("P", SimpleNamespace(name="Fresh"), True, "h1"),
+        pipeline.make_job("P", SimpleNamespace(name="Cached"), False, "h2"),
+    ]
+    results = {r["repository"]: r for r in (pipeline.job_result(job) for job in pipeline.run_pipeline(jobs))}
+
+    files = results["Fresh"].pop("files")
+    assert results["Fresh"] == {"repository": "Fresh", "tokens": 5, "cached": False,
+                                "report_path": "/reports/Fresh.txt", "report_artifact": None, "report_reused": False}
+    assert [(f["path"], f["tokens"]) for f in files] == [("/Fresh.py", 5)]
+    assert results["Cached"]["cached"] and results["Cached"]["tokens"] == 3
+    assert saved == {"Fresh": "h1", "head:Cached": "h2"}
+
+
+def test_interrupted_run_resumes_from_file_checkpoint(monkeypatch, tmp_path):
+    """
+    Файлы, посчитанные до ошибки на этапе метрик, сохраняются в контрольной точке запуска,
+    а продолжение запуска передаёт их в листинг, чтобы не загружать заново.
+    """
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path))
+    listed = []
+    monkeypatch.setattr(pipeline, "load_repo_data_from_cache", lambda project, name: None)
+    monkeypatch.setattr(pipeline, "plan_repo_fetch",
+                        lambda project, name, cached_files=None: listed.append(cached_files) or {"name": name})
+
+    def interrupted_count(name, plan, on_record=None):
+        on_record({"path": "/a.py", "object_id": "blob-a", "tokens": 7})
+        raise RuntimeError("обрыв")
+
+    monkeypatch.setattr(pipeline, "count_fetched_files", interrupted_count)
+    job = pipeline._list_stage(pipeline.make_job("P", SimpleNamespace(name="Repo"), True, "h1", "run-1"))
+    with pytest.raises(RuntimeError):
+        pipeline._metrics_stage(job)
+
+    pipeline._list_stage(pipeline.make_job("P", SimpleNamespace(name="Repo"), True, "h1", "run-1"))
+    assert listed == [None, [{"path": "/a.py", "object_id": "blob-a", "tokens": 7}]]
+
+
+def test_feed_error_closes_pipeline():
+    """Ошибка в потоке заданий не вешает конвейер: run() завершается и пробрасывает её."""
+    def broken_jobs():
+        yield from make_jobs("a")
+        raise RuntimeError("no more jobs")
+
+    p = Pipeline([Stage("only", lambda job: job)])
+    seen = []
+    with pytest.raises(RuntimeError, match="no more jobs"):
+        for job in p.run(broken_jobs()):
+            seen.append(job["repository"].name)
+    assert seen == ["a"]
+
+
+def test_jobs_are_created_lazily(monkeypatch):
+    """Кэш репозитория читается на этапе листинга, когда задание уже вошло в конвейер."""
+    loaded = []
+    monkeypatch.setattr(pipeline, "load_repo_data_from_cache",
+                        lambda project, name: loaded.append(name) or {"files": [], "total_tokens": 0})
+
+    job = pipeline.make_job("P", SimpleNamespace(name="Repo"), False, "h1")
+    assert loaded == [] and not job["from_cache"]
+
+    pipeline._list_stage(job)
+    assert loaded == ["Repo"] and job["from_cache"]
+
+
+def test_stages_run_on_shared_pool():
+    """С общим пулом работа этапов идёт на его потоках, и одновременно их не больше размера пула."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+    threads = set()
+
+    def work(job):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            threads.add(threading.current_thread().name)
+        time.sleep(0.01)
+        with lock:
+            state["running"] -= 1
+        return job
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="shared") as pool:
+        p = Pipeline([Stage("fetch", work, workers=4), Stage("count", work, workers=2)], executor=pool)
+        done = list(p.run(make_jobs(*"abcdefgh")))
+
+    assert len(done) == 8
+    assert state["peak"] <= 2, "Одновременно работает не больше потоков, чем в общем пуле"
+    assert all(name.startswith("shared") for name in threads)
@@ -0,0 +1,36 @@
+import os
+import time
+
+from core.utils.profiling import profile_run
+
+
+def busy_work():
+    deadline = time.perf_counter() + 0.1
+    data = []
+    while time.perf_counter() < deadline:
+        data.append("x" * 1000)
+    return len(data)
+
+
+def test_profile_run_writes_all_artifacts(tmp_path):
+    with profile_run(str(tmp_path), memory=True, folded=True, top=5) as paths:
+        busy_work()
+
+    assert set(paths) == {"pstats", "summary", "folded", "memory"}
+    for path in paths.values():
+        assert os.path.getsize(path) > 0
+
+    with open(paths["summary"], encoding="utf-8") as f:
+        assert "busy_work" in f.read()
+    with open(paths["folded"], encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert any("busy_work" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    with open(paths["memory"], encoding="utf-8") as f:
+        assert "пик" in f.read()
+
+
+def test_profile_run_without_options_writes_only_cprofile(tmp_path):
+    with profile_run(str(tmp_path)) as paths:
+        busy_work()
+    assert set(paths) == {"pstats", "summary"}
@@ -0,0 +1,104 @@
+# tests/test_report_artifacts.py
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from core.analyze import repository_analysis
+from core.reports import artifacts
+from core.reports.generate import generate_report
+
+FILES = [{"path": "/src/main.py", "object_id": "ab" * 20, "tokens": 12, "lines": 3, "comments": 1}]
+
+@pytest.fixture(autouse=True)
+def fake_dirs(tmp_path, monkeypatch):
+    """Кэш и отчёты — во временной папке."""
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def cache_hit(monkeypatch):
+    """Репозиторий не изменился, данные берутся из кэша; считаем вызовы generate_report."""
+    calls = []
+
+    def counting_generate_report(project_name, repository_name, files_data):
+        calls.append(repository_name)
+        return generate_report(project_name, repository_name, files_data)
+
+    state = {"commit_id": "c1", "total_tokens": 12, "files": FILES}
+    monkeypatch.setattr(repository_analysis, "load_repo_data_from_cache", lambda project, name: dict(state))
+    monkeypatch.setattr(repository_analysis, "generate_report", counting_generate_report)
+    return SimpleNamespace(calls=calls, state=state)
+
+def analyze(name="Repo"):
+    return repository_analysis.analyze_repository("P", SimpleNamespace(name=name), False, "fast", head_commit="c1")
+
+def test_report_key_depends_on_state_and_config(monkeypatch):
+    key = artifacts.report_key("P", "R", "c1", 10)
+    assert key == artifacts.report_key("P", "R", "c1", 10)
+    assert key != artifacts.report_key("P", "R", "c2", 10)
+    assert key != artifacts.report_key("P", "R", "c1", 11)
+    assert artifacts.report_key("P", "R", None, 10) is None, "Без коммита состояние неизвестно"
+
+    monkeypatch.setattr(artifacts, "WHITE_EXTENSIONS", {".py", ".cs"})
+    assert artifacts.report_key("P", "R", "c1", 10) != key, "Другой белый список — другой отчёт"
+
+def test_cache_hit_reuses_stored_report(cache_hit):
+    """Второй запуск с тем же состоянием не генерирует отчёт, а ссылается на сохранённый."""
+    first = analyze()
+    assert cache_hit.calls == ["Repo"] and not first["report_reused"]
+    assert os.path.exists(first["report_artifact"])
+
+    os.remove(first["report_path"])  # как будто отчёт прошлого запуска удалили вместе с его папкой
+    second = analyze()
+
+    assert cache_hit.calls == ["Repo"], "Отчёт не должен генерироваться повторно"
+    assert second["report_reused"] and second["cached"]
+    assert second["report_artifact"] == first["report_artifact"]
+    assert os.path.samefile(second["report_path"], second["report_artifact"])
+    with open(second["report_path"], encoding="utf-8") as f:
+        assert "/src/main.py" in f.read()
+
+def test_changed_state_generates_new_report(cache_hit):
+    analyze()
+    cache_hit.state["commit_id"] = "c2"
+
+    result = analyze()
+
+    assert cache_hit.calls == ["Repo", "Repo"] and not result["report_reused"]
+
+def test_regenerated_report_does_not_overwrite_stored_one(cache_hit):
+    """Отчёт с тем же именем пишется через временный файл и не меняет сохранённый по жёсткой ссылке."""
+    reused = analyze()
+    with open(reused["report_artifact"], encoding="utf-8") as f:
+        stored = f.read()
+
+    generate_report("P", "Repo", [{"path": "/other.py", "tokens": 1}])
+
+    with open(reused["report_artifact"], encoding="utf-8") as f:
+        assert f.read() == stored
+
+@pytest.mark.skipif(os.name == "nt", reason="Права файлов POSIX")
+def test_report_gets_regular_file_permissions():
+    """Отчёт, записанный через временный файл, получает права обычного файла, а не 0o600 от mkstemp."""
+    umask = os.umask(0)
+    os.umask(umask)
+
+    path = generate_report("P", "Repo", FILES)
+
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+
+def test_run_manifest_lists_reused_reports(cache_hit):
+    analyze()
+    reused = analyze()
+
+    path = artifacts.write_run_manifest("P", "run-1", [reused, {"repository": "Deep", "report_path": "/x.txt"}])
+
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["run_id"] == "run-1" and manifest["reused"] == 1
+    assert manifest["reports"][0] == {"repository": "Repo", "report_path": reused["report_path"],
+                                      "artifact": reused["report_artifact"], "reused": True, "cached": True}
+    assert manifest["reports"][1]["artifact"] is None and not manifest["reports"][1]["reused"]
@@ -8,29 +8,29 @@ from core.analyze.repository_analysis import analyze_repository_from_scratch
 
 # Определяем фиктивные (dummy) реализации зависимых функций:
 
-def dummy_count_tokens_in_repo(project_name, repository_name):
+def dummy_iter_repo_files(project_name, repository_name, on_content=None, **kwargs):
     """
-    Функция возвращает фиктивное значение:
-    - files_data: список словарей, где для каждого файла указан его путь, имя и содержимое.
-    - total_tokens: общее число токенов.
+    Фиктивный поток файлов: один файл на 42 токена.
+    Если передан on_content, он вызывается с содержимым файла.
     """
-    files_data = [
-        {"file_name": "test1.py", "folder": "src", "content": "print('Hello World')"}
-    ]
-    total_tokens = 42
-    return files_data, total_tokens
+    record = {"path": "/src/test1.py", "tokens": 42, "lines": 1, "comments": 0}
+    if on_content is not None:
+        on_content(record, "print('Hello World')")
+    yield record
 
 def dummy_generate_report(project_name, repository_name, files_data):
     """
     Функция генерирует фиктивный отчёт (быстрый анализ) в системной временной папке и возвращает его путь.
+    Как и настоящий отчёт, перебирает поток файлов.
     """
+    list(files_data)
     tmp_dir = tempfile.gettempdir()
     report_path = os.path.join(tmp_dir, f"report_{repository_name}.txt")
     with open(report_path, "w", encoding="utf-8") as f:
         f.write("Dummy fast report")
     return report_path
 
-def dummy_generate_deep_report_for_repo(project_name, repository_name, files_data):
+def dummy_write_aggregated_deep_report(project_name, repository_name, deep_report_paths):
     """
     Функция генерирует фиктивный отчёт глубокого анализа и возвращает его путь.
     """
@@ -40,43 +40,56 @@ def dummy_generate_deep_report_for_repo(project_name, repository_name, files_dat
         f.write("Dummy deep report")
     return report_path
 
-def dummy_get_deep_reports_for_repo(project_name, repository_name, files_data):
+def dummy_generate_ai_report(project_name, repository_name, folder_name, file_name, file_content):
     """
-    Возвращает список фиктивных путей к ИИ‑отчётам для каждого файла.
+    Возвращает фиктивный путь к ИИ‑отчёту файла.
     """
-    return [f"/dummy/path/{file_data['file_name']}_ai.txt" for file_data in files_data]
+    return f"/dummy/path/{file_name}_ai.txt"
 
-def dummy_save_repo_data_to_cache(project_name, repository_name, total_tokens, files_data):
+class DummyCacheWriter:
     """
-    Фиктивная функция сохранения данных в кэш. Просто ничего не делает.
+    Фиктивная потоковая запись кэша. Просто ничего не делает.
     """
-    pass
+    def __init__(self, project_name, repository_name):
+        pass
+
+    def add(self, file_info):
+        pass
+
+    def close(self, total_tokens=None, commit_id=None):
+        pass
+
+    def abort(self):
+        pass
 
 @pytest.fixture(autouse=True)
-def patch_dependencies(monkeypatch):
+def patch_dependencies(monkeypatch, tmp_path):
     """
     Патчим зависимости в модуле repository_analysis.
+    Кэш и отчёты пишутся во временную папку, а не в рабочую папку репозитория.
     """
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr("core.reports.generate.REPORTS_DIR", str(tmp_path / "reports"))
+    monkeypatch.setattr("core.reports.artifacts.REPORTS_DIR", str(tmp_path / "reports"))
     monkeypatch.setattr(
-        "core.analyze.repository_analysis.count_tokens_in_repo",
-        dummy_count_tokens_in_repo
+        "core.analyze.repository_analysis.iter_repo_files",
+        dummy_iter_repo_files
     )
     monkeypatch.setattr(
         "core.analyze.repository_analysis.generate_report",
         dummy_generate_report
     )
     monkeypatch.setattr(
-        "core.analyze.repository_analysis.generate_deep_report_for_repo",
-        dummy_generate_deep_report_for_repo
+        "core.analyze.repository_analysis.write_aggregated_deep_report",
+        dummy_write_aggregated_deep_report
     )
     monkeypatch.setattr(
-        "core.analyze.repository_analysis.get_deep_reports_for_repo",
-        dummy_get_deep_reports_for_repo
+        "core.analyze.repository_analysis.generate_ai_report",
+        dummy_generate_ai_report
     )
-    # Поскольку импорт save_repo_data_to_cache происходит внутри функции, патчим исходный модуль:
     monkeypatch.setattr(
-        "core.utils.cache.save_repo_data_to_cache",
-        dummy_save_repo_data_to_cache
+        "core.analyze.repository_analysis.RepoCacheWriter",
+        DummyCacheWriter
     )
 
 def test_analyze_repository_from_scratch_fast():
@@ -110,7 +123,7 @@ def test_analyze_repository_from_scratch_deep():
     Ожидается, что:
       - Функция возвращает словарь с ключами repository, tokens, cached, files, report_path, ai_reports.
       - Поле "cached" устанавливается в False.
-      - Отчёт генерируется с помощью dummy_generate_deep_report_for_repo.
+      - Отчёт генерируется с помощью dummy_write_aggregated_deep_report.
       - ai_reports содержит список путей к ИИ‑отчётам.
     """
     project_name = "TestProject"
@@ -123,13 +136,96 @@ def test_analyze_repository_from_scratch_deep():
     assert result["tokens"] == 42
     # При глубоком анализе cached всегда False
     assert result["cached"] is False
-    # Проверяем, что report_path соответствует dummy_generate_deep_report_for_repo
+    # Проверяем, что report_path соответствует dummy_write_aggregated_deep_report
     tmp_dir = tempfile.gettempdir()
     expected_deep_report_path = os.path.join(tmp_dir, f"deep_report_{repository_name}.txt")
     assert result["report_path"] == expected_deep_report_path
-    # Проверяем, что ai_reports присутствует и является списком с одним элементом (так как у нас один файл в dummy_count_tokens_in_repo)
+    # Проверяем, что ai_reports присутствует и является списком с одним элементом (так как у нас один файл в dummy_iter_repo_files)
     assert "ai_reports" in result
     assert isinstance(result["ai_reports"], list)
     assert len(result["ai_reports"]) == 1
     expected_ai_report = "/dummy/path/test1.py_ai.txt"
     assert result["ai_reports"][0] == expected_ai_report
+
+def test_analyze_repository_incremental(monkeypatch):
+    """
+    Инкрементальный анализ: пересчитываются только изменённые файлы,
+    удалённые пропадают, остальные берутся из кэша.
+    """
+    from core.analyze import repository_analysis
+
+    cached_data = {
+        "commit_id": "old",
+        "total_tokens": 30,
+        "files": [
+            {"path": "/b.py", "tokens": 15},
+            {"path": "/a.py", "tokens": 10},
+            {"path": "/c.py", "tokens": 5},
+        ],
+    }
+    changes = [
+        {"path": "/b.py", "object_id": "b2", "change_type": "edit", "original_path": None},
+        {"path": "/c.py", "object_id": None, "change_type": "delete", "original_path": None},
+        {"path": "/d.py", "object_id": "d1", "change_type": "add", "original_path": None},
+    ]
+    fetched = []
+
+    def fake_count_tokens_for_items(project_name, repository_name, items):
+        fetched.extend(item["path"] for item in items)
+        return [{"path": item["path"], "tokens": 100} for item in items], 100 * len(items)
+
+    saved = {}
+
+    def fake_update(project_name, repository_name, upserts, deleted, commit_id=None):
+        saved.update(upserts=[f["path"] for f in upserts], deleted=deleted, commit_id=commit_id)
+        return True
+
+    monkeypatch.setattr(repository_analysis, "get_changed_files", lambda *args: changes)
+    monkeypatch.setattr(repository_analysis, "count_tokens_for_items", fake_count_tokens_for_items)
+    monkeypatch.setattr(repository_analysis, "is_whitelisted", lambda path: path.endswith(".py"))
+    monkeypatch.setattr(repository_analysis, "update_repo_files", fake_update)
+
+    result = repository_analysis.analyze_repository_incremental("TestProject", "TestRepo", cached_data, "new")
+
+    assert fetched == ["/b.py", "/d.py"], "Скачиваться должны только изменённые и новые файлы"
+    assert [f["path"] for f in result["files"]] == ["/b.py", "/a.py", "/d.py"], \
+        "Изменённый файл остаётся на своём месте, новый — в конце"
+    assert result["tokens"] == 10 + 100 + 100
+    assert saved == {"upserts": ["/b.py", "/d.py"], "deleted": ["/c.py"], "commit_id": "new"}, \
+        "В кэш записываются только изменённые файлы"
+
+def test_deep_analysis_resumes_from_checkpoint(monkeypatch, tmp_path):
+    """
+    Глубокий анализ после прерывания не запрашивает ИИ‑отчёт повторно для файла,
+    уже обработанного в контрольной точке, и сохраняет новые отчёты в неё.
+    """
+    from core.analyze import repository_analysis
+    from core.utils import checkpoints
+
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path))
+    store = checkpoints.get_checkpoint_store()
+    store.begin_run("run-1", "TestProject", "deep")
+    ready_report = tmp_path / "ready.txt"
+    ready_report.write_text("готово", encoding="utf-8")
+    checkpoints.RepoCheckpoint(store, "run-1", "TestRepo").add(
+        {"path": "/src/done.py", "object_id": "d1", "tokens": 1}, str(ready_report)
+    )
+
+    def fake_iter_repo_files(project_name, repository_name, on_content=None, **kwargs):
+        for path, object_id in (("/src/done.py", "d1"), ("/src/new.py", "n1")):
+            record = {"path": path, "object_id": object_id, "tokens": 1, "lines": 1, "comments": 0}
+            on_content(record, "print(1)")
+            yield record
+
+    requested = []
+    monkeypatch.setattr(repository_analysis, "iter_repo_files", fake_iter_repo_files)
+    monkeypatch.setattr(repository_analysis, "generate_ai_report",
+                        lambda project, repo, folder, file_name, content: requested.append(file_name) or
+                        f"/dummy/{file_name}_ai.txt")
+
+    checkpoint = checkpoints.RepoCheckpoint(store, "run-1", "TestRepo")
+    result = analyze_repository_from_scratch("TestProject", "TestRepo", "deep", checkpoint=checkpoint)
+
+    assert requested == ["new.py"]
+    assert result["ai_reports"] == [str(ready_report), "/dummy/new.py_ai.txt"]
+    assert store.load_files("run-1", "TestRepo")["/src/new.py"]["ai_report"] == "/dummy/new.py_ai.txt"
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pytest
+
+from core.analyze import scheduling
+
+
+def repos(*names):
+    return [SimpleNamespace(name=name) for name in names]
+
+
+def test_longest_first_orders_by_estimate_and_keeps_ties_stable():
+    ordered = scheduling.plan(repos("a", "b", "c", "d"), {"a": 1, "b": 5, "c": 1, "d": 3}, "lpt")
+    assert [r.name for r in ordered] == ["b", "d", "a", "c"]
+
+
+def test_custom_policy_can_be_registered(monkeypatch):
+    monkeypatch.setitem(scheduling.SCHEDULING_POLICIES, "by_name_desc",
+                        lambda repositories, estimates: sorted(repositories, key=lambda r: r.name, reverse=True))
+    ordered = scheduling.plan(repos("a", "c", "b"), {}, "by_name_desc")
+    assert [r.name for r in ordered] == ["c", "b", "a"]
+
+
+def test_unknown_policy_falls_back_to_fifo():
+    assert [r.name for r in scheduling.plan(repos("a", "b"), {"b": 9}, "nope")] == ["a", "b"]
+
+
+def test_estimates_use_cache_then_listing(monkeypatch):
+    caches = {
+        "cached": {"total_tokens": 1000, "files": 2, "tokens": 1000},
+        "unchanged": {"total_tokens": 1000, "files": 1, "tokens": 1000},
+    }
+    listings = {"fresh": [{"path": "/a.py"}, {"path": "/b.bin"}], "broken": None}
+    monkeypatch.setattr(scheduling, "load_repo_totals", lambda project, name: caches.get(name))
+    monkeypatch.setattr(scheduling, "get_repo_items", lambda project, name: listings[name])
+    monkeypatch.setattr(scheduling, "is_whitelisted", lambda path: path.endswith(".py"))
+
+    estimates = scheduling.estimate_costs("P", repos("cached", "unchanged", "fresh", "broken"), {"unchanged"})
+
+    assert estimates["cached"] == 1000 + 2 * scheduling.FILE_COST_TOKENS
+    assert estimates["unchanged"] == pytest.approx((1000 + scheduling.FILE_COST_TOKENS) * scheduling.CACHED_COST_FACTOR)
+    assert estimates["fresh"] == scheduling.DEFAULT_TOKENS_PER_FILE + scheduling.FILE_COST_TOKENS
+    known = [estimates[name] for name in ("cached", "unchanged", "fresh")]
+    assert estimates["broken"] == pytest.approx(sum(known) / 3)
+
+
+def test_lpt_shortens_simulated_makespan():
+    durations = {"small1": 1, "small2": 1, "small3": 1, "huge": 10}
+    fifo_order = ["small1", "small2", "small3", "huge"]
+    lpt_order = [r.name for r in scheduling.plan(repos(*fifo_order), durations, "lpt")]
+    fifo = scheduling.simulate_makespan([durations[n] for n in fifo_order], 2)
+    lpt = scheduling.simulate_makespan([durations[n] for n in lpt_order], 2)
+    assert (fifo, lpt) == (11, 10)
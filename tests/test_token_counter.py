@@ -1,6 +1,19 @@
 # tests/test_token_counter.py
+import io
+import tempfile
+import tracemalloc
+import zipfile
 
-from core.utils.token_counter import count_tokens_in_text
+import pytest
+
+from core.utils import token_counter
+from core.utils.token_counter import count_tokens_in_text, count_tokens_in_texts, count_tokens_in_repo, get_encoder
+
+@pytest.fixture(autouse=True)
+def fake_cache_dir(tmp_path, monkeypatch):
+    """Мемо токенов хранится в папке кэша — перенаправляем её во временную."""
+    monkeypatch.setattr("core.utils.cache.CACHE_DIR", str(tmp_path))
+    return tmp_path
 
 def test_count_tokens():
     text = "print('Hello, World!')"
@@ -8,5 +21,270 @@ def test_count_tokens():
     assert isinstance(tokens, int), "Токены должны быть целым числом"
     assert tokens > 0, "Количество токенов должно быть положительным"
 
+def test_count_tokens_in_texts_matches_single():
+    """
+    Пакетный подсчёт совпадает с подсчётом по одному тексту, а кодировщик создаётся один раз.
+    """
+    texts = ["print('Hello')", "", "def f(x):\n    return x * 2\n"]
+    assert count_tokens_in_texts(texts) == [count_tokens_in_text(t) for t in texts]
+    # Большой пакет идёт через многопоточный encode_ordinary_batch с тем же результатом
+    many = texts * token_counter.TOKENIZE_PARALLEL_MIN
+    assert count_tokens_in_texts(many) == [count_tokens_in_text(t) for t in many]
+    assert count_tokens_in_texts([]) == []
+    assert get_encoder() is get_encoder()
+
+def make_archive(files):
+    """Собирает zip-архив в памяти из словаря {путь: содержимое}."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for path, content in files.items():
+            zip_file.writestr(path, content)
+    return buffer.getvalue()
+
+def test_count_tokens_in_repo_from_archive(monkeypatch):
+    """
+    Архивный режим: файлы из белого списка считаются из zip-потока,
+    пофайловая загрузка не вызывается.
+    """
+    archive = make_archive({
+        "main.py": "# comment\nprint('Hello')\n",
+        "src/app.cs": "// comment\nclass App {}\n",
+        "logo.png": "binary",
+    })
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py", ".cs"})
+    monkeypatch.setattr(token_counter, "download_repo_archive", lambda project, repo: archive)
+    monkeypatch.setattr(token_counter, "get_file_content", lambda *args: (_ for _ in ()).throw(AssertionError))
+
+    files_data, total_tokens = count_tokens_in_repo("TestProject", "TestRepo", fetch_mode="archive")
+
+    paths = [f["path"] for f in files_data]
+    assert paths == ["/main.py", "/src/app.cs"], "Должны учитываться только файлы из белого списка"
+    assert all(f["comments"] == 1 for f in files_data)
+    assert total_tokens == sum(f["tokens"] for f in files_data)
+
+def test_count_tokens_in_repo_falls_back_to_files(monkeypatch):
+    """
+    Если архив недоступен, используется пофайловая загрузка.
+    """
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py"})
+    monkeypatch.setattr(token_counter, "download_repo_archive", lambda project, repo: None)
+    monkeypatch.setattr(
+        token_counter, "get_repo_items",
+        lambda project, repo: [{"path": "/main.py", "object_id": "a1"}, {"path": "/readme.txt", "object_id": "b2"}]
+    )
+    monkeypatch.setattr(token_counter, "get_file_content", lambda project, repo, path: "print('Hello')")
+
+    files_data, total_tokens = count_tokens_in_repo("TestProject", "TestRepo", fetch_mode="archive")
+
+    assert [f["path"] for f in files_data] == ["/main.py"]
+    assert total_tokens > 0
+
+def test_count_tokens_in_repo_concurrent_order(monkeypatch):
+    """
+    Параллельная пофайловая загрузка сохраняет порядок файлов.
+    """
+    paths = [f"/file_{i}.py" for i in range(30)]
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py"})
+    monkeypatch.setattr(
+        token_counter, "get_repo_items",
+        lambda project, repo: [{"path": path, "object_id": f"id{i}"} for i, path in enumerate(paths)]
+    )
+    monkeypatch.setattr(token_counter, "get_file_content", lambda project, repo, path: f"print('{path}')")
+
+    files_data, _ = count_tokens_in_repo("TestProject", "TestRepo", fetch_mode="files", concurrency=6)
+
+    assert [f["path"] for f in files_data] == paths
+
+def test_spooled_fetch_keeps_contents_on_disk(monkeypatch):
+    """
+    Загрузка для конвейера (materialize + spool) держит содержимое файлов во временном файле,
+    а подсчёт даёт те же записи, что и обычный.
+    """
+    paths = [f"/file_{i}.py" for i in range(5)]
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py"})
+    monkeypatch.setattr(
+        token_counter, "get_repo_items",
+        lambda project, repo: [{"path": path, "object_id": f"id{i}"} for i, path in enumerate(paths)]
+    )
+    monkeypatch.setattr(token_counter, "get_file_content", lambda project, repo, path: f"print('{path}') # ё")
+
+    plan = token_counter.plan_repo_fetch("TestProject", "TestRepo", fetch_mode="files")
+    token_counter.fetch_repo_files("TestProject", "TestRepo", plan, materialize=True, spool=True)
+    spooled = plan["fetched"]
+
+    assert isinstance(spooled, token_counter._SpooledFetch) and len(spooled) == 5 and spooled.nbytes > 0
+    files_data, _ = token_counter.count_fetched_files("TestRepo", plan)
+    assert spooled._file.closed, "Временный файл удаляется после подсчёта"
+    assert files_data == count_tokens_in_repo("TestProject", "TestRepo", fetch_mode="files")[0]
+
+def test_count_tokens_in_repo_uses_memo(monkeypatch):
+    """
+    Повторный подсчёт тех же блобов берёт метрики из мемо и не скачивает файлы.
+    """
+    items = [{"path": "/a.py", "object_id": "blob-a"}, {"path": "/b.py", "object_id": "blob-b"}]
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py"})
+    monkeypatch.setattr(token_counter, "get_repo_items", lambda project, repo: items)
+    monkeypatch.setattr(token_counter, "get_file_content", lambda project, repo, path: f"print('{path}')")
+
+    first, first_total = count_tokens_in_repo("TestProject", "RepoA", fetch_mode="files")
+
+    def fail_fetch(*args):
+        raise AssertionError("Файл из мемо не должен скачиваться повторно")
+
+    monkeypatch.setattr(token_counter, "get_file_content", fail_fetch)
+    second, second_total = count_tokens_in_repo("TestProject", "RepoB", fetch_mode="files")
+
+    assert second == first
+    assert second_total == first_total
+
+def test_count_tokens_in_repo_reuses_unchanged_files(monkeypatch):
+    """
+    Файлы с неизменившимся objectId берутся из кэша, скачивается только изменённый.
+    """
+    items = [{"path": "/a.py", "object_id": "same"}, {"path": "/b.py", "object_id": "new"}]
+    cached_files = [
+        {"path": "/a.py", "hash": "same", "tokens": 100, "lines": 10, "comments": 1},
+        {"path": "/b.py", "hash": "old", "tokens": 50, "lines": 5, "comments": 0},
+    ]
+    fetched = []
+
+    def fake_content(project, repo, path):
+        fetched.append(path)
+        return "print('b')"
+
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py"})
+    monkeypatch.setattr(token_counter, "get_repo_items", lambda project, repo: items)
+    monkeypatch.setattr(token_counter, "get_file_content", fake_content)
+    monkeypatch.setattr(token_counter, "download_repo_archive", lambda *args: (_ for _ in ()).throw(AssertionError))
+
+    files_data, total_tokens = count_tokens_in_repo("TestProject", "TestRepo", cached_files=cached_files)
+
+    assert fetched == ["/b.py"], "Скачиваться должен только изменённый файл"
+    assert [f["path"] for f in files_data] == ["/a.py", "/b.py"]
+    assert files_data[0]["tokens"] == 100
+    assert total_tokens == 100 + files_data[1]["tokens"]
+
+def spooled(archive):
+    """Имитирует download_repo_archive_to_file: архив во временном файле."""
+    def download(project, repo):
+        f = tempfile.TemporaryFile()
+        f.write(archive)
+        f.seek(0)
+        opened.append(f)
+        return f
+    opened = []
+    download.opened = opened
+    return download
+
+def test_iter_repo_files_streams_spooled_archive(monkeypatch):
+    """
+    Потоковый режим: архив читается из временного файла, записи идут по одной
+    и совпадают с count_tokens_in_repo; временный файл закрывается.
+    """
+    archive = make_archive({
+        "main.py": "# comment\nprint('Hello')\n",
+        "src/app.py": "print('app')\n",
+        "logo.png": "binary",
+    })
+    download = spooled(archive)
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py"})
+    monkeypatch.setattr(token_counter, "download_repo_archive", lambda project, repo: archive)
+    monkeypatch.setattr(token_counter, "download_repo_archive_to_file", download)
+
+    stream = token_counter.iter_repo_files("TestProject", "TestRepo", fetch_mode="archive")
+    first = next(stream)
+    assert first["path"] == "/main.py"
+    records = [first] + list(stream)
+
+    files_data, _ = count_tokens_in_repo("TestProject", "TestRepo", fetch_mode="archive")
+    assert records == files_data
+    assert download.opened[0].closed, "Временный файл архива должен закрываться"
+
+def test_iter_repo_files_on_content(monkeypatch):
+    """
+    on_content получает содержимое каждого файла, даже если его метрики есть в мемо.
+    """
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py"})
+    monkeypatch.setattr(
+        token_counter, "get_repo_items",
+        lambda project, repo: [{"path": "/a.py", "object_id": "a1"}, {"path": "/b.py", "object_id": "b1"}]
+    )
+    monkeypatch.setattr(token_counter, "get_file_content", lambda project, repo, path: f"print('{path}')")
+    list(token_counter.iter_repo_files("TestProject", "TestRepo", fetch_mode="files"))
+
+    seen = []
+    records = list(token_counter.iter_repo_files(
+        "TestProject", "TestRepo", fetch_mode="files",
+        on_content=lambda record, content: seen.append((record["path"], content))
+    ))
+
+    assert [r["path"] for r in records] == ["/a.py", "/b.py"]
+    assert seen == [("/a.py", "print('/a.py')"), ("/b.py", "print('/b.py')")]
+
+@pytest.mark.parametrize("fetch_mode", ["files", "archive"])
+def test_iter_repo_files_keeps_listing_order(monkeypatch, fetch_mode):
+    """
+    Файлы из кэша отдаются на своих местах среди посчитанных, как в count_tokens_in_repo,
+    а спан count_tokens покрывает весь перебор, а не только запуск ленивой загрузки.
+    """
+    from core.logging import metrics
+
+    contents = {"/d.py": "print('d')\n", "/a.py": "print('a')\n", "/c.py": ""}
+    items = [{"path": path, "object_id": token_counter.git_blob_id(contents[path].encode("utf-8"))}
+             for path in ("/a.py", "/c.py", "/d.py")]
+    items[1:1] = [{"path": "/b.py", "object_id": "same"}]
+    items.append({"path": "/e.py", "object_id": "same-e"})
+    cached_files = [
+        {"path": "/e.py", "hash": "same-e", "tokens": 7, "lines": 1, "comments": 0},
+        {"path": "/b.py", "hash": "same", "tokens": 5, "lines": 1, "comments": 0},
+    ]
+    # В архиве файлы идут не в порядке листинга
+    archive = make_archive({path.lstrip("/"): content for path, content in contents.items()})
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py"})
+    monkeypatch.setattr(token_counter, "ARCHIVE_MIN_FILES", 1)
+    monkeypatch.setattr(token_counter, "get_repo_items", lambda project, repo: items)
+    monkeypatch.setattr(token_counter, "get_file_content", lambda project, repo, path: contents[path])
+    monkeypatch.setattr(token_counter, "download_repo_archive", lambda project, repo: archive)
+    monkeypatch.setattr(token_counter, "download_repo_archive_to_file", spooled(archive))
+    metrics.start_run()
+
+    stream = token_counter.iter_repo_files("TestProject", "TestRepo", fetch_mode, cached_files=cached_files)
+    next(stream)
+    assert "count_tokens" not in metrics.run_rollup(repository="TestRepo")
+    records = [record["path"] for record in stream]
+
+    assert metrics.run_rollup(repository="TestRepo")["count_tokens"]["count"] == 1
+    assert ["/a.py"] + records == ["/a.py", "/b.py", "/d.py", "/e.py"]
+    files_data, _ = count_tokens_in_repo("TestProject", "TestRepo", fetch_mode, cached_files=cached_files)
+    assert [record["path"] for record in files_data] == ["/a.py", "/b.py", "/d.py", "/e.py"]
+
+def test_iter_repo_files_bounded_memory(monkeypatch):
+    """
+    Пик памяти при потоковой обработке не растёт с числом файлов:
+    содержимое файла не удерживается после подсчёта.
+    """
+    monkeypatch.setattr(token_counter, "WHITE_EXTENSIONS", {".py"})
+    monkeypatch.setattr(token_counter, "count_tokens_in_texts", lambda texts: [1] * len(texts))
+    body = "x = 1\n" * 20000  # ~120 КБ на файл
+
+    def peak_for(files_count):
+        paths = [f"/f{i}.py" for i in range(files_count)]
+        monkeypatch.setattr(
+            token_counter, "get_repo_items",
+            lambda project, repo: [{"path": path, "object_id": f"{files_count}-{path}"} for path in paths]
+        )
+        monkeypatch.setattr(token_counter, "get_file_content", lambda project, repo, path: body + path)
+        tracemalloc.start()
+        try:
+            for _ in token_counter.iter_repo_files("TestProject", "TestRepo", fetch_mode="files", concurrency=2):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    small, large = peak_for(100), peak_for(400)
+    # Накопление содержимого дало бы рост в ~36 МБ
+    assert large - small < 10 * 1024 * 1024
+
 if __name__ == "__main__":
-    test_count_tokens()
\ No newline at end of file
+    test_count_tokens()
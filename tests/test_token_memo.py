@@ -0,0 +1,76 @@
+# tests/test_token_memo.py
+import threading
+
+from core.utils.token_memo import TokenMemo, git_blob_id, memo_key
+
+def record(tokens):
+    return {"tokens": tokens, "lines": 1, "comments": 0}
+
+def test_git_blob_id_matches_git():
+    """objectId совпадает с `git hash-object`."""
+    assert git_blob_id(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+def test_memo_key_depends_on_extension():
+    """Один и тот же блоб с разными расширениями даёт разные ключи (комментарии считаются по-разному)."""
+    assert memo_key("abc", "/x.py") != memo_key("abc", "/x.cs")
+
+def test_hits_misses_and_lru_eviction(tmp_path):
+    """
+    Мемо считает попадания/промахи и вытесняет давно не использованные записи.
+    """
+    memo = TokenMemo(str(tmp_path / "memo.db"), max_entries=10)
+    memo.put_many({f"k{i}": record(i) for i in range(10)})
+    with memo._lock:
+        memo._conn.execute("UPDATE memo SET last_used = last_used - 86400")
+        memo._conn.commit()
+
+    # k0 используется недавно и должен пережить вытеснение
+    assert memo.get_many(["k0", "missing"]) == {"k0": record(0)}
+    memo.put_many({"k10": record(10)})
+
+    stats = memo.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["evictions"] > 0
+    assert "k0" in memo.get_many(["k0"]), "Недавно использованная запись не должна вытесняться"
+    memo.close()
+
+def test_writes_skip_count_and_recent_touches(tmp_path):
+    """
+    Вставка ниже лимита не пересчитывает записи, а чтение недавно использованных записей
+    ничего не пишет в БД; давно не использованные отмечаются заново.
+    """
+    memo = TokenMemo(str(tmp_path / "memo.db"), max_entries=100)
+    statements = []
+    memo._conn.set_trace_callback(statements.append)
+
+    memo.put_many({f"k{i}": record(i) for i in range(10)})
+    memo.get_many(["k0", "k1"])
+    assert not [sql for sql in statements if "COUNT" in sql or sql.startswith("UPDATE")]
+
+    with memo._lock:
+        memo._conn.execute("UPDATE memo SET last_used = last_used - 86400 WHERE key = 'k0'")
+        memo._conn.commit()
+    statements.clear()
+    assert memo.get_many(["k0", "k1"]) == {"k0": record(0), "k1": record(1)}
+    updates = [sql for sql in statements if sql.startswith("UPDATE")]
+    assert len(updates) == 1 and "'k0'" in updates[0] and "'k1'" not in updates[0]
+    assert memo.usage()["entries"] == 10
+    memo.close()
+
+def test_concurrent_access(tmp_path):
+    """Мемо можно безопасно использовать из нескольких потоков."""
+    memo = TokenMemo(str(tmp_path / "memo.db"))
+
+    def worker(n):
+        for i in range(50):
+            memo.put_many({f"{n}-{i}": record(i)})
+            memo.get_many([f"{n}-{i}"])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert memo.stats()["hits"] == 200
+    memo.close()